@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+
+# Software Name: pyngsild
+# SPDX-FileCopyrightText: Copyright (c) 2021 Orange
+# SPDX-License-Identifier: Apache 2.0
+#
+# This software is distributed under the Apache 2.0;
+# see the NOTICE file for more details.
+#
+# Author: Fabien BATTELLO <fabien.battello@orange.com> et al.
+
+"""
+Measure the MQTT ingestion throughput of a MqttAgent, in messages per second.
+
+The broker is replaced by a stand-in : messages are injected into the MqttClient as paho's network thread would do.
+Two figures are reported :
+- callback : the rate at which the network thread hands messages over, i.e. the maximum socket read rate
+- end-to-end : the rate at which messages are processed and written to the sink
+
+Usage : python benchmarks/bench_mqtt.py [count] [batch_size]
+"""
+
+import sys
+import time
+import logging
+
+from standins import mqtt_messages, running_mqtt_agent
+
+PAYLOAD = b'{"room": 1, "temperature": 23.0, "pressure": 710}'
+
+
+def bench(count: int, batch_size: int) -> tuple[float, float]:
+    messages = mqtt_messages(count, PAYLOAD)
+    with running_mqtt_agent(lambda row: row.record, batch_size=batch_size) as (
+        agent,
+        inject,
+    ):
+        start = time.perf_counter()
+        for msg in messages:
+            inject(msg)
+        callback = time.perf_counter() - start
+    end_to_end = time.perf_counter() - start
+    assert agent.stats.input == count
+    return count / callback, count / end_to_end
+
+
+def main():
+    logging.getLogger("pyngsild").setLevel(logging.WARNING)
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    batch_size = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    callback, end_to_end = bench(count, batch_size)
+    print(f"{count} messages, batch_size={batch_size}")
+    print(f"callback   : {callback:>12,.0f} msg/s")
+    print(f"end-to-end : {end_to_end:>12,.0f} msg/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+
+# Software Name: pyngsild
+# SPDX-FileCopyrightText: Copyright (c) 2021 Orange
+# SPDX-License-Identifier: Apache 2.0
+#
+# This software is distributed under the Apache 2.0;
+# see the NOTICE file for more details.
+#
+# Author: Fabien BATTELLO <fabien.battello@orange.com> et al.
+
+"""
+Benchmark cases of the Source -> process -> Sink pipeline.
+
+Data is generated in a temporary directory before the timer is started.
+"""
+
+import gzip
+import json
+import socket
+import tempfile
+import threading
+import zipfile
+
+from functools import partial
+from pathlib import Path
+
+import pandas as pd
+
+from pyngsild.agent import Agent
+from pyngsild.agent.bg.udp import UdpServer, EOT
+from pyngsild.agent.processor import build_sample_entity
+from pyngsild.source import Source, Row
+from pyngsild.source.moresources import SourceJson, SourceXml, SourceDataFrame
+from pyngsild.sink import SinkNull, SinkFile, SinkFileGzipped
+from pyngsild.sink.ngsi import SinkNgsi, SinkNgsiAsync
+from pyngsild.utils.mockbroker import MockBroker
+
+from harness import case, Timer
+from standins import mqtt_messages, running_mqtt_agent
+
+
+def lines(n: int) -> list[str]:
+    return [f"Room{i % 100};{20 + i % 10}.5;{700 + i % 50}" for i in range(n)]
+
+
+def records(n: int) -> list[dict]:
+    return [
+        {
+            "room": f"Room{i % 100}",
+            "temperature": 20.5 + i % 10,
+            "pressure": 700 + i % 50,
+        }
+        for i in range(n)
+    ]
+
+
+def entities(n: int) -> list[str]:
+    return [build_sample_entity(Row(line)).to_json() for line in lines(n)]
+
+
+def tmpdir() -> Path:
+    return Path(tempfile.mkdtemp(prefix="pyngsild-bench-"))
+
+
+def consume(src: Source, timer: Timer) -> int:
+    """iterate over a source, the timer being already started"""
+    count = 0
+    for _ in src:
+        timer.tick()
+        count += 1
+    timer.stop()
+    return count
+
+
+# Sources
+
+
+def _from_file(filename: Path, timer: Timer) -> int:
+    timer.start()
+    src = Source.from_file(str(filename))
+    count = consume(src, timer)
+    src.close()
+    return count
+
+
+@case("source_text", rows=500_000)
+def source_text(n: int, timer: Timer) -> int:
+    filename = tmpdir() / "rooms.csv"
+    filename.write_text("\n".join(lines(n)) + "\n")
+    return _from_file(filename, timer)
+
+
+@case("source_gz", rows=500_000)
+def source_gz(n: int, timer: Timer) -> int:
+    filename = tmpdir() / "rooms.csv.gz"
+    with gzip.open(filename, "wt") as f:
+        f.write("\n".join(lines(n)) + "\n")
+    return _from_file(filename, timer)
+
+
+@case("source_zip", rows=500_000)
+def source_zip(n: int, timer: Timer) -> int:
+    filename = tmpdir() / "rooms.csv.zip"
+    with zipfile.ZipFile(filename, "w", zipfile.ZIP_DEFLATED) as z:
+        z.writestr("rooms.csv", "\n".join(lines(n)) + "\n")
+    return _from_file(filename, timer)
+
+
+def _source_json(n: int, timer: Timer) -> int:
+    content = json.dumps(records(n))
+    timer.start()  # parsing is part of the measure
+    return consume(SourceJson(content), timer)
+
+
+def _source_xml(n: int, timer: Timer) -> int:
+    items = "".join(
+        f"<room><name>{r['room']}</name><temperature>{r['temperature']}</temperature>"
+        f"<pressure>{r['pressure']}</pressure></room>"
+        for r in records(n)
+    )
+    content = f"<rooms>{items}</rooms>"
+    timer.start()
+    return consume(SourceXml(content, path="rooms.room"), timer)
+
+
+for _size in (1_000, 10_000, 100_000):
+    case(f"source_json_{_size // 1000}k", rows=_size)(_source_json)
+    case(f"source_xml_{_size // 1000}k", rows=_size)(_source_xml)
+
+
+@case("source_dataframe", rows=200_000)
+def source_dataframe(n: int, timer: Timer) -> int:
+    df = pd.DataFrame(records(n))
+    timer.start()
+    return consume(SourceDataFrame(df), timer)
+
+
+# Agent
+
+
+@case("agent_sample", rows=50_000)
+def agent_sample(n: int, timer: Timer) -> int:
+    src = Source([Row(line) for line in lines(n)])
+    agent = Agent(src, SinkNull(), build_sample_entity, on_entity=timer.tick)
+    timer.start()
+    agent.run()
+    timer.stop()
+    return agent.stats.output
+
+
+# Sinks
+
+
+def _sink(sink, n: int, timer: Timer) -> int:
+    msgs = entities(n)
+    timer.start()
+    for msg in msgs:
+        sink.write(msg)
+        timer.tick()
+    sink.close()
+    timer.stop()
+    return n
+
+
+@case("sink_file", rows=200_000)
+def sink_file(n: int, timer: Timer) -> int:
+    return _sink(SinkFile(tmpdir() / "entities.jsonl"), n, timer)
+
+
+@case("sink_file_gzipped", rows=200_000)
+def sink_file_gzipped(n: int, timer: Timer) -> int:
+    return _sink(SinkFileGzipped(tmpdir() / "entities.jsonl.gz"), n, timer)
+
+
+def _sink_ngsi(n: int, timer: Timer, sink_factory, **kwargs) -> int:
+    items = [build_sample_entity(Row(line)) for line in lines(n)]
+    with MockBroker(**kwargs) as broker:
+        sink = sink_factory(broker.host, broker.port)
+        timer.start()
+        for entity in items:
+            sink.write(entity)
+            timer.tick()
+        sink.close()
+        timer.stop()
+        return broker.stats.entities
+
+
+@case("sink_ngsi", rows=2_000)
+def sink_ngsi(n: int, timer: Timer) -> int:
+    return _sink_ngsi(n, timer, SinkNgsi)
+
+
+@case("sink_ngsi_batch", rows=50_000)
+def sink_ngsi_batch(n: int, timer: Timer) -> int:
+    return _sink_ngsi(n, timer, partial(SinkNgsi, batch_size=100))
+
+
+@case("sink_ngsi_async", rows=2_000)
+def sink_ngsi_async(n: int, timer: Timer) -> int:
+    # the broker takes 5ms per request, hidden by concurrent upserts (10 is the size of the connection pool)
+    return _sink_ngsi(n, timer, partial(SinkNgsiAsync, workers=10), latency=0.005)
+
+
+# Daemons
+
+
+@case("mqtt_agent", rows=100_000)
+def mqtt_agent(n: int, timer: Timer) -> int:
+    messages = mqtt_messages(n, json.dumps(records(1)[0]).encode())
+    with running_mqtt_agent(timer.tick) as (agent, inject):
+        timer.start()
+        for msg in messages:
+            inject(msg)
+    timer.stop()
+    return agent.stats.input
+
+
+@case("udp_server", rows=50_000)
+def udp_server(n: int, timer: Timer) -> int:
+    server = UdpServer(
+        port=0,
+        sink=SinkNull(),
+        process=timer.tick,
+        batch_size=1000,
+        rcvbuf=8 * 1024 * 1024,
+    )
+    sock = server._bind()
+    port = sock.getsockname()[1]
+    thread = threading.Thread(target=server.loop, args=[sock])
+    payloads = [line.encode() for line in lines(n)]
+    timer.start()
+    thread.start()
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sender:
+        for payload in payloads:
+            sender.sendto(payload, ("127.0.0.1", port))
+        sender.sendto(EOT, ("127.0.0.1", port))
+    thread.join(60)
+    timer.stop()
+    if thread.is_alive():  # the EOT datagram has been lost
+        server.close()
+        thread.join()
+    return server.stats.input
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+
+# Software Name: pyngsild
+# SPDX-FileCopyrightText: Copyright (c) 2021 Orange
+# SPDX-License-Identifier: Apache 2.0
+#
+# This software is distributed under the Apache 2.0;
+# see the NOTICE file for more details.
+#
+# Author: Fabien BATTELLO <fabien.battello@orange.com> et al.
+
+"""
+Benchmark harness : case registry, per-row timer, isolated runs and baselines.
+
+A case is a function taking the number of rows and a Timer.
+It prepares its data, starts the timer, ticks once per row delivered (or written), stops the timer
+and returns the number of rows actually handled.
+Each run is executed in a fresh interpreter, so that the peak RSS reported is the one of the case only.
+"""
+
+import json
+import logging
+import resource
+import multiprocessing
+
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, asdict
+from time import perf_counter
+from typing import Callable, Dict, List
+
+Case = Callable[[int, "Timer"], int]
+
+CASES: Dict[str, tuple[Case, int]] = {}  # name => (function, default number of rows)
+
+
+def case(name: str, rows: int):
+    """register a benchmark case"""
+
+    def register(func: Case) -> Case:
+        CASES[name] = (func, rows)
+        return func
+
+    return register
+
+
+class Timer:
+    """Record the time elapsed between two successive ticks."""
+
+    def __init__(self):
+        self.samples = array("d")
+        self.started: float = None
+        self.stopped: float = None
+        self._last: float = None
+
+    def start(self):
+        self.started = self._last = perf_counter()
+
+    def tick(self, *args):
+        """*args allows to use tick() as a hook or a processor"""
+        now = perf_counter()
+        self.samples.append(now - self._last)
+        self._last = now
+
+    def stop(self):
+        self.stopped = perf_counter()
+
+    @property
+    def elapsed(self) -> float:
+        return self.stopped - self.started
+
+
+def percentile(sorted_samples: array, q: float) -> float:
+    """nearest-rank percentile"""
+    if not sorted_samples:
+        return float("nan")
+    return sorted_samples[min(len(sorted_samples) - 1, int(q * len(sorted_samples)))]
+
+
+@dataclass
+class Result:
+    name: str
+    rows: int
+    seconds: float
+    p50: float  # latency per row, in seconds
+    p95: float
+    p99: float
+    peak_rss: int  # bytes
+
+    @property
+    def rate(self) -> float:
+        return self.rows / self.seconds if self.seconds else 0.0
+
+
+def _run(name: str, rows: int) -> Result:
+    # executed in a fresh interpreter
+    import cases  # noqa: F401, registers the cases
+
+    logging.disable(logging.INFO)  # the libraries log every request
+    func, _ = CASES[name]
+    timer = Timer()
+    count = func(rows, timer)
+    samples = array("d", sorted(timer.samples))
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024  # KiB on Linux
+    return Result(
+        name,
+        count,
+        timer.elapsed,
+        percentile(samples, 0.5),
+        percentile(samples, 0.95),
+        percentile(samples, 0.99),
+        peak_rss,
+    )
+
+
+def run(name: str, rows: int, repeat: int = 1) -> Result:
+    """run a case repeat times, each time in a new process, and keep the fastest run"""
+    results: List[Result] = []
+    context = multiprocessing.get_context("spawn")
+    for _ in range(repeat):
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            results.append(pool.submit(_run, name, rows).result())
+    return max(results, key=lambda r: r.rate)
+
+
+def load_baseline(filename: str) -> Dict[str, dict]:
+    try:
+        with open(filename, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_baseline(
+    filename: str, results: List[Result], baseline: Dict[str, dict] = None
+):
+    """merge results into the baseline file, so that a partial run does not erase the other cases"""
+    baseline = dict(baseline or {})
+    baseline.update({r.name: {**asdict(r), "rate": r.rate} for r in results})
+    with open(filename, "w", encoding="utf-8") as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def regression(result: Result, baseline: Dict[str, dict], tolerance: float) -> float:
+    """return the relative slowdown against the baseline if above tolerance, else 0"""
+    reference = baseline.get(result.name)
+    if not reference or not reference.get("rate"):
+        return 0.0
+    slowdown = 1 - result.rate / reference["rate"]
+    return slowdown if slowdown > tolerance else 0.0
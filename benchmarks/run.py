@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+
+# Software Name: pyngsild
+# SPDX-FileCopyrightText: Copyright (c) 2021 Orange
+# SPDX-License-Identifier: Apache 2.0
+#
+# This software is distributed under the Apache 2.0;
+# see the NOTICE file for more details.
+#
+# Author: Fabien BATTELLO <fabien.battello@orange.com> et al.
+
+"""
+Run the benchmark suite of the Source -> process -> Sink pipeline.
+
+For each case, report the throughput (rows/s), the percentiles of the time spent per row, and the peak RSS.
+Results are compared to a baseline : the exit status is 1 if a case has slowed down by more than the tolerance.
+Baselines depend on the machine, record one with --save on the machine used for comparison.
+
+Usage :
+    python benchmarks/run.py                      # run all the cases
+    python benchmarks/run.py -k source_ -k sink_  # only cases whose name contains source_ or sink_
+    python benchmarks/run.py --scale 0.1          # 10 times fewer rows, for a quick check
+    python benchmarks/run.py --save               # record the results as the new baseline
+"""
+
+import sys
+import argparse
+
+from pathlib import Path
+
+import cases  # noqa: F401, registers the cases
+
+from harness import CASES, run, load_baseline, save_baseline, regression
+
+DEFAULT_BASELINE = Path(__file__).parent / "baseline.json"
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="pyngsild benchmark suite")
+    parser.add_argument(
+        "-k",
+        dest="patterns",
+        action="append",
+        help="only run cases whose name contains PATTERN",
+    )
+    parser.add_argument(
+        "--scale",
+        type=float,
+        default=1.0,
+        help="multiply the number of rows of each case",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=3,
+        help="number of runs per case, the fastest is kept",
+    )
+    parser.add_argument(
+        "--baseline", default=str(DEFAULT_BASELINE), help="baseline file"
+    )
+    parser.add_argument(
+        "--save", action="store_true", help="save the results into the baseline file"
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.15,
+        help="accepted slowdown, by default 15%%",
+    )
+    parser.add_argument("--list", action="store_true", help="list the cases")
+    args = parser.parse_args()
+
+    names = [
+        name
+        for name in CASES
+        if not args.patterns or any(p in name for p in args.patterns)
+    ]
+    if args.list:
+        print("\n".join(f"{name} ({CASES[name][1]} rows)" for name in names))
+        return 0
+
+    baseline = load_baseline(args.baseline)
+    results = []
+    regressions = 0
+    print(
+        f"{'case':<20}{'rows':>10}{'rows/s':>14}{'p50 µs':>10}{'p95 µs':>10}{'p99 µs':>10}{'RSS MiB':>10}  baseline"
+    )
+    for name in names:
+        rows = max(1, int(CASES[name][1] * args.scale))
+        result = run(name, rows, args.repeat)
+        results.append(result)
+        reference = baseline.get(name)
+        if reference is None:
+            compared = "-"
+        else:
+            compared = f"{result.rate / reference['rate'] - 1:+.1%}"
+            if regression(result, baseline, args.tolerance):
+                compared += " REGRESSION"
+                regressions += 1
+        print(
+            f"{name:<20}{result.rows:>10}{result.rate:>14,.0f}"
+            f"{result.p50 * 1e6:>10.1f}{result.p95 * 1e6:>10.1f}{result.p99 * 1e6:>10.1f}"
+            f"{result.peak_rss / 2**20:>10.0f}  {compared}",
+            flush=True,
+        )
+
+    if args.save:
+        save_baseline(args.baseline, results, baseline)
+        print(f"baseline saved to {args.baseline}")
+    return 1 if regressions and not args.save else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+
+# Software Name: pyngsild
+# SPDX-FileCopyrightText: Copyright (c) 2021 Orange
+# SPDX-License-Identifier: Apache 2.0
+#
+# This software is distributed under the Apache 2.0;
+# see the NOTICE file for more details.
+#
+# Author: Fabien BATTELLO <fabien.battello@orange.com> et al.
+
+"""
+Local stand-ins for the external services the agents talk to, so that benchmarks need no network.
+
+The Context Broker stand-in is pyngsild.utils.mockbroker.
+"""
+
+import threading
+
+from contextlib import contextmanager
+from functools import partial
+from typing import Callable
+from unittest.mock import patch
+
+from paho.mqtt.client import MQTTMessage
+
+from pyngsild.agent.bg.mqtt import MqttAgent
+from pyngsild.source import ROW_NOT_SET as QUEUE_EOT
+from pyngsild.sink import SinkNull
+
+
+@contextmanager
+def stub_mqtt():
+    """prevent paho from connecting : messages are then injected as its network thread would do"""
+    with patch("paho.mqtt.client.Client.connect"), patch(
+        "paho.mqtt.client.Client.loop_start"
+    ), patch("paho.mqtt.client.Client.loop_stop"), patch(
+        "paho.mqtt.client.Client.disconnect"
+    ):
+        yield
+
+
+def mqtt_messages(
+    n: int, payload: bytes, topic: bytes = b"sensor/temperature"
+) -> list[MQTTMessage]:
+    messages = []
+    for i in range(n):
+        msg = MQTTMessage(mid=i, topic=topic)
+        msg.payload = payload
+        messages.append(msg)
+    return messages
+
+
+@contextmanager
+def running_mqtt_agent(process: Callable, batch_size: int = 1000, linger: float = 0.01):
+    """yield a MqttAgent whose worker is running, and a function injecting a message as paho's network thread
+    would do ; on exit, wait for all the messages injected to be processed"""
+    with stub_mqtt():
+        agent = MqttAgent(
+            SinkNull(), process=process, batch_size=batch_size, linger=linger
+        )
+        mqttc = agent._clients[0]
+        worker = threading.Thread(target=agent._loop)
+        worker.start()
+        try:
+            yield agent, partial(mqttc._on_message, mqttc._client, None)
+        finally:
+            agent._queue.put(QUEUE_EOT)
+            worker.join()
@@ -11,20 +11,39 @@
 
 __version__ = "0.1.2"
 
-from .source import Row, Source, SourceStream, SourceStdin, SourceSingle, SourceMany
+from .source import (
+    Row,
+    Source,
+    SourceStream,
+    SourceStdin,
+    SourceSingle,
+    SourceMany,
+    AsyncSource,
+)
 from .source.moresources import (
     SourceSample,
     SourceDict,
     SourceJson,
+    SourceJsonStream,
+    SourceNdjson,
     SourceApi,
     SourceXml,
+    SourceXmlStream,
     SourceMicrosoftExcel,
     SourceFunc,
     SourceDataFrame,
 )
-from .sink import SinkException, Sink, SinkFile, SinkFileGzipped, SinkStdout, SinkNull
-from .sink.ngsi import SinkNgsi
-from .agent import Agent
+from .sink import (
+    SinkException,
+    Sink,
+    AsyncSink,
+    SinkFile,
+    SinkFileGzipped,
+    SinkStdout,
+    SinkNull,
+)
+from .sink.ngsi import SinkNgsi, AsyncSinkNgsi
+from .agent import Agent, AsyncAgent
 from .agent.stats import Stats
 from .agent.bg import Status
 
@@ -35,22 +54,29 @@ __all__ = [
     "SourceStdin",
     "SourceSingle",
     "SourceMany",
+    "AsyncSource",
     "SourceSample",
     "SourceDict",
     "SourceJson",
+    "SourceJsonStream",
+    "SourceNdjson",
     "SourceApi",
     "SourceXml",
+    "SourceXmlStream",
     "SourceMicrosoftExcel",
     "SourceFunc",
     "SourceDataFrame",
     "SinkException",
     "Sink",
+    "AsyncSink",
     "SinkFile",
     "SinkFileGzipped",
     "SinkStdout",
     "SinkNull",
     "SinkNgsi",
+    "AsyncSinkNgsi",
     "Agent",
+    "AsyncAgent",
     "Stats",
     "Status",
 ]
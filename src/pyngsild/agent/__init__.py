@@ -9,15 +9,28 @@
 #
 # Author: Fabien BATTELLO <fabien.battello@orange.com> et al.
 
+import asyncio
+import inspect
 import logging
 
-from typing import Callable
+from collections import deque
+from time import perf_counter
+from concurrent.futures import (
+    ThreadPoolExecutor,
+    ProcessPoolExecutor,
+    Future,
+    wait,
+    FIRST_COMPLETED,
+)
+from typing import Any, Callable, Deque, Dict, List, Literal, Sequence, Tuple
 from abc import ABCMeta, abstractmethod
+from more_itertools import chunked
 
-from .stats import Stats
-from ..source import Source, Row
-from ..sink import Sink, SinkStdout
-from ..sink.ngsi import SinkNgsi, SinkNgsiAsync
+from .stats import Stats, Timings
+from ..source import Source, AsyncSource, Row
+from ..sink import Sink, AsyncSink, SinkStdout, settle
+from ..sink.ngsi import SinkNgsi, SinkNgsiAsync, AsyncSinkNgsi
+from ..utils.metrics import AgentMetrics
 from ngsildclient import Entity
 
 logger = logging.getLogger(__name__)
@@ -43,39 +56,371 @@ class BaseAgent(metaclass=ABCMeta):
         pass  # free resources if needed
 
 
+def _process_chunk(process: Callable, rows: List[Row]) -> List[Tuple[bool, Any, float]]:
+    """process a chunk of rows in a worker, returning for each row (True, entity) or (False, error message),
+    along with the time spent"""
+    results = []
+    for row in rows:
+        t0 = perf_counter()
+        try:
+            results.append((True, process(row), perf_counter() - t0))
+        except Exception as e:
+            results.append((False, str(e), perf_counter() - t0))
+    return results
+
+
 class Agent(BaseAgent):
+    """An Agent iterates over a Source, processes each Row and writes the resulting entity to the Sink.
+
+    By default rows are processed one at a time in the calling thread.
+    When workers is greater than 1, process() is fanned out over a pool of threads or processes.
+    Rows are sent to the workers by chunks to amortize the cost of dispatching (and pickling) them.
+    Entities are written to the Sink by the calling thread only, in the source order unless ordered is unset.
+    When using a process pool, the processor function and the rows must be picklable.
+
+    The processor may return a list of entities, i.e. a vectorised processor that handles a chunk of records
+    delivered as a single Row (see SourceDataFrame). Each entity is then counted and written on its own :
+    a processor returning a list is no longer given a single write of the whole list, an empty list counts
+    as a filtered row, and a None item as a filtered entity.
+
+    The time spent reading the source, processing and writing to the sink is always measured.
+    The cumulative time of each stage is available in timings, and one row out of metrics.sample is observed
+    in the stage histograms of metrics, from which percentiles are estimated (see profile()).
+    Both can be read from another thread while the agent is running.
+    In parallel mode, the source stage is measured per chunk, hence is not observed in the histograms.
+
+    Hooks let a profiler or a tracer follow the pipeline :
+    on_row(row) is called for each row read from the source, on_entity(row, entity) for each entity written
+    to the sink, on_error(row, exception) for each row that failed, and on_batch(stats, timings) once the
+    run is over. The time spent in hooks is accounted to the stage that calls them.
+    """
+
     def __init__(
         self,
         src: Source,
         sink: Sink = SinkStdout(),
         process: Callable = lambda row: row.record,
         side_effect: Callable[[Row, Sink, Entity], int] = None,
+        *,
+        workers: int = 1,
+        executor: Literal["thread", "process"] = "thread",
+        ordered: bool = True,
+        chunksize: int = 64,
+        metrics: AgentMetrics = None,
+        on_row: Callable[[Row], Any] = None,
+        on_entity: Callable[[Row, Any], Any] = None,
+        on_error: Callable[[Row, Exception], Any] = None,
+        on_batch: Callable[[Stats, Timings], Any] = None,
     ):
         self.src = src
+        self.metrics = metrics if metrics is not None else AgentMetrics()
+        self.timings = Timings()
+        self.workers = workers
+        self.executor = executor
+        self.ordered = ordered
+        self.chunksize = chunksize
+        self.on_row = on_row
+        self.on_entity = on_entity
+        self.on_error = on_error
+        self.on_batch = on_batch
         super().__init__(sink, process, side_effect)
 
     def run(self):
         logger.info("start to acquire data")
+        self.sink.bind(self.stats)
+        if self.workers > 1:
+            self._run_parallel()
+        else:
+            self._run_sequential()
+        try:
+            self.sink.flush()
+        except Exception as e:
+            logger.error(f"Cannot flush sink : {e}")
+        settle(
+            self.stats
+        )  # entities written by this agent that have failed once flushed
+        self.metrics.batch_rows.observe(self.stats.input)
+        if self.on_batch is not None:
+            self.on_batch(self.stats, self.timings)
+        self.close()
+
+    def profile(
+        self, quantiles: Sequence[float] = (0.5, 0.9, 0.99)
+    ) -> Dict[str, Dict[str, float]]:
+        """return for each stage the cumulative time and the estimated percentiles of the time spent per row,
+        i.e. {"source": {"total": 0.12, "count": 625, "p50": 1.2e-05, ...}, "process": ..., "sink": ...}
+        count is the number of rows observed in the histograms, that may be shared with other agents"""
+        histogram = self.metrics.stage_duration
+        profile = {}
+        for stage in ("source", "process", "sink"):
+            profile[stage] = {
+                "total": getattr(self.timings, stage),
+                "count": histogram.count(stage),
+            }
+            for q in quantiles:
+                profile[stage][f"p{q * 100:g}"] = histogram.quantile(q, stage)
+        return profile
+
+    def _run_sequential(self):
+        stats, timings = self.stats, self.timings
+        observe, sample = self.metrics.stage_duration.observe, self.metrics.sample
+        on_row = self.on_row
+        countdown = self.metrics.countdown
+        tick = perf_counter()
         for row in self.src:
+            stats.input += 1
+            if on_row is not None and not self._on_row(row):
+                timings.source += perf_counter() - tick
+                tick = perf_counter()
+                continue
+            t1 = perf_counter()
+            source = t1 - tick
+            timings.source += source
+            t2 = None
+            try:
+                e: Entity = self.process(row)
+                t2 = perf_counter()
+                self._output(row, e)
+            except Exception as e:
+                self._error(row, e)
+            tick = perf_counter()
+            if t2 is None:  # process() has failed
+                timings.process += tick - t1
+                continue
+            timings.process += t2 - t1
+            timings.sink += tick - t2
+            countdown -= 1
+            if not countdown:
+                countdown = sample
+                observe(source, "source")
+                observe(t2 - t1, "process")
+                observe(tick - t2, "sink")
+        self.metrics.countdown = countdown
+
+    def _run_parallel(self):
+        poolclass = (
+            ProcessPoolExecutor if self.executor == "process" else ThreadPoolExecutor
+        )
+        max_pending = self.workers * 2  # chunks submitted but not yet written
+        with poolclass(max_workers=self.workers) as pool:
+            pending: Deque[Tuple[List[Row], Future]] = deque()
+            tick = perf_counter()
+            for rows in chunked(self.src, self.chunksize):
+                self.stats.input += len(rows)
+                if self.on_row is not None:
+                    rows = [row for row in rows if self._on_row(row)]
+                self.timings.source += perf_counter() - tick
+                if not rows:
+                    tick = perf_counter()
+                    continue
+                pending.append((rows, pool.submit(_process_chunk, self.process, rows)))
+                while len(pending) >= max_pending:
+                    self._collect(pending, drain=False)
+                tick = perf_counter()
+            while pending:
+                self._collect(pending, drain=True)
+
+    def _collect(self, pending: Deque[Tuple[List[Row], Future]], drain: bool):
+        """write the results of completed chunks, the oldest first when ordered"""
+        if self.ordered or drain:
+            done = [pending.popleft()]
+        else:
+            futures = [future for _, future in pending]
+            completed, _ = wait(futures, return_when=FIRST_COMPLETED)
+            done = [x for x in pending if x[1] in completed]
+            for x in done:
+                pending.remove(x)
+        observe, sample = self.metrics.stage_duration.observe, self.metrics.sample
+        for rows, future in done:
+            try:
+                results = future.result()
+            except Exception as e:
+                logger.error(f"Cannot process chunk of {len(rows)} records : {e}")
+                for row in rows:
+                    self._error(row, e, log=False)
+                continue
+            for row, (success, result, elapsed) in zip(rows, results):
+                self.timings.process += elapsed
+                t0 = perf_counter()
+                try:
+                    if not success:
+                        raise Exception(result)
+                    self._output(row, result)
+                except Exception as e:
+                    self._error(row, e)
+                t1 = perf_counter()
+                self.timings.sink += t1 - t0
+                self.metrics.countdown -= 1
+                if not self.metrics.countdown:
+                    self.metrics.countdown = sample
+                    observe(elapsed, "process")
+                    observe(t1 - t0, "sink")
+
+    def _on_row(self, row: Row) -> bool:
+        """call the on_row hook, a row whose hook fails is counted as an error and skipped"""
+        try:
+            self.on_row(row)
+        except Exception as e:
+            logger.error(f"Cannot apply on_row hook : {e}")
+            self._error(row, e, log=False)
+            return False
+        return True
+
+    def _error(self, row: Row, e: Exception, log: bool = True):
+        self.stats.error += 1
+        if log:
+            logger.error(f"Cannot process record : {e}")
+        if self.on_error is not None:
+            self.on_error(row, e)
+
+    def _output(self, row: Row, e: Entity | List[Entity]):
+        if isinstance(e, list):
+            if not e:  # nothing to write, as if filtered
+                self.stats.filtered += 1
+            for x in e:
+                self._output(row, x)
+            return
+        if e is None:
+            self.stats.filtered += 1
+            return
+        self.stats.processed += 1
+        if isinstance(self.sink, (SinkNgsi, SinkNgsiAsync)):
+            self.sink.write(e)
+        else:
+            msg = e.to_json() if isinstance(e, Entity) else e
+            self.sink.write(msg)
+        self.stats.output += 1
+        if self.on_entity is not None:
+            self.on_entity(row, e)
+        if self.side_effect:
+            side_entities = self.side_effect(row, self.sink, e)
+            self.stats.side_entities += side_entities
+
+
+class AsyncAgent(BaseAgent):
+    """An AsyncAgent is an Agent driven by an event loop.
+
+    It iterates over an AsyncSource (or a Source), processes each Row and writes the resulting entities to an
+    AsyncSink without waiting for the sink to complete : up to concurrency writes are kept in flight.
+    When batch_size is greater than 1, entities are grouped and sent thanks to the write_many() method of the sink.
+    A synchronous Sink is also accepted, in which case writes are sequential.
+
+    As for Agent, on_entity(row, entity) is called for each entity written to the sink and on_error(row, exception)
+    for each row that failed.
+    """
+
+    def __init__(
+        self,
+        src: AsyncSource | Source,
+        sink: AsyncSink | Sink = SinkStdout(),
+        process: Callable = lambda row: row.record,
+        side_effect: Callable[[Row, Sink, Entity], int] = None,
+        *,
+        concurrency: int = 100,
+        batch_size: int = 1,
+        on_entity: Callable[[Row, Any], Any] = None,
+        on_error: Callable[[Row, Exception], Any] = None,
+    ):
+        self.src = src if isinstance(src, AsyncSource) else AsyncSource.from_source(src)
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.on_entity = on_entity
+        self.on_error = on_error
+        super().__init__(sink, process, side_effect)
+
+    async def run(self):
+        logger.info("start to acquire data")
+        self.sink.bind(self.stats)
+        self._slots = asyncio.Semaphore(self.concurrency)
+        self._tasks = set()
+        batch: List[Tuple[Row, Any]] = []
+        async for row in self.src:
             logger.debug(row)
             try:
-                logger.debug(f"{row.provider=}\t{row.record=}")
                 self.stats.input += 1
-                e: Entity = self.process(row)
-                if e is None:
+                e: Entity | List[Entity] = self.process(row)
+                if isinstance(e, list) and not e:  # nothing to write, as if filtered
                     self.stats.filtered += 1
-                    continue
-                self.stats.processed += 1
-                if isinstance(self.sink, (SinkNgsi, SinkNgsiAsync)):
-                    self.sink.write(e)
-                else:
-                    msg = e.to_json() if isinstance(e, Entity) else e
-                    self.sink.write(msg)
-                self.stats.output += 1
-                if self.side_effect:
-                    side_entities = self.side_effect(row, self.sink, e)
-                    self.stats.side_entities += side_entities
+                for x in e if isinstance(e, list) else [e]:
+                    if x is None:
+                        self.stats.filtered += 1
+                        continue
+                    self.stats.processed += 1
+                    batch.append((row, x))
+                    if len(batch) >= self.batch_size:
+                        await self._spawn(batch)
+                        batch = []
             except Exception as e:
                 self.stats.error += 1
                 logger.error(f"Cannot process record : {e}")
+                if self.on_error is not None:
+                    self.on_error(row, e)
+        if batch:
+            await self._spawn(batch)
+        if self._tasks:
+            await asyncio.wait(self._tasks)
+        try:
+            await self._call(self.sink.flush)
+        except Exception as e:
+            logger.error(f"Cannot flush sink : {e}")
+        settle(self.stats)
         self.close()
+
+    async def _spawn(self, batch: List[Tuple[Row, Any]]):
+        if not isinstance(self.sink, AsyncSink):
+            await self._write(batch)
+            return
+        await self._slots.acquire()
+        task = asyncio.create_task(self._write(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._done)
+
+    def _done(self, task: asyncio.Task):
+        self._tasks.discard(task)
+        self._slots.release()
+
+    async def _write(self, batch: List[Tuple[Row, Any]]):
+        msgs = [self._message(e) for _, e in batch]
+        try:
+            if len(msgs) == 1:
+                await self._call(self.sink.write, msgs[0])
+            elif isinstance(self.sink, AsyncSink):
+                await self.sink.write_many(msgs)
+            else:
+                for msg in msgs:
+                    self.sink.write(msg)
+        except Exception as e:
+            self.stats.error += len(msgs)
+            logger.error(f"Cannot write {len(msgs)} records : {e}")
+            if self.on_error is not None:
+                for row, _ in batch:
+                    self.on_error(row, e)
+            return
+        self.stats.output += len(msgs)
+        if self.on_entity is not None:
+            for row, e in batch:
+                self.on_entity(row, e)
+        if self.side_effect:
+            for row, e in batch:
+                try:
+                    side_entities = await self._call(
+                        self.side_effect, row, self.sink, e
+                    )
+                    self.stats.side_entities += side_entities
+                except Exception as err:  # as in Agent, the row is counted as an error
+                    self.stats.error += 1
+                    logger.error(f"Cannot apply side effect : {err}")
+                    if self.on_error is not None:
+                        self.on_error(row, err)
+
+    def _message(self, e: Any):
+        if isinstance(self.sink, (SinkNgsi, SinkNgsiAsync, AsyncSinkNgsi)):
+            return e
+        return e.to_json() if isinstance(e, Entity) else e
+
+    async def _call(self, func: Callable, *args):
+        """call a function that may be a coroutine function"""
+        result = func(*args)
+        if inspect.isawaitable(result):
+            result = await result
+        return result
@@ -9,6 +9,7 @@
 #
 # Author: Fabien BATTELLO <fabien.battello@orange.com> et al.
 
+import asyncio
 import threading
 import anyio
 import uvicorn
@@ -16,20 +17,22 @@ import logging
 import time
 import sys
 
+from concurrent.futures import ThreadPoolExecutor
 from fastapi import FastAPI, File, UploadFile
-from typing import Callable, Any
+from fastapi.responses import PlainTextResponse
+from typing import Callable, Any, List
 from abc import ABCMeta, abstractmethod
 from dataclasses import dataclass, asdict
 from enum import Enum
 from datetime import datetime
-from anyio import Lock
 from uvicorn import server
 from uvicorn.config import LoopSetupType
 
 from pyngsild import __version__
-from pyngsild.agent import BaseAgent, Agent
+from pyngsild.agent import BaseAgent, Agent, AsyncAgent
 from pyngsild.source import Source, Row
-from pyngsild.sink import Sink, SinkStdout
+from pyngsild.sink import Sink, AsyncSink, SinkStdout
+from pyngsild.utils.metrics import AgentMetrics, Metric, Counter, Gauge, render
 
 logger = logging.getLogger(__name__)
 
@@ -49,47 +52,145 @@ class Status:
     calls: int = 0
     success: int = 0
     errors: int = 0
+    dropped: int = 0
+    pending: int = 0  # agent runs waiting for a worker
+    running: int = 0
 
 
 class Daemon(BaseAgent):
+    """A Daemon runs an agent each time data is received.
+
+    Agents are run by a pool of workers threads, so that the event loop of the daemon is never blocked by a sink.
+    The number of concurrent agent runs is bounded by workers, the number of runs waiting for a worker is
+    reported in the status (pending).
+    When the sink is an AsyncSink, agents run natively on the event loop.
+
+    collect() returns the metrics of the daemon : the counters, the queue depth, the latency of each stage
+    of the pipeline and the metrics of the sink.
+    """
+
     def __init__(
         self,
         sink: Sink = SinkStdout(),
         process: Callable[[Row], Any] = lambda row: row.record,
+        *,
+        workers: int = 1,
     ):
         super().__init__(sink, process)
         self.status = Status()
+        self.workers = workers
+        self.metrics = AgentMetrics()
+        self._lock = (
+            threading.Lock()
+        )  # guards status and stats, updated from many threads
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="pyngsild-daemon"
+        )
 
     @classmethod
     def from_agent():
         pass
 
     async def trigger(
-        self, src: Source
+        self, src: Source, process: Callable[[Row], Any] = None, **hooks
     ):  # a Daemon server will have to create a source then call this method
-        logger.info(f"{src=}")
+        """run an agent over src, hooks (on_entity, on_error) are given to the agent"""
+        logger.debug(f"{src=}")
         try:
-            agent = Agent(src, self.sink, self.process)
-            agent.run()
-            agent.close()
+            if isinstance(self.sink, AsyncSink):
+                agent = AsyncAgent(src, self.sink, process or self.process, **hooks)
+                await agent.run()
+            else:
+                with self._lock:
+                    self.status.pending += 1
+                try:
+                    future = self._executor.submit(
+                        self._run_agent, src, process or self.process, **hooks
+                    )
+                except Exception:  # the executor has been shut down
+                    with self._lock:
+                        self.status.pending -= 1
+                    raise
+                agent = await asyncio.wrap_future(future)
         except Exception as e:
-            logger.error("Error while running agent", e)
-            lock = Lock()
-            async with lock:
+            logger.error(f"Error while running agent : {e}")
+            with self._lock:
                 self.status.errors += 1
             return None
-        lock = Lock()
-        async with lock:
+        with self._lock:
             self.status.success += 1
             self.stats += agent.stats
         return agent.stats
 
+    def _run_agent(self, src: Source, process: Callable[[Row], Any], **hooks) -> Agent:
+        # runs in a worker thread
+        with self._lock:
+            self.status.pending -= 1
+            self.status.running += 1
+        try:
+            agent = Agent(src, self.sink, process, metrics=self.metrics, **hooks)
+            agent.run()
+            agent.close()
+        finally:
+            with self._lock:
+                self.status.running -= 1
+        return agent
+
+    def _shutdown_executor(self):
+        """wait for the agent runs in progress then free the workers, the daemon must not receive data anymore"""
+        self._executor.shutdown(wait=True)
+
+    def queue_depth(self) -> int:
+        """return the number of data received but not processed yet"""
+        return self.status.pending
+
+    def collect(self) -> List[Metric]:
+        stats = asdict(self.stats)
+        status = self.status
+        return [
+            Counter(
+                "pyngsild_rows_total",
+                "Number of rows by outcome",
+                {(("outcome", k),): v for k, v in stats.items()},
+            ),
+            Counter("pyngsild_calls_total", "Number of data receptions", status.calls),
+            Counter(
+                "pyngsild_runs_total",
+                "Number of agent runs by result",
+                {
+                    (("result", "success"),): status.success,
+                    (("result", "error"),): status.errors,
+                },
+            ),
+            Counter(
+                "pyngsild_dropped_total",
+                "Number of data dropped before processing",
+                status.dropped,
+            ),
+            Gauge(
+                "pyngsild_queue_depth",
+                "Number of data received but not processed yet",
+                self.queue_depth(),
+            ),
+            Gauge(
+                "pyngsild_runs_in_progress",
+                "Number of agent runs in progress",
+                status.running,
+            ),
+            *self.metrics.collect(),
+            *self.sink.collect(),
+        ]
+
 
 class ManagedDaemon(Daemon):
     def __init__(
-        self, sink: Sink = SinkStdout(), process: Callable = lambda row: row.record
+        self,
+        sink: Sink = SinkStdout(),
+        process: Callable = lambda row: row.record,
+        *,
+        workers: int = 1,
     ):
-        super().__init__(sink, process)
+        super().__init__(sink, process, workers=workers)
 
         self.app = FastAPI()
 
@@ -112,6 +213,12 @@ class ManagedDaemon(Daemon):
         async def status():
             return {"status": asdict(self.status), "sink": self.sink.status}
 
+        @self.app.get("/metrics", response_class=PlainTextResponse)
+        async def metrics():
+            return PlainTextResponse(
+                render(self.collect()), media_type="text/plain; version=0.0.4"
+            )
+
         @self.app.get("/version")
         async def version():
             return {"version": f"pyngsild-{__version__}"}
@@ -148,4 +255,7 @@ class ManagedDaemon(Daemon):
         self.thread.join()
 
     def close(self):
+        """stop the web server then the workers : subclasses stop receiving data and flush their last batch
+        before calling close()"""
         anyio.run(self.aclose)
+        self._shutdown_executor()
@@ -9,14 +9,18 @@
 #
 # Author: Fabien BATTELLO <fabien.battello@orange.com> et al.
 
+import asyncio
+import json
 import logging
 
+from collections import OrderedDict
 from datetime import datetime
-from pydantic import BaseModel
-from typing import Callable, Any
-from anyio import Lock
+from fastapi import Request, Response, HTTPException
+from pydantic import BaseModel, ValidationError
+from shortuuid import uuid
+from typing import Callable, Any, AsyncIterator, List, Set
 from pyngsild.constants import RowFormat
-from pyngsild.source import SourceSingle, Row
+from pyngsild.source import Source, SourceSingle, Row
 from ngsildclient.model.entity import Entity
 from pyngsild.sink import Sink, SinkStdout
 from . import ManagedDaemon
@@ -39,23 +43,184 @@ def process(row: Row) -> Entity:
 
 
 class HttpRestAgent(ManagedDaemon):
+    """A HttpRestAgent receives resources POSTed to a REST endpoint.
+
+    Each resource is validated against the given pydantic model, then processed.
+
+    Many resources can be POSTed at once to the bulk endpoint (by default the endpoint followed by "bulk"),
+    either as a JSON array or as a NDJSON body (Content-Type: application/x-ndjson) which is read as a stream.
+    Resources are validated and processed by batches of batch_size resources, each batch as one Source.
+    The response details the result of each resource : ok, filtered, invalid or error.
+    With the wait=false query parameter, the request is acknowledged with a 202 Accepted and a job id,
+    and the results can be retrieved later at /jobs/{job_id}.
+    """
+
     def __init__(
         self,
         sink: Sink = SinkStdout(),
         process: Callable[[Row], None] = lambda row: row.record,
         endpoint: str = "/rooms/",
-        mtype: type = RoomObserved
+        mtype: type = RoomObserved,
+        *,
+        bulk_endpoint: str = None,
+        batch_size: int = 1000,
+        max_jobs: int = 100,
+        workers: int = 1,
     ):
-        super().__init__(sink, process)
+        super().__init__(sink, process, workers=workers)
         self.endpoint = endpoint
         self.mtype = mtype
+        self.bulk_endpoint = bulk_endpoint or f"{endpoint.rstrip('/')}/bulk"
+        self.batch_size = batch_size
+        self.max_jobs = max_jobs
+        self.jobs: OrderedDict[
+            str, dict
+        ] = OrderedDict()  # job id => job, the oldest first
+        self._tasks: Set[asyncio.Task] = set()  # bulk jobs running in the background
 
         @self.app.post(self.endpoint, status_code=201)
         async def process(resource: self.mtype):
-            lock = Lock()
-            async with lock:
+            with self._lock:
                 self.status.lastcalltime = datetime.now()
                 self.status.calls += 1
             src = SourceSingle(resource, fmt=RowFormat.UNDEFINED)
             await self.trigger(src)
             return resource
+
+        @self.app.post(self.bulk_endpoint)
+        async def process_bulk(request: Request, response: Response, wait: bool = True):
+            with self._lock:
+                self.status.lastcalltime = datetime.now()
+                self.status.calls += 1
+            content_type = request.headers.get("content-type", "")
+            if "ndjson" in content_type or "jsonl" in content_type:
+                items = self._read_ndjson(request)
+            else:
+                items = self._read_json(request)
+            if wait:
+                job = self._new_job()
+                await self._bulk(items, job)
+                return job
+            items = [
+                item async for item in items
+            ]  # the body must be read, and a bad request rejected, before replying
+            job = self._new_job()
+            task = asyncio.create_task(self._bulk(self._aiter(items), job))
+            self._tasks.add(
+                task
+            )  # keep a reference until done, the event loop only keeps weak references
+            task.add_done_callback(self._tasks.discard)
+            response.status_code = 202
+            return {
+                "id": job["id"],
+                "state": job["state"],
+                "location": f"/jobs/{job['id']}",
+            }
+
+        @self.app.get("/jobs/{job_id}")
+        async def get_job(job_id: str):
+            if job_id not in self.jobs:
+                raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+            return self.jobs[job_id]
+
+    def _new_job(self) -> dict:
+        job = {
+            "id": uuid(),
+            "state": "pending",
+            "total": 0,
+            "ok": 0,
+            "filtered": 0,
+            "invalid": 0,
+            "error": 0,
+            "results": [],
+        }
+        self.jobs[job["id"]] = job
+        while len(self.jobs) > self.max_jobs:
+            self.jobs.popitem(last=False)
+        return job
+
+    @staticmethod
+    async def _aiter(items: List[Any]) -> AsyncIterator[Any]:
+        for item in items:
+            yield item
+
+    @staticmethod
+    async def _read_json(request: Request) -> AsyncIterator[Any]:
+        try:
+            body = json.loads(await request.body())
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid JSON : {e}")
+        for item in body if isinstance(body, list) else [body]:
+            yield item
+
+    @staticmethod
+    async def _read_ndjson(request: Request) -> AsyncIterator[Any]:
+        pending = b""
+        async for chunk in request.stream():
+            lines = (pending + chunk).split(b"\n")
+            pending = lines.pop()
+            for line in lines:
+                if line.strip():
+                    yield line
+        if pending.strip():
+            yield pending
+
+    async def _bulk(self, items: AsyncIterator[Any], job: dict):
+        """validate then process the resources by batches, recording the result of each one into the job"""
+        job["state"] = "running"
+        results: List[dict] = job["results"]
+
+        def process(row: Row):
+            index, resource = row.record
+            entity = self.process(Row(resource, row.provider))
+            results[index][
+                "status"
+            ] = "filtered"  # until an entity is written, e.g. None or an empty list
+            return entity
+
+        # a resource is ok once written to the sink, the agent calls on_error if the process or the write fails
+        def on_entity(row: Row, entity: Any):
+            results[row.record[0]]["status"] = "ok"
+
+        def on_error(row: Row, e: Exception):
+            index = row.record[0]
+            results[index] = {"index": index, "status": "error", "detail": str(e)}
+
+        batch: List[Row] = []
+        try:
+            async for item in items:
+                index = len(results)
+                try:
+                    resource = (
+                        self.mtype.parse_raw(item)
+                        if isinstance(item, bytes)
+                        else self.mtype.parse_obj(item)
+                    )
+                except ValidationError as e:
+                    results.append(
+                        {"index": index, "status": "invalid", "detail": e.errors()}
+                    )
+                    continue
+                results.append({"index": index, "status": "error"})  # until processed
+                batch.append(Row((index, resource), "http"))
+                if len(batch) >= self.batch_size:
+                    await self.trigger(
+                        Source(batch), process, on_entity=on_entity, on_error=on_error
+                    )
+                    batch = []
+            if batch:
+                await self.trigger(
+                    Source(batch), process, on_entity=on_entity, on_error=on_error
+                )
+        except HTTPException:  # bad request
+            self.jobs.pop(job["id"], None)
+            raise
+        except Exception as e:
+            logger.error(f"Bulk job {job['id']} failed : {e}")
+            job["state"] = "failed"
+            job["detail"] = str(e)
+            return
+        job["total"] = len(results)
+        for status in ("ok", "filtered", "invalid", "error"):
+            job[status] = sum(1 for r in results if r["status"] == status)
+        job["state"] = "done"
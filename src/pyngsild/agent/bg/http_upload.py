@@ -9,12 +9,17 @@
 #
 # Author: Fabien BATTELLO <fabien.battello@orange.com> et al.
 
+import asyncio
+import io
+import shutil
 import logging
 
 from datetime import datetime
-from fastapi import File, UploadFile
-from typing import Callable, Any
-from anyio import Lock
+from fastapi import Request, HTTPException
+from multipart.multipart import MultipartParser, parse_options_header
+from queue import Queue, Empty, Full
+from tempfile import SpooledTemporaryFile
+from typing import Callable, Any, List
 from pyngsild.source import Source, Row
 from pyngsild.sink import Sink, SinkStdout
 from . import ManagedDaemon
@@ -22,21 +27,212 @@ from . import ManagedDaemon
 logger = logging.getLogger(__name__)
 
 
+class UploadPipe(io.RawIOBase):
+    """A bounded pipe between the event loop receiving an upload and the worker thread reading it."""
+
+    def __init__(self, maxchunks: int = 16):
+        self._queue: Queue[bytes] = Queue(maxchunks)
+        self._chunk = memoryview(b"")
+        self._eof = False
+        self._error: Exception = None
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        while not self._chunk:
+            if self._eof:
+                return 0
+            try:
+                chunk = self._queue.get(timeout=0.1)
+            except Empty:
+                chunk = b""
+            if self._error is not None:
+                raise self._error
+            if chunk is None:
+                self._eof = True
+                return 0
+            self._chunk = memoryview(chunk)
+        n = min(len(b), len(self._chunk))
+        b[:n] = self._chunk[:n]
+        self._chunk = self._chunk[n:]
+        return n
+
+    def _put(self, chunk: bytes | None):
+        while not self.closed:  # the reader may have given up
+            try:
+                self._queue.put(chunk, timeout=0.1)
+                return
+            except Full:
+                pass
+
+    async def put(self, chunk: bytes):
+        try:
+            self._queue.put_nowait(chunk)
+        except Full:  # back-pressure : wait for the reader without blocking the event loop
+            await asyncio.to_thread(self._put, chunk)
+
+    async def put_eof(self):
+        await self.put(None)
+
+    def abort(self, e: Exception):
+        self._error = e
+
+
+class SourceUpload(Source):
+    """A Source reading a file while it is being uploaded.
+
+    The Source is built from the filename when iterating, hence in the thread that runs the agent.
+    Zip archives need random access, so they are spooled before being read.
+    """
+
+    def __init__(self, filename: str, pipe: UploadPipe):
+        self.filename = filename
+        self.pipe = pipe
+
+    def __iter__(self):
+        try:
+            if self.filename.endswith(".zip"):
+                fp = SpooledTemporaryFile()
+                shutil.copyfileobj(self.pipe, fp)
+                fp.seek(0)
+            else:
+                fp = io.BufferedReader(self.pipe)
+            yield from Source.from_file(self.filename, fp=fp)
+        finally:
+            self.pipe.close()
+
+
 class HttpUploadAgent(ManagedDaemon):
+    """A HttpUploadAgent processes files uploaded as multipart/form-data.
+
+    The file is processed while it is being uploaded : the request body is parsed as it arrives,
+    and the file content is handed over to the agent, run by a worker thread, through a bounded pipe.
+    Gzip-compressed files are decompressed on the fly.
+    Uploads larger than max_size bytes are rejected with a 413 status.
+    """
+
     def __init__(
         self,
         sink: Sink = SinkStdout(),
         process: Callable[[Row], None] = lambda row: row.record,
+        *,
+        workers: int = 1,
+        max_size: int = None,
     ):
-        super().__init__(sink, process)
+        super().__init__(sink, process, workers=workers)
+        self.max_size = max_size
 
         @self.app.post("/uploadfile/", status_code=201)
-        async def create_upload_file(file: UploadFile = File(...)):
-            logger.info(file.filename)
-            lock = Lock()
-            async with lock:
+        async def create_upload_file(request: Request):
+            with self._lock:
                 self.status.lastcalltime = datetime.now()
                 self.status.calls += 1
-            src = Source.from_file(file.filename, fp=file.file)
-            await self.trigger(src)
-            return {"filename": file.filename}
+            filename = await self._upload(request)
+            logger.info(filename)
+            return {"filename": filename}
+
+    async def _upload(self, request: Request) -> str:
+        content_type, params = parse_options_header(
+            request.headers.get("content-type", "")
+        )
+        if content_type != b"multipart/form-data" or b"boundary" not in params:
+            raise HTTPException(status_code=415, detail="Expected multipart/form-data")
+
+        headers: dict = {}
+        field: List[bytes] = []
+        value: List[bytes] = []
+        chunks: List[bytes] = []
+        upload = {
+            "filename": None,
+            "pipe": None,
+            "reading": False,
+            "done": False,
+            "eof": False,
+        }
+
+        def on_part_begin():
+            headers.clear()
+
+        def on_header_field(data, start, end):
+            field.append(data[start:end])
+
+        def on_header_value(data, start, end):
+            value.append(data[start:end])
+
+        def on_header_end():
+            headers[b"".join(field).lower()] = b"".join(value)
+            field.clear()
+            value.clear()
+
+        def on_headers_finished():
+            if upload["filename"] is not None:
+                return  # only the first file is processed
+            _, options = parse_options_header(headers.get(b"content-disposition", b""))
+            if options.get(
+                b"filename"
+            ):  # browsers send an empty filename when no file is selected
+                upload["filename"] = options[b"filename"].decode("utf-8")
+                upload["pipe"] = UploadPipe()
+                upload["reading"] = True
+
+        def on_part_data(data, start, end):
+            if upload["reading"]:
+                chunks.append(data[start:end])
+
+        def on_part_end():
+            if upload["reading"]:
+                upload["reading"] = False
+                upload["done"] = True
+
+        parser = MultipartParser(
+            params[b"boundary"],
+            callbacks={
+                "on_part_begin": on_part_begin,
+                "on_header_field": on_header_field,
+                "on_header_value": on_header_value,
+                "on_header_end": on_header_end,
+                "on_headers_finished": on_headers_finished,
+                "on_part_data": on_part_data,
+                "on_part_end": on_part_end,
+            },
+        )
+
+        task: asyncio.Task = None
+        received = 0
+        try:
+            async for data in request.stream():
+                received += len(data)
+                if self.max_size is not None and received > self.max_size:
+                    raise HTTPException(
+                        status_code=413, detail=f"Upload exceeds {self.max_size} bytes"
+                    )
+                parser.write(data)
+                pipe: UploadPipe = upload["pipe"]
+                if pipe is None:
+                    continue
+                if task is None:  # start processing as soon as the file part begins
+                    task = asyncio.create_task(
+                        self.trigger(SourceUpload(upload["filename"], pipe))
+                    )
+                for chunk in chunks:
+                    await pipe.put(chunk)
+                chunks.clear()
+                if upload["done"] and not upload["eof"]:
+                    await pipe.put_eof()
+                    upload["eof"] = True
+        except Exception as e:
+            if upload["pipe"] is not None:
+                upload["pipe"].abort(e)
+            if task is not None:
+                await task
+            raise
+        if task is None:
+            raise HTTPException(status_code=422, detail="No file uploaded")
+        if not upload["done"]:  # truncated body
+            upload["pipe"].abort(EOFError("Incomplete upload"))
+        if await task is None:  # the agent run has failed, the error has been logged
+            raise HTTPException(
+                status_code=500, detail=f"Cannot process {upload['filename']}"
+            )
+        return upload["filename"]
@@ -12,15 +12,22 @@
 
 import threading
 import logging
+import time
 import anyio
 
 from datetime import datetime
 from paho.mqtt.client import MQTTMessage
-from queue import SimpleQueue as Queue
-from typing import Literal, Callable
-
-from pyngsild.source import Row, ROW_NOT_SET as QUEUE_EOT, SourceSingle
-from pyngsild.utils.mqttclient import MqttClient, MQTT_DEFAULT_PORT
+from queue import Queue, Empty, Full
+from typing import Literal, Callable, List, Any
+
+from pyngsild.source import Row, ROW_NOT_SET as QUEUE_EOT, Source
+from pyngsild.utils.mqttclient import (
+    MqttClient,
+    MQTT_DEFAULT_PORT,
+    MQTTv311,
+    MQTTv5,
+    shared_topic,
+)
 from pyngsild.sink import *
 from . import ManagedDaemon
 
@@ -32,17 +39,41 @@ class MqttAgent(ManagedDaemon):
 
     Each time a message is received on the subscribed topic(s), the Source emits a Row composed of the message payload.
     The row provider is set to the topic.
+
+    Messages are queued then processed by micro-batches : up to batch_size messages, or as many messages as received
+    within linger seconds, are processed by a single agent run.
+    When maxsize is set, the queue is bounded and the overflow policy applies once it is full :
+    "block" holds the MQTT network loop (hence the broker) until room is available,
+    "drop_new" discards the incoming message, "drop_oldest" discards the oldest queued message.
+    Dropped messages are counted in the status.
+
+    The MQTT callback only queues the raw payload : it is decoded to UTF-8 by the worker thread,
+    or left as bytes if raw is set. Payloads that cannot be decoded are dropped and counted in the status.
+
+    Several connections to the broker can feed the same pipeline thanks to MQTT shared subscriptions :
+    when share is set, the topics are subscribed as $share/<share>/<topic>, so that the broker load-balances
+    messages among all the subscribers of the group, whether they belong to this agent (clients > 1) or to
+    other replicas. Shared subscriptions default to MQTT 5.
     """
 
     def __init__(
         self,
         sink: Sink = SinkStdout(),
-        process: Callable[[Row]] = lambda row: row.record,
+        process: Callable[[Row], Any] = lambda row: row.record,
         host: str = "localhost",
         port: int = MQTT_DEFAULT_PORT,
         credentials: tuple[str, str] = (None, None),
         topic: str | list[str] = "#",  # all topics
         qos: Literal[0, 1, 2] = 0,  # no ack
+        *,
+        batch_size: int = 1,
+        linger: float = 0.0,
+        maxsize: int = 0,
+        overflow: Literal["block", "drop_new", "drop_oldest"] = "block",
+        raw: bool = False,
+        clients: int = 1,
+        share: str = None,
+        protocol: int = None,
     ):
         """Returns a MqttAgent instance.
 
@@ -52,45 +83,161 @@ class MqttAgent(ManagedDaemon):
             credentials (str,str): Username and password used in broker authentication. Defaults to no auth.
             topic (OneOrManyStrings): Topic (or list of topics) to subscribe to. Defaults to "#" (all topics).
             qos (Literal[0, 1, 2]) : QoS : 0, 1 or 2 according to the MQTT protocol. Defaults to 0 (no ack).
+            batch_size (int): Maximum number of messages processed by a single agent run. Defaults to 1.
+            linger (float): Maximum delay in seconds to wait for a batch to fill up. Defaults to 0 (no wait).
+            maxsize (int): Maximum number of queued messages. Defaults to 0 (unbounded).
+            overflow (Literal["block", "drop_new", "drop_oldest"]): Policy once the queue is full. Defaults to "block".
+            raw (bool): Deliver payloads as bytes instead of str. Defaults to False.
+            clients (int): Number of connections to the broker. Defaults to 1.
+            share (str): Shared subscription group. Defaults to no sharing, or "pyngsild" if clients > 1.
+            protocol (int): MQTT protocol version (MQTTv311 or MQTTv5). Defaults to MQTTv5 if sharing, else MQTTv311.
 
         """
         super().__init__(sink, process)
+        if clients > 1 and share is None:
+            share = "pyngsild"  # otherwise each connection would receive every message
+        if share is not None:
+            topic = shared_topic(topic, share)
+        if protocol is None:
+            protocol = MQTTv5 if share is not None else MQTTv311
         self.topic = topic
-        self._queue: Queue[Row] = Queue()
+        self.batch_size = batch_size
+        self.linger = linger
+        self.overflow = overflow
+        self.raw = raw
+        self._queue: Queue[Row] = Queue(maxsize)
+        self._evict_lock = (
+            threading.Lock()
+        )  # serializes the producers under the drop_oldest policy
+        self._closing = False
+        self._thread: threading.Thread = None
         user, passwd = credentials
-        self._mcsub: MqttClient = MqttClient(
-            host, port, user, passwd, qos, callback=self._callback
-        )
+        self._clients: List[MqttClient] = [
+            MqttClient(
+                host,
+                port,
+                user,
+                passwd,
+                qos,
+                callback=self._callback,
+                protocol=protocol,
+            )
+            for _ in range(clients)
+        ]
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize() + self.status.pending
+
+    def _drain(self) -> List[Row]:
+        """wait for a message then drain the queue, up to batch_size messages or until linger has expired"""
+        rows = [self._queue.get()]
+        deadline = time.monotonic() + self.linger
+        while len(rows) < self.batch_size and rows[-1] != QUEUE_EOT:
+            timeout = deadline - time.monotonic()
+            try:
+                rows.append(
+                    self._queue.get(timeout=timeout)
+                    if timeout > 0
+                    else self._queue.get_nowait()
+                )
+            except Empty:
+                break
+        return rows
+
+    def _decode(self, rows: List[Row]) -> List[Row]:
+        decoded = []
+        for row in rows:
+            try:
+                decoded.append(Row(row.record.decode("utf-8"), row.provider))
+            except UnicodeDecodeError:
+                logger.debug(f"Drop message from {row.provider} : invalid UTF-8")
+                self._drop()
+        return decoded
 
     async def _aloop(self):
-        while True:
-            row: Row = self._queue.get(True)
-            if row == QUEUE_EOT:  # End Of Transmission
+        eot = False
+        while not eot:
+            rows = self._drain()
+            if rows[-1] == QUEUE_EOT:  # End Of Transmission
                 logger.info("Received EOT")
-                break
-            src = SourceSingle(row, provider="mqtt")
-            await self.trigger(src)  # TODO => sync it or all async
-        logger.info("EOT received !")
-        self._mcsub.stop()
+                rows.pop()
+                eot = True
+            if rows and not self.raw:
+                rows = self._decode(rows)
+            if rows:
+                self.status.lastcalltime = datetime.now()
+                await self.trigger(Source(rows))
+        self._stop_clients()
+
+    def _stop_clients(self):
+        for mqttc in self._clients:
+            try:
+                mqttc.stop()
+            except Exception as e:
+                logger.warning(e)
 
     def _loop(self):
         anyio.run(self._aloop)
 
     def run(self):
         super().run()
-        self._mcsub.subscribe(self.topic)
-        thread = threading.Thread(target=self._loop)
-        thread.start()
+        for mqttc in self._clients:
+            mqttc.subscribe(self.topic)
+        self._thread = threading.Thread(target=self._loop)
+        self._thread.start()
 
     def _callback(self, msg: MQTTMessage):
-        logger.debug(f"Received MQTT message : {msg}")
-        self.status.lastcalltime = datetime.now()
-        self.status.calls += 1
-        payload = str(msg.payload.decode("utf-8"))
-        self._queue.put(Row(msg.topic, payload))
+        # runs in the MQTT network thread
+        with self._lock:
+            self.status.calls += 1
+        self._enqueue(Row(msg.payload, msg.topic))
+
+    def _enqueue(self, row: Row):
+        match self.overflow:
+            case "drop_new":
+                try:
+                    self._queue.put_nowait(row)
+                except Full:
+                    self._drop()
+            case "drop_oldest":
+                with self._evict_lock:
+                    self._put_evicting(row)
+            case _:
+                self._queue.put(row)
+
+    def _put_evicting(self, row: Row):
+        """put a row, evicting the oldest rows if needed, must be called with _evict_lock held"""
+        if (
+            self._closing
+        ):  # the EOT marker is queued : drop new rows rather than evict it
+            self._drop()
+            return
+        while True:
+            try:
+                self._queue.put_nowait(row)
+                return
+            except Full:
+                try:
+                    self._queue.get_nowait()
+                    self._drop()
+                except Empty:
+                    pass
+
+    def _drop(self):
+        with self._lock:
+            self.status.dropped += 1
 
     def close(self):
         """Properly disconnect from MQTT broker and free resources"""
-        self._queue.put(QUEUE_EOT)
-        self._mcsub.stop()
+        if self.overflow == "drop_oldest":
+            with self._evict_lock:
+                self._put_evicting(QUEUE_EOT)
+                self._closing = True
+        else:
+            self._queue.put(QUEUE_EOT)
+        self._stop_clients()
+        if (
+            self._thread is not None
+        ):  # the queued messages are processed before the workers are shut down
+            self._thread.join()
         super().close()
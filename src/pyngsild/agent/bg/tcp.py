@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+
+# Software Name: pyngsild
+# SPDX-FileCopyrightText: Copyright (c) 2021 Orange
+# SPDX-License-Identifier: Apache 2.0
+#
+# This software is distributed under the Apache 2.0;
+# see the NOTICE file for more details.
+#
+# Author: Fabien BATTELLO <fabien.battello@orange.com> et al.
+
+import asyncio
+import threading
+import logging
+
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, List, Set
+
+from . import ManagedDaemon, Status
+from pyngsild.utils.metrics import Metric, Counter, Gauge
+from pyngsild.sink import Sink, SinkStdout
+from pyngsild.source import Source, Row
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class TcpStatus(Status):
+    connections: int = 0  # currently open
+    total_connections: int = 0
+
+
+class TcpServer(ManagedDaemon):
+    """TcpServer allows receiving newline-delimited frames over persistent TCP connections.
+
+    Typical use cases are NMEA-over-TCP, syslog or CSV push.
+
+    Each connection is read on its own, and its lines are processed by batches :
+    up to batch_size lines, or as many lines as received within linger seconds, are processed by a single agent run.
+    The connection is not read while its batch is processed, hence TCP flow control slows down the sender.
+    The row provider is set to tcp://<peer_host>:<peer_port>.
+    Lines longer than max_line bytes, or that cannot be decoded, are dropped and counted in the status.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 10110,
+        *,
+        sink: Sink = SinkStdout(),
+        process: Callable[[Row], None] = lambda row: row.record,
+        batch_size: int = 1,
+        linger: float = 0.0,
+        max_line: int = 65536,
+        raw: bool = False,
+    ):
+        """Returns a TcpServer instance.
+
+        Args:
+            host (str): Address to listen on. Defaults to "127.0.0.1".
+            port (int): Port to listen on, 0 for any free port. Defaults to 10110.
+            batch_size (int): Maximum number of lines processed by a single agent run. Defaults to 1.
+            linger (float): Maximum delay in seconds to wait for a batch to fill up. Defaults to 0 (no wait).
+            max_line (int): Maximum size of a line. Defaults to 64 KiB.
+            raw (bool): Deliver lines as bytes instead of str. Defaults to False.
+        """
+        super().__init__(sink, process)
+        self.status = TcpStatus()
+        self.host = host
+        self.port = port
+        self.batch_size = batch_size
+        self.linger = linger
+        self.max_line = max_line
+        self.raw = raw
+        self._ready = threading.Event()
+        self._writers: Set[asyncio.StreamWriter] = set()
+        self._handlers: Set[asyncio.Task] = set()
+
+    def collect(self) -> List[Metric]:
+        return [
+            *super().collect(),
+            Gauge(
+                "pyngsild_tcp_connections",
+                "Number of open TCP connections",
+                self.status.connections,
+            ),
+            Counter(
+                "pyngsild_tcp_accepted_connections",
+                "Number of accepted TCP connections",
+                self.status.total_connections,
+            ),
+        ]
+
+    def _row(self, line: bytes, provider: str) -> Row | None:
+        line = line.rstrip(b"\r\n")
+        if not line:
+            return None
+        if self.raw:
+            return Row(line, provider)
+        try:
+            return Row(line.decode("utf-8"), provider)
+        except UnicodeDecodeError:
+            logger.debug("Drop line : invalid UTF-8")
+            self.status.dropped += 1
+            return None
+
+    async def _flush(self, rows: List[Row]):
+        self.status.lastcalltime = datetime.now()
+        self.status.calls += len(rows)
+        await self.trigger(Source(rows))
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        host, port = writer.get_extra_info("peername")[:2]
+        provider = f"tcp://{host}:{port}"
+        logger.info(f"Connection from {provider}")
+        self.status.connections += 1
+        self.status.total_connections += 1
+        self._writers.add(writer)
+        self._handlers.add(asyncio.current_task())
+        loop = asyncio.get_running_loop()
+        rows: List[Row] = []
+        deadline = 0.0
+        discarding = False  # skipping the remainder of a line too long
+        try:
+            while True:
+                if rows and (len(rows) >= self.batch_size or loop.time() >= deadline):
+                    await self._flush(rows)
+                    rows = []
+                try:
+                    if rows:
+                        line = await asyncio.wait_for(
+                            reader.readuntil(b"\n"), deadline - loop.time()
+                        )
+                    else:
+                        line = await reader.readuntil(b"\n")
+                except asyncio.TimeoutError:
+                    continue
+                except asyncio.IncompleteReadError as e:  # EOF, the last line may have no newline
+                    line = e.partial
+                except asyncio.LimitOverrunError as e:
+                    # the line exceeds the limit : discard what is buffered, then the remainder up to the newline
+                    await reader.readexactly(e.consumed)
+                    if not discarding:
+                        logger.debug(f"Drop line longer than {self.max_line} bytes")
+                        self.status.dropped += 1
+                        discarding = True
+                    continue
+                except ConnectionError:
+                    break
+                if not line:  # EOF
+                    break
+                if discarding:  # the end of the line too long
+                    discarding = False
+                    continue
+                row = self._row(line, provider)
+                if row is None:
+                    continue
+                if not rows:
+                    deadline = loop.time() + self.linger
+                rows.append(row)
+            if rows:
+                await self._flush(rows)
+        finally:
+            logger.info(f"Disconnection from {provider}")
+            self.status.connections -= 1
+            self._writers.discard(writer)
+            self._handlers.discard(asyncio.current_task())
+            writer.close()
+
+    async def _aloop(self):
+        self._stop_event = asyncio.Event()
+        server = await asyncio.start_server(
+            self._handle, self.host, self.port, limit=self.max_line
+        )
+        self.port = server.sockets[0].getsockname()[1]
+        logger.info(f"Listening : {self.host=} {self.port=}")
+        self._ready.set()
+        async with server:
+            await self._stop_event.wait()
+            # close the open connections, pending lines are still processed
+            for writer in list(self._writers):
+                writer.close()
+            if self._handlers:
+                await asyncio.wait(list(self._handlers))
+
+    def loop(self):
+        self._loop = asyncio.new_event_loop()
+        self._loop.run_until_complete(self._aloop())
+        self._loop.close()
+
+    def run(self):
+        super().run()
+        self._thread = threading.Thread(target=self.loop)
+        self._thread.start()
+        self._ready.wait()
+
+    def _stop(self):
+        self._loop.call_soon_threadsafe(self._stop_event.set)
+        self._thread.join()
+
+    def close(self):
+        self._stop()  # the pending lines are flushed before the workers are shut down
+        super().close()
@@ -10,26 +10,36 @@
 # Author: Fabien BATTELLO <fabien.battello@orange.com> et al.
 
 import anyio
-import asyncio
+import socket
 import threading
 import logging
+import time
 
-from typing import Callable
+from typing import Callable, List
 from datetime import datetime
 
 from . import ManagedDaemon
 from pyngsild.sink import Sink, SinkStdout
-from pyngsild.source import SourceSingle, Row
+from pyngsild.source import Source, Row
 
 logger = logging.getLogger(__name__)
 
 EOT = b"PYNGSILD|EOT\n"
+UDP_MAX_PAYLOAD = 65507
 
 
 class UdpServer(ManagedDaemon):
     """UdpServer allows receiving UDP datagrams.
 
     A typical use case is to gather NMEA data from an AIS-receiver.
+
+    Datagrams are processed by batches : once a datagram is received, the datagrams already pending on the socket
+    are read at once, up to batch_size datagrams or until linger seconds have elapsed.
+    Each batch is processed by a single agent run.
+    Datagrams larger than max_packet bytes, or that cannot be decoded, are dropped and counted in the status.
+
+    When sockets is greater than 1, as many sockets are bound to the same address thanks to SO_REUSEPORT,
+    each served by its own thread : the kernel spreads incoming datagrams among them.
     """
 
     def __init__(
@@ -39,33 +49,125 @@ class UdpServer(ManagedDaemon):
         *,
         sink: Sink = SinkStdout(),
         process: Callable[[Row], None] = lambda row: row.record,
+        batch_size: int = 1,
+        linger: float = 0.0,
+        max_packet: int = UDP_MAX_PAYLOAD,
+        sockets: int = 1,
+        rcvbuf: int = None,
+        raw: bool = False,
     ):
+        """Returns a UdpServer instance.
+
+        Args:
+            host (str): Address to listen on. Defaults to "127.0.0.1".
+            port (int): Port to listen on, 0 for any free port. Defaults to 10110.
+            batch_size (int): Maximum number of datagrams processed by a single agent run. Defaults to 1.
+            linger (float): Maximum delay in seconds to wait for a batch to fill up. Defaults to 0 (no wait).
+            max_packet (int): Maximum size of a datagram. Defaults to the maximum UDP payload.
+            sockets (int): Number of sockets bound to the address. Defaults to 1.
+            rcvbuf (int): Size of the kernel receive buffer (SO_RCVBUF). Defaults to the system default.
+            raw (bool): Deliver datagrams as bytes instead of str. Defaults to False.
+        """
         super().__init__(sink, process)
         self.host = host
         self.port = port
+        self.batch_size = batch_size
+        self.linger = linger
+        self.max_packet = max_packet
+        self.rcvbuf = rcvbuf
+        self.raw = raw
+        if sockets > 1 and not hasattr(socket, "SO_REUSEPORT"):
+            logger.warning("SO_REUSEPORT not available : fallback to a single socket")
+            sockets = 1
+        self.sockets = sockets
+        self._closing = False
+        self._threads: List[threading.Thread] = []
 
-    async def _aloop(self):
-        print(f"{self.port=}")
-        async with await anyio.create_udp_socket(
-            local_host=self.host, local_port=self.port
-        ) as udp:
-            logger.info(f"Connected : {self.host=} {self.port=}")
-            async for packet, (host, port) in udp:
-                if packet == EOT:
-                    return
-                self.status.lastcalltime = datetime.now()
-                self.status.calls += 1
-                src = SourceSingle(packet.decode("utf-8"), provider="udp")
-                await self.trigger(src)
-
-    def loop(self):
-        loop = asyncio.new_event_loop()
-        loop.run_until_complete(self._aloop())
+    def _bind(self) -> socket.socket:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        if self.sockets > 1:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        if self.rcvbuf:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.rcvbuf)
+        sock.bind((self.host, self.port))
+        return sock
+
+    def _bind_all(self) -> List[socket.socket]:
+        """bind the sockets : with port 0 the first one picks a free port, shared by the others"""
+        first = self._bind()
+        self.port = first.getsockname()[1]
+        return [first, *(self._bind() for _ in range(self.sockets - 1))]
+
+    def _recv_batch(self, sock: socket.socket) -> List[bytes]:
+        """wait for a datagram then read the pending ones, up to batch_size datagrams or until linger has expired"""
+        bufsize = self.max_packet + 1  # to detect oversized datagrams
+        sock.settimeout(0.5)  # check for closing from time to time
+        while True:
+            try:
+                packets = [sock.recv(bufsize)]
+                break
+            except socket.timeout:
+                if self._closing:
+                    return [EOT]
+        deadline = time.monotonic() + self.linger
+        while len(packets) < self.batch_size and packets[-1] != EOT:
+            sock.settimeout(
+                max(deadline - time.monotonic(), 0.0)
+            )  # 0 means non-blocking
+            try:
+                packets.append(sock.recv(bufsize))
+            except (BlockingIOError, socket.timeout):
+                break
+        return packets
+
+    def _rows(self, packets: List[bytes]) -> List[Row]:
+        rows = []
+        for packet in packets:
+            if len(packet) > self.max_packet:
+                logger.debug(f"Drop oversized datagram of {len(packet)} bytes")
+                self._drop()
+                continue
+            if self.raw:
+                rows.append(Row(packet, "udp"))
+                continue
+            try:
+                rows.append(Row(packet.decode("utf-8"), "udp"))
+            except UnicodeDecodeError:
+                logger.debug("Drop datagram : invalid UTF-8")
+                self._drop()
+        return rows
+
+    def _drop(self):
+        with self._lock:
+            self.status.dropped += 1
+
+    async def _aloop(self, sock: socket.socket):
+        logger.info(f"Listening : {self.host=} {self.port=}")
+        eot = False
+        with sock:
+            while not eot and not self._closing:
+                packets = self._recv_batch(sock)
+                if packets[-1] == EOT:
+                    packets.pop()
+                    eot = True
+                with self._lock:  # shared by the threads of the sockets
+                    self.status.lastcalltime = datetime.now()
+                    self.status.calls += len(packets)
+                rows = self._rows(packets)
+                if rows:
+                    await self.trigger(Source(rows))
+
+    def loop(self, sock: socket.socket):
+        anyio.run(self._aloop, sock)
 
     def run(self):
         super().run()
-        self._thread = threading.Thread(target=self.loop)
-        self._thread.start()
+        socks = self._bind_all()
+        self._threads = [
+            threading.Thread(target=self.loop, args=[sock]) for sock in socks
+        ]
+        for thread in self._threads:
+            thread.start()
 
     async def send_in_band_EOT(self):
         async with await anyio.create_connected_udp_socket(
@@ -74,6 +176,12 @@ class UdpServer(ManagedDaemon):
             await udp.send(EOT)
 
     def close(self):
-        super().close()
+        self._closing = True  # other sockets may not receive the EOT
         anyio.run(self.send_in_band_EOT)
-        self._thread.join()
+        for (
+            thread
+        ) in (
+            self._threads
+        ):  # the last batches are processed before the workers are shut down
+            thread.join()
+        super().close()
@@ -10,11 +10,13 @@
 # Author: Fabien BATTELLO <fabien.battello@orange.com> et al.
 
 import asyncio
+import os
 import threading
 import logging
 
 from datetime import datetime
-from typing import Callable
+from functools import partial
+from typing import Callable, Dict, Literal, Set, Tuple
 from watchgod import awatch
 from watchgod.watcher import Change
 from asyncio import Event
@@ -22,13 +24,58 @@ from pathlib import Path
 
 from . import ManagedDaemon
 from pyngsild.sink import Sink, SinkStdout
-from pyngsild.source import Source, Row
+from pyngsild.source import Source, SourceMany, Row
 
 logger = logging.getLogger(__name__)
 
+# a file identified by its path, size and modification time
+FileKey = Tuple[str, int, int]
+
+
+class FileJournal:
+    """An append-only record of the files already processed, one file per line."""
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self._lock = threading.Lock()
+        self.keys: Set[FileKey] = set()
+        try:
+            with open(filename, "r", encoding="utf-8") as f:
+                for line in f:
+                    path, size, mtime = line.rstrip("\n").rsplit("\t", 2)
+                    self.keys.add((path, int(size), int(mtime)))
+        except FileNotFoundError:
+            pass
+
+    def __contains__(self, key: FileKey) -> bool:
+        return key in self.keys
+
+    def add(self, key: FileKey):
+        with self._lock:
+            self.keys.add(key)
+            with open(self.filename, "a", encoding="utf-8") as f:
+                f.write("\t".join(str(x) for x in key) + "\n")
+
+
+def _filekey(filename: str) -> FileKey:
+    st = os.stat(filename)
+    return filename, st.st_size, st.st_mtime_ns
+
 
 class WatchDog(ManagedDaemon):
-    """Watchdog looks a directory for new files."""
+    """Watchdog looks a directory for new files.
+
+    By default the directory is polled. On Linux, the inotify watcher is event-driven and only reports a file
+    once the writer has closed it (or once it has been moved into the directory). Subdirectories created
+    while watching are watched too.
+    With the polling watcher, a new file is processed once its size and modification time have not changed
+    for settle seconds, so that files still being written are not read too early. Files modified afterwards
+    are not processed again.
+
+    Files are processed concurrently by a pool of workers.
+    When record is set, processed files are recorded into this file : at startup, the files of the directory
+    that have not been processed yet are processed, and the others are skipped.
+    """
 
     def __init__(
         self,
@@ -36,24 +83,165 @@ class WatchDog(ManagedDaemon):
         *,
         sink: Sink = SinkStdout(),
         process: Callable[[Row], None] = lambda row: row.record,
+        watcher: Literal["poll", "inotify"] = "poll",
+        settle: float = 1.0,
+        workers: int = 1,
+        record: str = None,
     ):
-        super().__init__(sink, process)
+        """Returns a WatchDog instance.
+
+        Args:
+            path (Path): The directory to watch.
+            watcher (Literal["poll", "inotify"]): The watcher to use. Defaults to "poll".
+            settle (float): Delay in seconds a polled file must remain unchanged before being processed. Defaults to 1.
+            workers (int): Number of files processed concurrently. Defaults to 1.
+            record (str): File recording the processed files. Defaults to no record.
+        """
+        super().__init__(sink, process, workers=workers)
         self.path = path
+        self.watcher = watcher
+        self.settle = settle
+        self.journal = FileJournal(record) if record else None
+        self._inflight: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        self._loop: asyncio.AbstractEventLoop = None
+        self._thread: threading.Thread = None
+        self._closing = False
+        self.stop_event: Event = None
 
-    async def _aloop(self):
-        self.stop_event = Event()
-        async for changes in awatch(self.path, stop_event=self.stop_event):
+    def _spawn(self, filename: str):
+        if filename in self._inflight:
+            return
+        self._inflight.add(filename)
+        task = asyncio.create_task(self._process_file(filename))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _settled(self, filename: str) -> bool:
+        """wait for the file size and modification time to be stable"""
+        previous = None
+        while True:
+            try:
+                key = _filekey(filename)
+            except FileNotFoundError:
+                return False
+            if key == previous:
+                return True
+            previous = key
+            await asyncio.sleep(self.settle)
+
+    async def _process_file(self, filename: str):
+        try:
+            if (
+                self.watcher == "poll"
+                and self.settle
+                and not await self._settled(filename)
+            ):
+                return
+            try:
+                key = _filekey(filename)
+            except FileNotFoundError:
+                return
+            if self.journal and key in self.journal:
+                logger.debug(f"skip {filename} : already processed")
+                return
             self.status.lastcalltime = datetime.now()
             self.status.calls += 1
+            src = SourceMany(
+                [partial(Source.from_file, filename)]
+            )  # the file is opened by the worker
+            if await self.trigger(src) is not None and self.journal:
+                self.journal.add(key)
+        finally:
+            self._inflight.discard(filename)
+
+    def _scan(self):
+        for filename in sorted(Path(self.path).rglob("*")):
+            if filename.is_file():
+                self._spawn(str(filename))
+
+    async def _watch_poll(self):
+        async for changes in awatch(self.path, stop_event=self.stop_event):
             for mode, filename in changes:
-                if mode != Change.added:
+                if (
+                    mode != Change.added
+                ):  # a modified file has already been processed once settled
                     continue
-                src = Source.from_file(filename)
-                await self.trigger(src)
+                self._spawn(filename)
+
+    async def _watch_inotify(self):
+        from pyngsild.utils.inotify import (
+            Inotify,
+            IN_CLOSE_WRITE,
+            IN_MOVED_TO,
+            IN_CREATE,
+            IN_ISDIR,
+            IN_IGNORED,
+        )
+
+        inotify = Inotify()
+        wds: Dict[int, str] = {}  # watch descriptor => directory
+
+        def watch(directory: str, scan: bool):
+            """watch a directory and its subdirectories, processing the files already there if scan is set"""
+            wds[
+                inotify.add_watch(directory, IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE)
+            ] = directory
+            for entry in sorted(Path(directory).iterdir()):
+                if entry.is_dir():
+                    watch(str(entry), scan)
+                elif scan and entry.is_file():
+                    self._spawn(str(entry))
+
+        watch(str(self.path), scan=False)
+        events = asyncio.Queue()
+        loop = asyncio.get_running_loop()
+        loop.add_reader(inotify.fd, lambda: events.put_nowait(inotify.read()))
+        try:
+            while not self.stop_event.is_set():
+                try:
+                    batch = await asyncio.wait_for(events.get(), 0.5)
+                except asyncio.TimeoutError:
+                    continue
+                for wd, mask, name in batch:
+                    if mask & IN_IGNORED:
+                        wds.pop(wd, None)
+                        continue
+                    if wd not in wds:
+                        continue
+                    filename = os.path.join(wds[wd], name)
+                    if not mask & IN_ISDIR:
+                        if mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                            self._spawn(filename)
+                        continue
+                    try:  # a new directory : files may have been written before its watch is added
+                        watch(filename, scan=True)
+                    except OSError as e:
+                        logger.warning(f"Cannot watch {filename} : {e}")
+        finally:
+            loop.remove_reader(inotify.fd)
+            inotify.close()
+
+    async def _aloop(self):
+        self.stop_event = Event()
+        if self._closing:  # closed before being started
+            self.stop_event.set()
+        if self.journal:
+            self._scan()
+        if self.watcher == "inotify":
+            try:
+                await self._watch_inotify()
+            except (OSError, AttributeError) as e:  # not on Linux
+                logger.warning(f"inotify not available, fallback to polling : {e}")
+                self.watcher = "poll"
+        if self.watcher == "poll":
+            await self._watch_poll()
+        if self._tasks:
+            await asyncio.wait(list(self._tasks))
 
     def loop(self):
-        loop = asyncio.new_event_loop()
-        loop.run_until_complete(self._aloop())
+        self._loop = asyncio.new_event_loop()
+        self._loop.run_until_complete(self._aloop())
 
     def run(self):
         super().run()
@@ -61,6 +249,13 @@ class WatchDog(ManagedDaemon):
         self._thread.start()
 
     def close(self):
-        self.stop_event.set()
+        self._closing = True
+        if (
+            self.stop_event is not None
+        ):  # else the watcher has not started yet, and will stop at once
+            self._loop.call_soon_threadsafe(self.stop_event.set)
+        if (
+            self._thread is not None
+        ):  # the files settling are processed before the workers are shut down
+            self._thread.join()
         super().close()
-        self._thread.join()
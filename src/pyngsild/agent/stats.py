@@ -53,3 +53,22 @@ class Stats:
         self.error = 0
         self.side_entities = 0
         return self
+
+
+@dataclass
+class Timings:
+    """
+    Cumulative time spent in each stage of the pipeline, in seconds
+
+    In parallel mode, process is the time spent by all the workers.
+    """
+
+    source: float = 0.0
+    process: float = 0.0
+    sink: float = 0.0
+
+    def zero(self):
+        self.source = 0.0
+        self.process = 0.0
+        self.sink = 0.0
+        return self
@@ -21,6 +21,7 @@ class FileMode(Enum):
 class RowFormat(Enum):
     TEXT = "text"
     JSON = "json"
+    NDJSON = "ndjson"
     XML = "xml"
     UNDEFINED = "undefined"
 
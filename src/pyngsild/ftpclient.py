@@ -10,13 +10,15 @@
 # Author: Fabien BATTELLO <fabien.battello@orange.com> et al.
 
 import ftplib
+import io
+import os
 import ssl
 import tempfile
 import shutil
 import logging
 
 from ftplib import FTP, FTP_TLS
-from typing import List
+from typing import Dict, List, Tuple
 from os.path import basename, join
 
 logger = logging.getLogger(__name__)
@@ -38,6 +40,35 @@ class FtpClientException(Exception):
     pass
 
 
+class FtpDataStream(io.RawIOBase):
+    """A readable stream over a FTP data connection.
+
+    Closing the stream closes the data connection and reads the end of transfer reply.
+    """
+
+    def __init__(self, ftp: FTP, conn):
+        self.ftp = ftp
+        self.conn = conn
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        return self.conn.recv_into(b)
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            if isinstance(self.conn, ssl.SSLSocket):
+                self.conn.unwrap()
+            self.conn.close()
+            self.ftp.voidresp()
+        except ftplib.all_errors as e:
+            logger.warning(f"Error while closing data connection : {e}")
+        super().close()
+
+
 class FtpClient:
     def __init__(
         self,
@@ -45,6 +76,7 @@ class FtpClient:
         user: str = "anonymous",
         passwd: str = "guest",
         use_tls: bool = False,
+        tmpdir: str = None,
     ):
         logger.debug("Connect to FTP server")
         if use_tls:
@@ -65,6 +97,13 @@ class FtpClient:
                 raise FtpClientException(f"Cannot connect : {e}")
         except ftplib.all_errors as e:
             raise FtpClientException(f"Cannot connect : {e}")
+        self.tmpdir = tmpdir
+        self._owned_tmpdir = (
+            tmpdir is None
+        )  # only remove the directory if we created it
+        if tmpdir is not None:
+            os.makedirs(tmpdir, exist_ok=True)
+            return
         try:
             # create temp dir to receive future downloads
             self.tmpdir = tempfile.mkdtemp()
@@ -76,17 +115,65 @@ class FtpClient:
         self.ftp.retrlines(f"NLST {path}", filelist.append)
         return filelist
 
-    def download(self, remote: str) -> str:
+    def stat(self, remote: str) -> Tuple[int, str]:
+        """return the size and the modification time (YYYYMMDDHHMMSS) of a remote file, thanks to MLST or SIZE/MDTM"""
+        try:
+            resp = self.ftp.sendcmd(f"MLST {remote}")
+            facts = resp.splitlines()[1].strip().split(" ", 1)[0]
+            facts = dict(fact.split("=", 1) for fact in facts.split(";") if "=" in fact)
+            facts = {k.lower(): v for k, v in facts.items()}
+            return int(facts["size"]), facts["modify"][:14]
+        except (ftplib.error_perm, IndexError, KeyError, ValueError):
+            pass  # MLST not supported, fallback to SIZE and MDTM
+        try:
+            self.ftp.voidcmd("TYPE I")
+            size = self.ftp.size(remote)
+            mtime = self.ftp.voidcmd(f"MDTM {remote}").split()[1][:14]
+        except Exception as e:
+            raise FtpClientException(f"Cannot stat {remote} : {e}")
+        return size, mtime
+
+    def stat_dir(self, path: str) -> Dict[str, Tuple[int, str]]:
+        """return the size and the modification time of the files of a remote directory, by name, thanks to MLSD"""
+        try:
+            entries = self.ftp.mlsd(path, facts=["type", "size", "modify"])
+            return {
+                name: (int(facts["size"]), facts["modify"][:14])
+                for name, facts in entries
+                if facts.get("type", "file") == "file"
+                and "size" in facts
+                and "modify" in facts
+            }
+        except Exception as e:
+            raise FtpClientException(f"Cannot list {path} : {e}")
+
+    def download(self, remote: str, resume: bool = False) -> str:
+        """download a remote file to the temp dir, resuming a previous partial download if asked to"""
         logger.debug(f"Download file {remote}")
         try:
             local = join(self.tmpdir, basename(remote))
-            handle = open(local, "wb")
-            self.ftp.retrbinary(f"RETR {remote}", handle.write)
-            handle.close()
+            offset = os.path.getsize(local) if resume and os.path.exists(local) else 0
+            if offset:
+                logger.info(f"Resume download of {remote} at offset {offset}")
+            with open(local, "ab" if offset else "wb") as handle:
+                if offset:
+                    self.ftp.retrbinary(f"RETR {remote}", handle.write, rest=offset)
+                else:
+                    self.ftp.retrbinary(f"RETR {remote}", handle.write)
         except Exception as e:
             raise FtpClientException(f"Cannot download {remote} : {e}")
         return local
 
+    def open(self, remote: str) -> io.BufferedReader:
+        """open a remote file for reading, without downloading it"""
+        logger.debug(f"Open file {remote}")
+        try:
+            self.ftp.voidcmd("TYPE I")
+            conn = self.ftp.transfercmd(f"RETR {remote}")
+        except Exception as e:
+            raise FtpClientException(f"Cannot open {remote} : {e}")
+        return io.BufferedReader(FtpDataStream(self.ftp, conn))
+
     def close(self):
         logger.debug("Disconnect from FTP server")
         try:
@@ -96,7 +183,7 @@ class FtpClient:
             raise FtpClientException(f"Cannot disconnect : {e}")
 
     def clean(self):
-        if self.tmpdir:
+        if self.tmpdir and self._owned_tmpdir:
             try:
                 shutil.rmtree(self.tmpdir)
             except Exception as e:
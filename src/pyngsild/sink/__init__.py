@@ -15,6 +15,12 @@ Sinks.
 Sinks MUST respect the following protocol :
 Each Sink Class MUST implement write().
 Some Sinks MAY override close() if needed to free resources.
+Some Sinks MAY buffer messages, hence override flush() to send pending messages.
+
+AsyncSinks MUST implement the write() coroutine, and MAY override write_many() to send many messages at once.
+
+Some Sinks MAY defer writes (batching, background upserts) : entities that fail afterwards are reported thanks to
+report_errors(), and charged to the agent that has written them when it calls settle() once the sink is flushed.
 
 Other sinks such as SinkStdout or SinkFile are useful during the development stage and for unit testing.
 """
@@ -22,8 +28,34 @@ Other sinks such as SinkStdout or SinkFile are useful during the development sta
 
 import gzip
 import os
+import threading
 
 from abc import ABC, abstractmethod
+from contextvars import ContextVar
+from typing import Dict, List
+
+# statistics of the agent running in the current thread (or asyncio task)
+_agent_stats: ContextVar = ContextVar("agent_stats", default=None)
+_errors: Dict[
+    int, list
+] = {}  # id(stats) => [stats, number of entities failed once written]
+_errors_lock = threading.Lock()
+
+
+def report_errors(stats, count: int = 1):
+    """report count entities written by the agent owning stats that have failed afterwards, from any thread"""
+    if stats is None or not count:
+        return
+    with _errors_lock:
+        _errors.setdefault(id(stats), [stats, 0])[1] += count
+
+
+def settle(stats):
+    """charge the errors reported for stats, called by the agent from its own thread once the sink is flushed"""
+    with _errors_lock:
+        _, count = _errors.pop(id(stats), (None, 0))
+    stats.output -= count
+    stats.error += count
 
 
 class Sink(ABC):
@@ -38,14 +70,69 @@ class Sink(ABC):
     def write(self, msg):
         raise NotImplementedError
 
+    def bind(self, stats):
+        """attach the statistics of the agent running in the current thread (or task),
+        so that deferred errors are charged to the agent that has written the entities"""
+        _agent_stats.set(stats)
+
+    @property
+    def stats(self):
+        """statistics of the agent writing from the current thread (or task)"""
+        return _agent_stats.get()
+
+    def flush(self):
+        pass
+
     @property
     def status(self) -> dict:
         return {"state": "up"}
 
+    def collect(self) -> List:
+        """return the metrics of the sink, see pyngsild.utils.metrics"""
+        return []
+
     def close(self):
         pass
 
 
+class AsyncSink(ABC):
+    """
+    AsyncSink is an abstract class for sinks driven by an event loop.
+    """
+
+    @abstractmethod
+    async def write(self, msg):
+        raise NotImplementedError
+
+    async def write_many(self, msgs: List):
+        for msg in msgs:
+            await self.write(msg)
+
+    def bind(self, stats):
+        """attach the statistics of the agent running in the current thread (or task),
+        so that deferred errors are charged to the agent that has written the entities"""
+        _agent_stats.set(stats)
+
+    @property
+    def stats(self):
+        """statistics of the agent writing from the current thread (or task)"""
+        return _agent_stats.get()
+
+    async def flush(self):
+        pass
+
+    @property
+    def status(self) -> dict:
+        return {"state": "up"}
+
+    def collect(self) -> List:
+        """return the metrics of the sink, see pyngsild.utils.metrics"""
+        return []
+
+    async def close(self):
+        pass
+
+
 class SinkException(Exception):
     pass
 
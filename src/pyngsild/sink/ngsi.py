@@ -9,40 +9,322 @@
 #
 # Author: Fabien BATTELLO <fabien.battello@orange.com> et al.
 
-from concurrent.futures import ThreadPoolExecutor
+import logging
+import threading
+
+from concurrent.futures import ThreadPoolExecutor, Future, wait
+from typing import List, Set, Tuple
 from ngsildclient.api.client import Client
+from ngsildclient.api.asyn.client import AsyncClient
 from ngsildclient.api.constants import NGSILD_DEFAULT_PORT
 from ngsildclient.model.entity import Entity
-from . import Sink, SinkException
+from pyngsild.utils.metrics import Histogram, Metric, SIZE_BUCKETS
+from . import Sink, AsyncSink, SinkException, report_errors
+
+logger = logging.getLogger(__name__)
+
+
+def _broker_metrics(client: Client) -> Histogram:
+    """observe the duration and status code of every request sent to the broker"""
+    requests = Histogram(
+        "pyngsild_broker_request_duration_seconds",
+        "Duration of the requests to the Context Broker",
+        ["method", "status"],
+    )
+
+    def observe(r, *args, **kwargs):
+        requests.observe(
+            r.elapsed.total_seconds(), r.request.method, str(r.status_code)
+        )
+
+    client.session.hooks["response"].append(observe)
+    return requests
 
 
 class SinkNgsi(Sink):
-    def __init__(self, hostname: str = "localhost", port: int = NGSILD_DEFAULT_PORT):
+    """Write entities to the Context Broker.
+
+    By default each entity is upserted on its own.
+    When batch_size is greater than 1, entities are buffered and sent through the batch upsert endpoint,
+    either when batch_size entities or batch_bytes bytes have been buffered, or when linger seconds have
+    elapsed since the first entity has been buffered.
+    Entities rejected by the broker are reported to the statistics of the agent that has written them,
+    even when the batch is sent by another agent sharing the sink, or by the linger timer.
+    """
+
+    def __init__(
+        self,
+        hostname: str = "localhost",
+        port: int = NGSILD_DEFAULT_PORT,
+        *,
+        batch_size: int = 1,
+        batch_bytes: int = None,
+        linger: float = None,
+    ):
+        """
+        Parameters
+        ----------
+        hostname : str
+            The hostname of the Context Broker
+        port : int
+            The port of the Context Broker
+        batch_size : int
+            The maximum number of entities sent in a single batch request, by default 1 (no batching)
+        batch_bytes : int
+            The maximum size in bytes of a batch request, by default no limit
+        linger : float
+            The maximum delay in seconds an entity stays in the buffer, by default no delay
+        """
         try:
             self.client = Client(hostname, port)
         except Exception as e:
             raise SinkException(e)
+        self.requests = _broker_metrics(self.client)
+        self.batches = Histogram(
+            "pyngsild_broker_batch_entities",
+            "Number of entities per batch upsert",
+            buckets=SIZE_BUCKETS,
+        )
+        self.batch_size = batch_size
+        self.batch_bytes = batch_bytes
+        self.linger = linger
+        self._buffer: List[str] = []  # JSON-serialized entities
+        self._owners: List[
+            Tuple[str, object]
+        ] = []  # (entity id, statistics of the agent) for each buffered entity
+        self._bufsize: int = 0
+        self._lock = threading.RLock()
+        self._timer: threading.Timer = None
+
+    @property
+    def batching(self) -> bool:
+        return self.batch_size > 1 or self.batch_bytes is not None
 
     def write(self, entity: Entity):
+        if not self.batching:
+            try:
+                self.client.upsert(entity)
+            except Exception as e:
+                raise SinkException(e)
+            return
+        payload = entity.to_json()
+        with self._lock:
+            if (
+                self.batch_bytes
+                and self._buffer
+                and self._bufsize + len(payload) + 1 > self.batch_bytes
+            ):
+                self._flush()
+            self._buffer.append(payload)
+            self._owners.append((entity.id, self.stats))
+            self._bufsize += len(payload) + 1  # including separator
+            if len(self._buffer) >= self.batch_size:
+                self._flush()
+            elif self.linger and self._timer is None:
+                self._timer = threading.Timer(self.linger, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        # must be called with the lock held
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._buffer:
+            return
+        body = f"[{','.join(self._buffer)}]"
+        count = len(self._buffer)
+        owners = self._owners
+        self._buffer = []
+        self._owners = []
+        self._bufsize = 0
+        self.batches.observe(count)
+        logger.debug(f"upsert batch of {count} entities")
         try:
-            self.client.upsert(entity)
+            r = self.client.session.post(
+                f"{self.client.batch.url}/upsert/", data=body.encode("utf-8")
+            )
         except Exception as e:
-            raise SinkException(e)
+            logger.error(f"Cannot upsert batch of {count} entities : {e}")
+            self._report_errors(owners)
+            return
+        match r.status_code:
+            case 201 | 204:
+                pass
+            case 207:  # multi-status : some entities have failed
+                errors = r.json().get("errors", [])
+                for error in errors:
+                    logger.error(
+                        f"Cannot upsert entity {error.get('entityId')} : {error.get('error')}"
+                    )
+                failed = {error.get("entityId") for error in errors}
+                self._report_errors([owner for owner in owners if owner[0] in failed])
+            case _:
+                logger.error(
+                    f"Cannot upsert batch of {count} entities : HTTP {r.status_code} {r.text}"
+                )
+                self._report_errors(owners)
+
+    @staticmethod
+    def _report_errors(owners: List[Tuple[str, object]]):
+        for _, stats in owners:
+            report_errors(stats)
+
+    def collect(self) -> List[Metric]:
+        return [self.requests, self.batches]
 
     def close(self):
+        self.flush()
         self.client.close()
 
 
 class SinkNgsiAsync(Sink):
-    def __init__(self, hostname: str = "localhost", port: int = NGSILD_DEFAULT_PORT):
+    """Write entities to the Context Broker without waiting for the broker to reply.
+
+    Upserts are run by a pool of threads.
+    The number of in-flight upserts is bounded by max_pending : when the limit is reached, write() either blocks
+    until an upsert completes, or sheds the entity by raising a SinkException if block is not set.
+    Failed upserts are reported to the statistics of the agent that has written the entity.
+    """
+
+    def __init__(
+        self,
+        hostname: str = "localhost",
+        port: int = NGSILD_DEFAULT_PORT,
+        *,
+        workers: int = None,
+        max_pending: int = 1024,
+        block: bool = True,
+    ):
+        """
+        Parameters
+        ----------
+        hostname : str
+            The hostname of the Context Broker
+        port : int
+            The port of the Context Broker
+        workers : int
+            The number of threads sending requests to the broker, by default ThreadPoolExecutor's default
+        max_pending : int
+            The maximum number of in-flight upserts, by default 1024
+        block : bool
+            Whether write() blocks or sheds the entity when max_pending is reached, by default True
+        """
         try:
             self.client = Client(hostname, port)
-            self.executor = ThreadPoolExecutor()
+            self.executor = ThreadPoolExecutor(max_workers=workers)
         except Exception as e:
             raise SinkException(e)
+        self.requests = _broker_metrics(self.client)
+        self.block = block
+        self.completed: int = 0
+        self.failed: int = 0
+        self.shed: int = 0
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._pending: Set[Future] = set()
+        self._lock = threading.Lock()
 
     def write(self, entity: Entity):
-        self.executor.submit(self.client.upsert, entity)
+        if not self._slots.acquire(blocking=self.block):
+            self.shed += 1
+            raise SinkException(
+                f"Too many pending upserts : entity {entity.id} is dropped"
+            )
+        try:
+            future = self.executor.submit(self._upsert, entity, self.stats)
+        except Exception as e:
+            self._slots.release()
+            raise SinkException(e)
+        with self._lock:
+            self._pending.add(future)
+        future.add_done_callback(self._done)
+
+    def _upsert(self, entity: Entity, stats):
+        # runs in a worker thread, the error is reported before the future completes hence before flush() returns
+        try:
+            self.client.upsert(entity)
+        except Exception as e:
+            logger.error(f"Cannot upsert entity : {e}")
+            report_errors(stats)
+            with self._lock:
+                self.failed += 1
+            return
+        with self._lock:
+            self.completed += 1
+
+    def _done(self, future: Future):
+        with self._lock:
+            self._pending.discard(future)
+        self._slots.release()
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def flush(self):
+        """wait for all in-flight upserts to complete"""
+        with self._lock:
+            pending = list(self._pending)
+        wait(pending)
+
+    @property
+    def status(self) -> dict:
+        return {
+            "state": "up",
+            "pending": self.pending,
+            "completed": self.completed,
+            "failed": self.failed,
+            "shed": self.shed,
+        }
+
+    def collect(self) -> List[Metric]:
+        return [self.requests]
 
     def close(self):
+        self.flush()
+        self.executor.shutdown(wait=True)
         self.client.close()
+
+
+class AsyncSinkNgsi(AsyncSink):
+    """Write entities to the Context Broker from an event loop, thanks to the ngsildclient AsyncClient.
+
+    write() upserts a single entity, write_many() upserts a list of entities through the batch upsert endpoint.
+    Entities of a batch rejected by the broker are reported to the statistics of the agent that has written them.
+    """
+
+    def __init__(self, hostname: str = "localhost", port: int = NGSILD_DEFAULT_PORT):
+        try:
+            self.client = AsyncClient(hostname, port)
+        except Exception as e:
+            raise SinkException(e)
+
+    async def write(self, entity: Entity):
+        try:
+            await self.client.upsert(entity)
+        except Exception as e:
+            raise SinkException(e)
+
+    async def write_many(self, entities: List[Entity]):
+        try:
+            success, result = await self.client.upsert(entities)
+        except Exception as e:
+            raise SinkException(e)
+        if not success:
+            if "errors" not in result:
+                raise SinkException(
+                    f"Cannot upsert batch of {len(entities)} entities : {result}"
+                )
+            errors = result["errors"]
+            for error in errors:
+                logger.error(
+                    f"Cannot upsert entity {error.get('entityId')} : {error.get('error')}"
+                )
+            report_errors(self.stats, len(errors))
+
+    async def close(self):
+        await self.client.close()
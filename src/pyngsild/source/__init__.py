@@ -15,20 +15,32 @@ Source for NGSI Agents to collect from.
 Sources MUST respect the following protocol :
 Each Source Class is a generator hence MUST implement __iter__().
 Some Sources MAY implement close() if needed to free resources.
+
+AsyncSources are asynchronous generators hence MUST implement __aiter__().
 """
 
+import asyncio
 import glob
 import logging
 import sys
-from collections.abc import Iterable
+from collections import deque
+from collections.abc import Iterable, AsyncIterable
+from concurrent.futures import (
+    ThreadPoolExecutor,
+    ProcessPoolExecutor,
+    Future,
+    wait,
+    FIRST_COMPLETED,
+)
 from dataclasses import dataclass
+from functools import partial
 from itertools import chain, islice
 from os.path import basename
 from pathlib import Path
 from tempfile import SpooledTemporaryFile
-from typing import Any, List, Sequence
+from typing import Any, Callable, Deque, List, Literal, Sequence
 
-from pyngsild.utils.stream import stream_from
+from pyngsild.utils.stream import stream_from, filesize
 from pyngsild.constants import RowFormat
 
 logger = logging.getLogger(__name__)
@@ -62,6 +74,9 @@ class Source(Iterable[Row]):
     """
 
     registered_extensions = {}
+    # json and xml files whose data is above this size once uncompressed are parsed incrementally,
+    # files of unknown size (urls, streams that cannot seek) are loaded into memory
+    stream_threshold: int = 16 * 1024 * 1024
 
     def __init__(self, rows: Sequence[Row]):
         self.rows = rows
@@ -92,7 +107,9 @@ class Source(Iterable[Row]):
         return Source((next(iterator) for _ in range(n)))
 
     @classmethod
-    def from_stream(cls, stream: Iterable[Any], provider: str = "user", fmt = RowFormat.TEXT, **kwargs):
+    def from_stream(
+        cls, stream: Iterable[Any], provider: str = "user", fmt=RowFormat.TEXT, **kwargs
+    ):
         """automatically create the Source from a stream"""
         return SourceStream(stream, provider, fmt, **kwargs)
 
@@ -107,9 +124,15 @@ class Source(Iterable[Row]):
         filename: str,  # str | PathLike
         fp: SpooledTemporaryFile = None,
         provider: str = "user",
-        **kwargs
+        **kwargs,
     ):
-        from .moresources import SourceJson, SourceXml
+        from .moresources import (
+            SourceJson,
+            SourceJsonStream,
+            SourceNdjson,
+            SourceXml,
+            SourceXmlStream,
+        )
 
         binary = False
         klass = None
@@ -129,34 +152,54 @@ class Source(Iterable[Row]):
             klass, binary, kwargs = cls.registered_extensions[ext1]
 
         stream, suffixes = stream_from(filename, fp, binary)
-        ext = suffixes[-1]
+        ext = suffixes[-1] if suffixes else None
 
         if klass:
             return klass(stream, **kwargs)
 
         if ext == "json":
+            if filesize(filename, fp) > cls.stream_threshold:
+                return SourceJsonStream(stream, provider=basename(filename), **kwargs)
             content = stream.read()
+            if fp is None:
+                stream.close()
             return SourceJson(content, provider=basename(filename), **kwargs)
+        if ext in ("jsonl", "ndjson"):
+            return SourceNdjson(stream, provider=basename(filename), **kwargs)
         if ext == "xml":
+            if filesize(filename, fp) > cls.stream_threshold:
+                return SourceXmlStream(stream, provider=basename(filename), **kwargs)
             content = stream.read()
+            if fp is None:
+                stream.close()
             return SourceXml(content, provider=basename(filename), **kwargs)
         return SourceStream(stream, provider=basename(filename), **kwargs)
 
     @classmethod
-    def from_files(cls, filenames: Sequence[str], provider: str = "user", **kwargs):
-        sources = [Source.from_file(f) for f in filenames]
-        return SourceMany(sources)
+    def from_files(
+        cls,
+        filenames: Sequence[str],
+        provider: str = "user",
+        *,
+        workers: int = 0,
+        executor: Literal["thread", "process"] = "thread",
+        ordered: bool = True,
+        **kwargs,
+    ):
+        """create a Source from many files, each file being opened only when reached, see SourceMany"""
+        sources = [partial(Source.from_file, f, **kwargs) for f in filenames]
+        return SourceMany(
+            sources, provider, workers=workers, executor=executor, ordered=ordered
+        )
 
     @classmethod
     def from_glob(cls, pattern: str, provider: str = "user", **kwargs):
-        sources = [Source.from_file(f) for f in glob.glob(pattern)]
-        return SourceMany(sources)
+        return cls.from_files(sorted(glob.glob(pattern)), provider, **kwargs)
 
     @classmethod
     def from_globs(cls, patterns: Sequence[str], provider: str = "user", **kwargs):
-        filenames = chain.from_iterable([glob.glob(p) for p in patterns])
-        sources = [Source.from_file(f) for f in filenames]
-        return SourceMany(sources)
+        filenames = chain.from_iterable([sorted(glob.glob(p)) for p in patterns])
+        return cls.from_files(list(filenames), provider, **kwargs)
 
     @classmethod
     def register_extension(cls, ext: str, src, *, binary: bool = False, **kwargs):
@@ -188,7 +231,11 @@ class Source(Iterable[Row]):
 
 class SourceStream(Source):
     def __init__(
-        self, stream: Iterable[Any], provider: str = "user", fmt: RowFormat | str = RowFormat.TEXT, ignore_header: bool = False
+        self,
+        stream: Iterable[Any],
+        provider: str = "user",
+        fmt: RowFormat | str = RowFormat.TEXT,
+        ignore_header: bool = False,
     ):
         if ignore_header:
             next(stream)
@@ -200,43 +247,162 @@ class SourceStream(Source):
         match self.fmt:
             case RowFormat.JSON:
                 from pyngsild.source.moresources import SourceJson
+
                 for payload in self.stream:
                     yield from SourceJson(payload, self.provider)
+            case RowFormat.NDJSON:
+                from pyngsild.source.moresources import SourceNdjson
+
+                yield from SourceNdjson(self.stream, self.provider)
             case RowFormat.XML:
                 from pyngsild.source.moresources import SourceXml
+
                 for payload in self.stream:
-                    yield from SourceXml(payload, self.provider)                    
+                    yield from SourceXml(payload, self.provider)
             case RowFormat.TEXT | str():
                 for line in self.stream:
-                    yield Row(line.rstrip("\r\n"), self.provider)        
-            case _:           
+                    yield Row(line.rstrip("\r\n"), self.provider)
+            case _:
                 for x in self.stream:
                     yield Row(x, self.provider)
 
-
     def reset(self):
         pass
 
+    def close(self):
+        if hasattr(self.stream, "close"):
+            self.stream.close()
+
 
 class SourceStdin(SourceStream):
     def __init__(self, **kwargs):
         super().__init__(stream=sys.stdin, **kwargs)
 
+    def close(self):
+        pass  # never close the standard input
+
 
 class SourceSingle(SourceStream):
 
-    """A SourceSingle is Source built from a Python single element.
-    """
+    """A SourceSingle is Source built from a Python single element."""
 
-    def __init__(self, row: Any, provider: str = "user", fmt: RowFormat = RowFormat.TEXT, ignore_header: bool = False):
+    def __init__(
+        self,
+        row: Any,
+        provider: str = "user",
+        fmt: RowFormat = RowFormat.TEXT,
+        ignore_header: bool = False,
+    ):
         super().__init__([row], provider, fmt, ignore_header)
 
 
+def _open(src: Source | Callable[[], Source]) -> Source:
+    return src if isinstance(src, Source) else src()
+
+
+def _read_all(src: Source | Callable[[], Source]) -> List[Row]:
+    """open then read a whole source in a worker"""
+    src = _open(src)
+    try:
+        return list(src)
+    finally:
+        src.close()
+
+
 class SourceMany(Source):
-    def __init__(self, sources: Sequence[Source], provider: str = "user"):
+    """A SourceMany chains many sources.
+
+    A source can be given as a factory (a callable returning a Source), in which case it is only created
+    when reached, and closed once consumed : this is how files are handled by from_files() and from_glob().
+
+    When workers is set, sources are opened and read by a pool of workers (threads or processes),
+    at most workers * 2 sources being held in memory at once.
+    Rows are delivered source by source, either in the order of the sources (ordered),
+    or as soon as a source has been read.
+    Rows keep the provider of their own source.
+    """
+
+    def __init__(
+        self,
+        sources: Sequence[Source | Callable[[], Source]],
+        provider: str = "user",
+        *,
+        workers: int = 0,
+        executor: Literal["thread", "process"] = "thread",
+        ordered: bool = True,
+    ):
         self.sources = sources
         self.provider = provider
+        self.workers = workers
+        self.executor = executor
+        self.ordered = ordered
 
     def __iter__(self):
+        if self.workers:
+            yield from self._iter_parallel()
+            return
         for src in self.sources:
-            yield from src
+            src = _open(src)
+            try:
+                yield from src
+            finally:
+                src.close()
+
+    def _iter_parallel(self):
+        Executor = (
+            ProcessPoolExecutor if self.executor == "process" else ThreadPoolExecutor
+        )
+        sources = iter(self.sources)
+        pending: Deque[Future] = deque()
+        with Executor(max_workers=self.workers) as pool:
+            while True:
+                # bound the number of sources held in memory
+                for src in sources:
+                    pending.append(pool.submit(_read_all, src))
+                    if len(pending) >= self.workers * 2:
+                        break
+                if not pending:
+                    break
+                if self.ordered:
+                    done = [pending.popleft()]
+                else:
+                    completed, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    done = [f for f in pending if f in completed]
+                    pending = deque(f for f in pending if f not in completed)
+                for future in done:
+                    yield from future.result()
+
+
+class AsyncSource(AsyncIterable[Row]):
+    """
+    An AsyncSource is an asynchronous pull datasource : any datasource we can asynchronously iterate on.
+
+    One can code its own AsyncSource just by extending AsyncSource, and providing a new Row for each iteration.
+    An AsyncSource can also be built from a synchronous Source, in which case the event loop is given
+    back to other tasks between two rows.
+    """
+
+    def __init__(self, rows: AsyncIterable[Row] | Iterable[Row]):
+        self.rows = rows
+
+    async def __aiter__(self):
+        if isinstance(self.rows, AsyncIterable):
+            async for row in self.rows:
+                yield row
+        else:
+            for row in self.rows:
+                yield row
+                await asyncio.sleep(0)
+
+    @classmethod
+    def from_source(cls, src: Source):
+        """create an AsyncSource from a synchronous Source"""
+        return cls(src)
+
+    def reset(self):
+        if isinstance(self.rows, Source):
+            self.rows.reset()
+
+    async def aclose(self):
+        if isinstance(self.rows, Source):
+            self.rows.close()
@@ -13,21 +13,25 @@ from __future__ import annotations
 from os import PathLike
 
 import sys
+import re
 import time
 import random
 import json
 import operator
 import xmltodict
+import xml.etree.ElementTree as ET
 import pandas as pd
 import openpyxl
+from openpyxl.utils import get_column_letter
 import logging
 
-from typing import TYPE_CHECKING, Callable, List
+from typing import TYPE_CHECKING, Callable, Iterable, List, Literal
 
 if TYPE_CHECKING:
     from _typeshed import SupportsRead
 
 from functools import reduce
+from itertools import chain
 from pathlib import Path
 
 from pyngsild.constants import SupportsJson
@@ -35,6 +39,13 @@ from . import Source, Row
 
 logger = logging.getLogger(__name__)
 
+try:  # use a faster JSON parser if available
+    import orjson
+
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
 
 class SourceSample(Source):
 
@@ -105,6 +116,195 @@ class SourceJson(SourceDict):
         super().__init__(payload, provider, path)
 
 
+class SourceJsonStream(Source):
+    """Read JSON formatted data from a text stream, item by item.
+
+    Unlike SourceJson the document is never fully loaded : the stream is read by chunks,
+    only the items of the array designated by path are decoded, one at a time.
+    Hence memory stays bounded whatever the size of the document.
+    The path syntax is the same as SourceDict : dot-separated keys.
+    """
+
+    def __init__(
+        self,
+        stream: SupportsRead[str],
+        provider: str = "user",
+        path: str = None,
+        chunksize: int = 65536,
+    ):
+        self.stream = stream
+        self.provider = provider
+        self.path = path
+        self.chunksize = chunksize
+
+    def __iter__(self):
+        reader = _JsonReader(self.stream, self.chunksize)
+        for key in self.path.split(".") if self.path else []:
+            reader.seek_key(key)
+        if reader.peek() != "[":
+            yield Row(reader.value(), self.provider)
+            return
+        reader.expect("[")
+        while reader.peek() != "]":
+            yield Row(reader.value(), self.provider)
+            if reader.peek() == ",":
+                reader.expect(",")
+
+    def close(self):
+        self.stream.close()
+
+
+_WHITESPACES = re.compile(r"[ \t\n\r]*")
+_STRUCTURAL = re.compile(r'["{}\[\]]')
+_STRING = re.compile(r'"(?:[^"\\]|\\.)*"', re.DOTALL)
+
+
+class _JsonReader:
+    """A minimal pull parser that reads a JSON text stream by chunks"""
+
+    def __init__(self, stream: SupportsRead[str], chunksize: int):
+        self.stream = stream
+        self.chunksize = chunksize
+        self.decoder = json.JSONDecoder()
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self, size: int = 0) -> bool:
+        if self.eof:
+            return False
+        chunk = self.stream.read(max(size, self.chunksize))
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos :] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """skip whitespaces and return the next character"""
+        while True:
+            self.pos = _WHITESPACES.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                raise ValueError("Unexpected end of JSON document")
+
+    def expect(self, c: str):
+        if self.peek() != c:
+            raise ValueError(
+                f"Expecting '{c}' in JSON document : {self.buf[self.pos:self.pos+32]}"
+            )
+        self.pos += 1
+
+    def value(self):
+        """decode the next JSON value"""
+        self.peek()
+        while True:
+            try:
+                obj, end = self.decoder.raw_decode(self.buf, self.pos)
+                if (
+                    end < len(self.buf) or self.eof
+                ):  # a number may continue in the next chunk
+                    self.pos = end
+                    return obj
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._fill(len(self.buf) - self.pos)  # double the buffer for large values
+
+    def skip_value(self):
+        """move over the next JSON value without decoding it"""
+        if self.peek() not in "{[":
+            self.value()
+            return
+        depth = 0
+        while True:
+            m = _STRUCTURAL.search(self.buf, self.pos)
+            if m is None:
+                self.pos = len(self.buf)
+                if not self._fill():
+                    raise ValueError("Unexpected end of JSON document")
+                continue
+            c = m.group()
+            if c == '"':
+                s = _STRING.match(self.buf, m.start())
+                if s is None:  # string truncated by the end of the chunk
+                    self.pos = m.start()
+                    if not self._fill():
+                        raise ValueError("Unexpected end of JSON document")
+                    continue
+                self.pos = s.end()
+                continue
+            self.pos = m.end()
+            depth += 1 if c in "{[" else -1
+            if depth == 0:
+                return
+
+    def seek_key(self, key: str):
+        """move to the value of the given key of the next JSON object"""
+        self.expect("{")
+        while self.peek() != "}":
+            k = self.value()
+            self.expect(":")
+            if k == key:
+                return
+            self.skip_value()
+            if self.peek() == ",":
+                self.expect(",")
+        raise KeyError(key)
+
+
+class SourceNdjson(Source):
+    """Read JSON Lines (aka NDJSON) formatted data from a stream : one JSON document per line.
+
+    Regular files are read by chunks of lines.
+    Lines are decoded thanks to orjson if installed, else thanks to the standard json module.
+    Blank and invalid lines are skipped and counted.
+    """
+
+    def __init__(
+        self,
+        stream: Iterable[str | bytes],
+        provider: str = "user",
+        chunksize: int = 65536,
+    ):
+        self.stream = stream
+        self.provider = provider
+        self.chunksize = chunksize
+        self.blank: int = 0
+        self.invalid: int = 0
+
+    def __iter__(self):
+        loads = json_loads
+        provider = self.provider
+        for line in self._lines():
+            if not line.strip():
+                self.blank += 1
+                continue
+            try:
+                record = loads(line)
+            except ValueError as e:
+                self.invalid += 1
+                logger.debug(f"Skip invalid line : {e}")
+                continue
+            yield Row(record, provider)
+        if self.invalid:
+            logger.warning(f"{self.provider} : skipped {self.invalid} invalid lines")
+
+    def _lines(self) -> Iterable[str | bytes]:
+        seekable = getattr(self.stream, "seekable", None)
+        if seekable and seekable():  # regular file, won't block
+            return chain.from_iterable(
+                iter(lambda: self.stream.readlines(self.chunksize), [])
+            )
+        return self.stream
+
+    def close(self):
+        if hasattr(self.stream, "close"):
+            self.stream.close()
+
+
 class SourceApi(SourceJson):
     """Read JSON data from the result of a function.
 
@@ -134,30 +334,157 @@ class SourceXml(SourceDict):
         super().__init__(payload, provider, path)
 
 
+class SourceXmlStream(Source):
+    """Read JSON formatted data from a XML stream, element by element.
+
+    Unlike SourceXml the document is never fully loaded : the stream is parsed thanks to iterparse(),
+    each element designated by path is converted to the same dict shape xmltodict produces, then released.
+    Hence memory stays bounded whatever the size of the document.
+    The path syntax is the same as SourceDict : dot-separated tags, starting with the root tag.
+    """
+
+    def __init__(self, stream: SupportsRead, provider: str = "user", path: str = None):
+        self.stream = stream
+        self.provider = provider
+        self.path = path
+
+    def __iter__(self):
+        keys = self.path.split(".") if self.path else None
+        prefixes = {}  # namespace uri => prefix
+        declarations = []  # namespaces declared by the next element
+        stack: List[str] = []  # tags of the current element and its ancestors
+        elems: List[ET.Element] = []
+        xmlns = {}  # element => namespaces declarations as xmltodict attributes
+        for event, obj in ET.iterparse(
+            self.stream, events=("start-ns", "start", "end")
+        ):
+            match event:
+                case "start-ns":
+                    prefix, uri = obj
+                    prefixes[uri] = prefix
+                    declarations.append(
+                        (f"@xmlns:{prefix}" if prefix else "@xmlns", uri)
+                    )
+                case "start":
+                    stack.append(_xml_name(obj.tag, prefixes))
+                    elems.append(obj)
+                    if declarations:
+                        xmlns[obj] = declarations
+                        declarations = []
+                case "end":
+                    if keys is None:
+                        if len(stack) == 1:
+                            yield Row(
+                                {stack[0]: _xml_to_dict(obj, prefixes, xmlns)},
+                                self.provider,
+                            )
+                    elif stack == keys:
+                        yield Row(_xml_to_dict(obj, prefixes, xmlns), self.provider)
+                        self._release(elems, xmlns)
+                    elif stack != keys[: len(stack)] and stack[: len(keys)] != keys:
+                        # neither an ancestor of the path, nor a descendant of a matching element
+                        self._release(elems, xmlns)
+                    stack.pop()
+                    elems.pop()
+
+    def _release(self, elems: List[ET.Element], xmlns: dict):
+        elem = elems[-1]
+        elem.clear()
+        xmlns.pop(elem, None)
+        if len(elems) > 1:
+            elems[-2].remove(elem)
+
+    def close(self):
+        self.stream.close()
+
+
+def _xml_name(name: str, prefixes: dict) -> str:
+    """turn an ElementTree qualified name into a xmltodict name, i.e. {uri}local => prefix:local"""
+    if name[0] != "{":
+        return name
+    uri, local = name[1:].split("}", 1)
+    prefix = prefixes.get(uri)
+    return f"{prefix}:{local}" if prefix else local
+
+
+def _xml_to_dict(elem: ET.Element, prefixes: dict, xmlns: dict):
+    """convert an element the way xmltodict does"""
+    d = {}
+    for k, v in xmlns.get(elem, []):
+        d[k] = v
+    for k, v in elem.attrib.items():
+        d[f"@{_xml_name(k, prefixes)}"] = v
+    for child in elem:
+        key = _xml_name(child.tag, prefixes)
+        value = _xml_to_dict(child, prefixes, xmlns)
+        if key not in d:
+            d[key] = value
+        elif isinstance(d[key], list):
+            d[key].append(value)
+        else:
+            d[key] = [d[key], value]
+    text = "".join([elem.text or ""] + [child.tail or "" for child in elem]).strip()
+    if not d:
+        return text or None
+    if text:
+        d["#text"] = text
+    return d
+
+
 class SourceMicrosoftExcel(Source):
+    """Read rows from a Microsoft Excel worksheet.
+
+    The workbook is opened in read-only mode : rows are streamed from the file, hence memory stays bounded.
+    A file-like object (i.e. a gzip or zip stream) is read as is, without temporary copy.
+
+    Depending on fmt, each record is :
+    - "text" : the cell values joined by a semicolon
+    - "tuple" : the tuple of cell values
+    - "dict" : a dict of cell values, keyed by the header row (the first row after ignored rows)
+    """
+
     def __init__(
         self,
         filename,  # path-like or file-like
         sheetid: int = 0,
         sheetname: str = None,
         ignore: int = 0,
+        fmt: Literal["text", "tuple", "dict"] = "text",
+        read_only: bool = True,
     ):
         logger.debug(f"{filename=}")
-        wb = openpyxl.load_workbook(filename, data_only=True)
-        ws = wb[sheetname] if sheetname else wb.worksheets[sheetid]
-        self.rows = ws.rows
+        self.wb = openpyxl.load_workbook(filename, data_only=True, read_only=read_only)
+        ws = self.wb[sheetname] if sheetname else self.wb.worksheets[sheetid]
+        self.rows = ws.iter_rows(values_only=True)
+        self.fmt = fmt
         if isinstance(filename, str):  # TODO : deal with file
             self.provider = Path(filename).name
         else:
             self.provider = "user"
         for _ in range(ignore):  # skip lines
             next(self.rows)
+        if fmt == "dict":
+            header = next(self.rows)
+            self.header = [
+                str(value) if value is not None else get_column_letter(i + 1)
+                for i, value in enumerate(header)
+            ]
 
     def __iter__(self):
-        for row in self.rows:
-            record = ";".join([str(cell.value) if cell.value else "" for cell in row])
+        for values in self.rows:
+            match self.fmt:
+                case "tuple":
+                    record = values
+                case "dict":
+                    record = dict(zip(self.header, values))
+                case _:
+                    record = ";".join([str(value) if value else "" for value in values])
             logger.debug(f"{self.provider=}{record=}")
             yield Row(record, self.provider)
+        self.close()
+
+    def close(self):
+        self.wb.close()
 
 
 class SourceFunc(Source):
@@ -177,12 +504,79 @@ class SourceFunc(Source):
 
 
 class SourceDataFrame(Source):
-    """A SourceDataFrame takes its incoming data from a pandas DataFrame"""
+    """A SourceDataFrame takes its incoming data from a pandas DataFrame
+
+    By default a Row is emitted for each record of the DataFrame, the record being a namedtuple.
+    When chunksize is set, a Row is emitted for each chunk of chunksize records : the record is a DataFrame slice,
+    or a dict of NumPy arrays (one per column, plus the index) if columnar is set.
+    It allows a processor to build the entities of a whole chunk in a vectorised way, returning a list of entities.
+    The DataFrame can also be an iterable of DataFrames (i.e. the result of read_csv() with chunksize),
+    that is consumed lazily.
+    """
 
-    def __init__(self, df: pd.DataFrame, provider: str = "DataFrame"):
+    def __init__(
+        self,
+        df: pd.DataFrame | Iterable[pd.DataFrame],
+        provider: str = "DataFrame",
+        *,
+        chunksize: int = None,
+        columnar: bool = False,
+    ):
         self.df = df
         self.provider = provider
+        self.chunksize = chunksize
+        self.columnar = columnar
 
     def __iter__(self):
-        for row in self.df.itertuples():
-            yield Row(row, self.provider)
+        frames = [self.df] if isinstance(self.df, pd.DataFrame) else self.df
+        for df in frames:
+            if self.chunksize is None:
+                for row in df.itertuples():
+                    yield Row(row, self.provider)
+                continue
+            for start in range(0, len(df), self.chunksize):
+                chunk = df.iloc[start : start + self.chunksize]
+                if self.columnar:
+                    arrays = {"Index": chunk.index.to_numpy()}
+                    arrays.update({col: chunk[col].to_numpy() for col in chunk.columns})
+                    yield Row(arrays, self.provider)
+                else:
+                    yield Row(chunk, self.provider)
+
+    @classmethod
+    def from_csv(
+        cls,
+        filename: str,
+        chunksize: int = 10000,
+        provider: str = None,
+        columnar: bool = False,
+        **kwargs,
+    ):
+        """lazily read a CSV file by chunks of chunksize records, kwargs are passed to pandas.read_csv()"""
+        reader = pd.read_csv(filename, chunksize=chunksize, **kwargs)
+        return cls(
+            reader,
+            provider or Path(filename).name,
+            chunksize=chunksize,
+            columnar=columnar,
+        )
+
+    @classmethod
+    def from_parquet(
+        cls,
+        filename: str,
+        chunksize: int = 10000,
+        provider: str = None,
+        columnar: bool = False,
+    ):
+        """lazily read a Parquet file by chunks of chunksize records, requires pyarrow"""
+        import pyarrow.parquet as pq
+
+        batches = pq.ParquetFile(filename).iter_batches(batch_size=chunksize)
+        frames = (batch.to_pandas() for batch in batches)
+        return cls(
+            frames,
+            provider or Path(filename).name,
+            chunksize=chunksize,
+            columnar=columnar,
+        )
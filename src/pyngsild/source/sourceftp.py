@@ -10,10 +10,17 @@
 # Author: Fabien BATTELLO <fabien.battello@orange.com> et al.
 
 
+import os
+import json
+import time
+import hashlib
 import logging
+import posixpath
+import threading
 
-from typing import Tuple, List, Callable
-from pyngsild.ftpclient import FtpClient
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from typing import Tuple, List, Callable, Set, BinaryIO, Dict
+from pyngsild.ftpclient import FtpClient, FtpClientException
 
 from . import Source
 
@@ -23,6 +30,73 @@ logger = logging.getLogger(__name__)
 FtpFile = Tuple[str, str]
 
 
+class FtpManifest:
+    """
+    A persistent record of the remote files already processed, stored as a JSON file.
+
+    Each entry is keyed by the remote filename, and records the size, the modification time
+    and the checksum (SHA-256) of the file.
+    An entry is marked incomplete while the file is being downloaded and processed.
+
+    Updates are kept in memory and written to disk by save(), at most every autosave seconds while updating.
+    """
+
+    def __init__(self, filename: str, autosave: float = 10.0):
+        self.filename = filename
+        self.autosave = autosave
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._saved = time.monotonic()
+        try:
+            with open(filename, "r", encoding="utf-8") as f:
+                self.entries: Dict[str, dict] = json.load(f)
+        except FileNotFoundError:
+            self.entries = {}
+
+    def get(self, remote: str) -> dict:
+        return self.entries.get(remote)
+
+    def unchanged(self, remote: str, size: int, mtime: str) -> bool:
+        """return True if the remote file has already been processed, and has not changed since"""
+        entry = self.entries.get(remote)
+        return (
+            entry is not None
+            and entry.get("complete", False)
+            and entry.get("size") == size
+            and entry.get("mtime") == mtime
+        )
+
+    def update(self, remote: str, **info):
+        with self._lock:
+            self.entries[remote] = info
+            self._dirty = True
+            if time.monotonic() - self._saved >= self.autosave:
+                self._save()
+
+    def save(self):
+        with self._lock:
+            if self._dirty:
+                self._save()
+
+    def _save(self):
+        # must be called with the lock held
+        # write to a temp file then rename, so that the manifest is never left half-written
+        tmpname = f"{self.filename}.tmp"
+        with open(tmpname, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f)
+        os.replace(tmpname, self.filename)
+        self._dirty = False
+        self._saved = time.monotonic()
+
+
+def _checksum(filename: str) -> str:
+    h = hashlib.sha256()
+    with open(filename, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
 class SourceFtp(Source):
     """
     A SourceFtp reads data from a given FTP Server.
@@ -34,6 +108,20 @@ class SourceFtp(Source):
     Once the files are downloaded (into a temp dir), the connection to the FTP Server is closed.
     Then the Source reads the downloaded files to deliver rows as usual, by iterating on file records.
     At the end, when the Source is closed, the temp dir is cleaned.
+
+    When workers is set, files are not downloaded at init time but while iterating, by a pool of workers
+    each owning its own FTP connection. Rows are delivered as soon as the first file is downloaded,
+    and each local file is deleted once consumed.
+    When stream is set, rows are read directly from the FTP data connection, without any local file.
+    Zip archives cannot be streamed : they are downloaded then deleted once consumed.
+
+    When manifest is set, the given JSON file records the files already processed : only new or changed files
+    (according to their size and modification time) are fetched, which suits periodic polling.
+    A downloaded file whose checksum has not changed is not processed again.
+    Sizes and modification times are listed once per remote folder (MLSD), or file by file if the server
+    does not support MLSD. The manifest is saved once the files are downloaded and at the end of the iteration.
+    If resume is set, an interrupted download is resumed from where it stopped. It requires a manifest,
+    and a workdir to keep downloaded files across runs.
     """
 
     def __init__(
@@ -46,6 +134,11 @@ class SourceFtp(Source):
         f_match: Callable[[str], bool] = lambda x: False,
         provider: str = "user",
         source_factory=Source.from_file,
+        workers: int = 0,
+        stream: bool = False,
+        manifest: str = None,
+        workdir: str = None,
+        resume: bool = False,
     ):
         """
         Parameters
@@ -54,6 +147,9 @@ class SourceFtp(Source):
             The name of the file containing raw data
         """
 
+        if resume and not (manifest and workdir):
+            raise ValueError("resume requires a manifest and a workdir")
+
         self.host = host
         self.user = user
         self.passwd = passwd
@@ -62,15 +158,37 @@ class SourceFtp(Source):
         self.f_match = f_match
         self.provider = provider
         self.source_factory = source_factory
+        self.workers = workers
+        self.stream = stream
+        self.manifest_file = manifest
+        self.workdir = workdir
+        self.resume = resume
 
         # connect to FTP server
-        self.ftp = FtpClient(host, user, passwd, use_tls)
+        self.ftp = FtpClient(host, user, passwd, use_tls, workdir)
 
         # retrieve a list of files we're interested in
         remote_files = self._retrieve_filelist(paths, f_match)
 
+        # only keep new or changed files
+        self.manifest = FtpManifest(manifest) if manifest else None
+        self.filestats: Dict[
+            str, Tuple[int, str]
+        ] = {}  # remote filename => (size, mtime)
+        if self.manifest:
+            remote_files = self._changed_files(remote_files)
+
+        if workers or stream:  # files will be fetched while iterating
+            self.remote_files = remote_files
+            self.downloaded_files: List[FtpFile] = []
+            self.ftp.close()
+            self.ftp.clean()
+            return
+
         # download files : a list of (local_filename, remote_filename)
         self.downloaded_files: List[FtpFile] = self._download_files(remote_files)
+        if self.manifest:
+            self.manifest.save()
 
         if len(self.downloaded_files) != len(remote_files):
             logger.critical(f"Some files have not been downloaded.")
@@ -79,16 +197,146 @@ class SourceFtp(Source):
         self.ftp.close()
 
     def __iter__(self):
+        try:
+            if self.stream:
+                yield from self._iter_streamed()
+            elif self.workers:
+                yield from self._iter_pipelined()
+            else:
+                yield from self._iter_downloaded()
+        finally:
+            if self.manifest:
+                self.manifest.save()
+
+    def _iter_downloaded(self):
         for ftpfile in self.downloaded_files:
             localname, remotename = ftpfile
             logger.info(f"process local {localname}")
-            provider = (
-                self.provider if self.provider else f"ftp://{self.host}{remotename}"
-            )
-            source = self.source_factory(localname, provider)
-            yield from source
+            yield from self._consume(localname, remotename)
+            if self.workdir:
+                os.remove(localname)
         self.ftp.clean()
 
+    def _consume(self, filename: str, remotename: str, fp: BinaryIO = None):
+        """read a file then record it into the manifest"""
+        checksum = None
+        if fp is None and self.manifest:
+            checksum = _checksum(filename)
+            entry = self.manifest.get(remotename) or {}
+            if checksum == entry.get("checksum"):
+                logger.info(f"skip {remotename} : content has not changed")
+            else:
+                yield from self._read(filename, remotename)
+        else:
+            yield from self._read(filename, remotename, fp)
+        if self.manifest:
+            size, mtime = self.filestats.get(remotename, (None, None))
+            self.manifest.update(
+                remotename, size=size, mtime=mtime, checksum=checksum, complete=True
+            )
+
+    def _download(self, ftp: FtpClient, remote: str) -> FtpFile:
+        resume = False
+        if self.manifest:
+            entry = self.manifest.get(remote) or {}
+            size, mtime = self.filestats.get(remote, (None, None))
+            # resume only if the previous download was interrupted, and the remote file has not changed since
+            resume = (
+                self.resume
+                and not entry.get("complete", True)
+                and entry.get("size") == size
+                and entry.get("mtime") == mtime
+            )
+            self.manifest.update(
+                remote,
+                size=size,
+                mtime=mtime,
+                checksum=entry.get("checksum"),
+                complete=False,
+            )
+        if resume:
+            return ftp.download(remote, resume=True), remote
+        return ftp.download(remote), remote
+
+    def _read(self, filename: str, remotename: str, fp: BinaryIO = None):
+        provider = self.provider if self.provider else f"ftp://{self.host}{remotename}"
+        if fp is None:
+            source = self.source_factory(filename, provider=provider)
+        else:
+            source = self.source_factory(filename, fp=fp, provider=provider)
+        yield from source
+
+    def _iter_pipelined(self):
+        local = threading.local()  # one FTP connection per worker
+        clients: List[FtpClient] = []
+        lock = threading.Lock()
+
+        def download(remote: str) -> FtpFile:
+            if not hasattr(local, "ftp"):
+                local.ftp = FtpClient(
+                    self.host, self.user, self.passwd, self.use_tls, self.workdir
+                )
+                with lock:
+                    clients.append(local.ftp)
+            return self._download(local.ftp, remote)
+
+        remotes = iter(self.remote_files)
+        pending: Set[Future] = set()
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                while True:
+                    # bound the number of files waiting on the local disk
+                    for remote in remotes:
+                        pending.add(pool.submit(download, remote))
+                        if len(pending) >= self.workers * 2:
+                            break
+                    if not pending:
+                        break
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        try:
+                            localname, remotename = future.result()
+                        except Exception as e:
+                            logger.critical(f"Problem while downloading file : {e}")
+                            continue
+                        self.downloaded_files.append((localname, remotename))
+                        logger.info(f"process local {localname}")
+                        try:
+                            yield from self._consume(localname, remotename)
+                        finally:
+                            os.remove(localname)
+        finally:
+            for ftp in clients:
+                try:
+                    ftp.close()
+                except Exception as e:
+                    logger.warning(e)
+                ftp.clean()
+
+    def _iter_streamed(self):
+        ftp = FtpClient(self.host, self.user, self.passwd, self.use_tls, self.workdir)
+        try:
+            for remotename in self.remote_files:
+                if remotename.lower().endswith(
+                    ".zip"
+                ):  # the directory of a zip archive is at its end
+                    yield from self._consume_downloaded(ftp, remotename)
+                    continue
+                logger.info(f"process remote {remotename}")
+                with ftp.open(remotename) as fp:
+                    yield from self._consume(remotename, remotename, fp)
+        finally:
+            ftp.close()
+            ftp.clean()
+
+    def _consume_downloaded(self, ftp: FtpClient, remotename: str):
+        localname, _ = self._download(ftp, remotename)
+        logger.info(f"process local {localname}")
+        try:
+            yield from self._consume(localname, remotename)
+        finally:
+            os.remove(localname)
+
     def _retrieve_filelist(self, paths, f_match=lambda x: True) -> List[str]:
         remote_files = []
         for path in paths:
@@ -97,13 +345,47 @@ class SourceFtp(Source):
         logger.info(f"Found {len(remote_files)} matching files")
         return remote_files
 
+    def _list_stats(self, remote_files: List[str]):
+        """fill filestats with one MLSD listing per remote folder, falling back to a stat per file"""
+        folders: Dict[str, List[str]] = {}
+        for remote in remote_files:
+            folders.setdefault(posixpath.dirname(remote), []).append(remote)
+        mlsd = True
+        for folder, remotes in folders.items():
+            listing = {}
+            if mlsd:
+                try:
+                    listing = self.ftp.stat_dir(folder)
+                except FtpClientException as e:
+                    logger.info(f"{e}, fallback to a stat per file")
+                    mlsd = False  # most likely unsupported by the server
+            for remote in remotes:
+                if (stat := listing.get(posixpath.basename(remote))) is None:
+                    try:
+                        stat = self.ftp.stat(remote)
+                    except Exception as e:
+                        logger.warning(e)
+                        stat = (None, None)
+                self.filestats[remote] = stat
+
+    def _changed_files(self, remote_files: List[str]) -> List[str]:
+        self._list_stats(remote_files)
+        changed_files = []
+        for remote in remote_files:
+            size, mtime = self.filestats[remote]
+            if size is not None and self.manifest.unchanged(remote, size, mtime):
+                continue
+            changed_files.append(remote)
+        logger.info(f"Found {len(changed_files)} new or changed files")
+        return changed_files
+
     def _download_files(self, remote_files: List[str]) -> List[FtpFile]:
-        try:
-            downloaded_files = [
-                (self.ftp.download(remote), remote) for remote in remote_files
-            ]
-        except Exception as e:
-            logger.critical(f"Problem while downloading files : {e}")
+        downloaded_files = []
+        for remote in remote_files:
+            try:
+                downloaded_files.append(self._download(self.ftp, remote))
+            except Exception as e:
+                logger.critical(f"Problem while downloading files : {e}")
         return downloaded_files
 
     def reset(self):
@@ -112,7 +394,13 @@ class SourceFtp(Source):
             self.user,
             self.passwd,
             self.paths,
+            self.use_tls,
             self.f_match,
             self.provider,
             self.source_factory,
+            self.workers,
+            self.stream,
+            self.manifest_file,
+            self.workdir,
+            self.resume,
         )
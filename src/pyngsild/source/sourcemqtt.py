@@ -16,10 +16,16 @@ import logging
 
 from paho.mqtt.client import MQTTMessage
 from queue import SimpleQueue as Queue
-from typing import Union, Sequence, Tuple, Literal
+from typing import Union, Sequence, Tuple, Literal, List
 
 from . import Source, Row, ROW_NOT_SET as QUEUE_EOT
-from pyngsild.utils.mqttclient import MqttClient, MQTT_DEFAULT_PORT
+from pyngsild.utils.mqttclient import (
+    MqttClient,
+    MQTT_DEFAULT_PORT,
+    MQTTv311,
+    MQTTv5,
+    shared_topic,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -31,6 +37,13 @@ class SourceMqtt(Source):
 
     Each time a message is received on the subscribed topic(s), the Source emits a Row composed of the message payload.
     The row provider is set to the topic.
+    The payload is decoded to UTF-8 while iterating, out of the MQTT network thread, or left as bytes if raw is set.
+    Payloads that cannot be decoded are skipped and counted in dropped.
+
+    Several connections to the broker can feed the same pipeline thanks to MQTT shared subscriptions :
+    when share is set, the topics are subscribed as $share/<share>/<topic>, so that the broker load-balances
+    messages among all the subscribers of the group, whether they belong to this agent (clients > 1) or to
+    other replicas. Shared subscriptions default to MQTT 5.
     """
 
     def __init__(
@@ -40,6 +53,10 @@ class SourceMqtt(Source):
         credentials: Tuple[str, str] = (None, None),
         topic: OneOrManyStrings = "#",  # all topics
         qos: Literal[0, 1, 2] = 0,  # no ack
+        raw: bool = False,
+        clients: int = 1,
+        share: str = None,
+        protocol: int = None,
     ):
         """Returns a SourceMqtt instance.
 
@@ -49,14 +66,35 @@ class SourceMqtt(Source):
             credentials (str,str): Username and password used in broker authentication. Defaults to no auth.
             topic (OneOrManyStrings): Topic (or list of topics) to subscribe to. Defaults to "#" (all topics).
             qos (Literal[0, 1, 2]) : QoS : 0, 1 or 2 according to the MQTT protocol. Defaults to 0 (no ack).
+            raw (bool): Deliver payloads as bytes instead of str. Defaults to False.
+            clients (int): Number of connections to the broker. Defaults to 1.
+            share (str): Shared subscription group. Defaults to no sharing, or "pyngsild" if clients > 1.
+            protocol (int): MQTT protocol version (MQTTv311 or MQTTv5). Defaults to MQTTv5 if sharing, else MQTTv311.
 
         """
+        if clients > 1 and share is None:
+            share = "pyngsild"  # otherwise each connection would receive every message
+        if share is not None:
+            topic = shared_topic(topic, share)
+        if protocol is None:
+            protocol = MQTTv5 if share is not None else MQTTv311
         self.topic = topic
+        self.raw = raw
+        self.dropped: int = 0
         self._queue: "Queue[Row]" = Queue()
         user, passwd = credentials
-        self._mcsub: MqttClient = MqttClient(
-            host, port, user, passwd, qos, callback=self._callback
-        )
+        self._clients: List[MqttClient] = [
+            MqttClient(
+                host,
+                port,
+                user,
+                passwd,
+                qos,
+                callback=self._callback,
+                protocol=protocol,
+            )
+            for _ in range(clients)
+        ]
         # install signal hooks
         try:
             signal.signal(signal.SIGINT, self._handle_signal)
@@ -66,18 +104,34 @@ class SourceMqtt(Source):
             logger.warning(e)
 
     def __iter__(self):
-        self._mcsub.subscribe(self.topic)
+        for mqttc in self._clients:
+            mqttc.subscribe(self.topic)
         while True:
             row: Row = self._queue.get(True)
             if row == QUEUE_EOT:  # End Of Transmission
                 logger.info("Received EOT")
                 break
-            yield row
-        self._mcsub.stop()
+            if self.raw:
+                yield row
+                continue
+            try:
+                record = row.record.decode("utf-8")
+            except UnicodeDecodeError:
+                logger.debug(f"Drop message from {row.provider} : invalid UTF-8")
+                self.dropped += 1
+                continue
+            yield Row(record, row.provider)
+        self._stop_clients()
+
+    def _stop_clients(self):
+        for mqttc in self._clients:
+            try:
+                mqttc.stop()
+            except Exception as e:
+                logger.warning(e)
 
     def _callback(self, msg: MQTTMessage):
-        payload = str(msg.payload.decode("utf-8"))
-        self._queue.put(Row(msg.topic, payload))
+        self._queue.put(Row(msg.payload, msg.topic))
 
     def _handle_signal(self, signum, frame):
         """Properly clean resources when a signal is received"""
@@ -89,4 +143,4 @@ class SourceMqtt(Source):
     def close(self):
         """Properly disconnect from MQTT broker and free resources"""
         self._queue.put(QUEUE_EOT)
-        self._mcsub.stop()
+        self._stop_clients()
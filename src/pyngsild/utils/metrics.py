@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+
+# Software Name: pyngsild
+# SPDX-FileCopyrightText: Copyright (c) 2021 Orange
+# SPDX-License-Identifier: Apache 2.0
+#
+# This software is distributed under the Apache 2.0;
+# see the NOTICE file for more details.
+#
+# Author: Fabien BATTELLO <fabien.battello@orange.com> et al.
+
+"""
+Lightweight metrics rendered in the Prometheus text exposition format.
+
+Counters and gauges are usually built at scrape time from the existing counters (Stats, Status).
+Histograms are thread-safe and cheap to update : a bisect and an increment under a lock.
+"""
+
+import threading
+
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+# from 100µs to 10s
+LATENCY_BUCKETS = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+)
+# from 1µs to 10s, as a single row usually goes through a stage in a few microseconds
+STAGE_BUCKETS = (
+    0.000001,
+    0.0000025,
+    0.000005,
+    0.00001,
+    0.000025,
+    0.00005,
+    *LATENCY_BUCKETS,
+)
+SIZE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+Labels = Tuple[Tuple[str, str], ...]
+Sample = Tuple[str, Labels, float]  # (suffix, labels, value)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+
+def _value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    type: str = "untyped"
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+
+    def samples(self) -> Iterable[Sample]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        for suffix, labels, value in self.samples():
+            lines.append(f"{self.name}{suffix}{_labels(labels)} {_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    """A monotonic counter, whose values are given at once, for example at scrape time."""
+
+    type = "counter"
+
+    def __init__(self, name: str, help: str, values: Dict[Labels, float] | float = 0):
+        super().__init__(name, help)
+        self.values = values if isinstance(values, dict) else {(): values}
+
+    def samples(self) -> Iterable[Sample]:
+        suffix = "" if self.name.endswith("_total") else "_total"
+        for labels, value in self.values.items():
+            yield suffix, labels, value
+
+
+class Gauge(Counter):
+    """A value that can go up and down."""
+
+    type = "gauge"
+
+    def samples(self) -> Iterable[Sample]:
+        for labels, value in self.values.items():
+            yield "", labels, value
+
+
+class Histogram(Metric):
+    """A histogram of observed values, optionally partitioned by labels."""
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, help)
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._series: Dict[
+            Tuple[str, ...], List
+        ] = {}  # label values => [bucket counts..., +Inf count, sum]
+
+    def observe(self, value: float, *labelvalues: str):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [0] * (len(self.buckets) + 1) + [
+                    0.0
+                ]
+            series[i] += 1
+            series[-1] += value
+
+    def count(self, *labelvalues: str) -> int:
+        series = self._series.get(labelvalues)
+        return sum(series[:-1]) if series else 0
+
+    def sum(self, *labelvalues: str) -> float:
+        series = self._series.get(labelvalues)
+        return series[-1] if series else 0.0
+
+    def quantile(self, q: float, *labelvalues: str) -> float:
+        """estimate the q-quantile (0 <= q <= 1) by linear interpolation inside the buckets, as PromQL does"""
+        with self._lock:
+            series = list(self._series.get(labelvalues, ()))
+        total = sum(series[:-1])
+        if not total:
+            return float("nan")
+        rank = q * total
+        cumulated = 0
+        for i, n in enumerate(series[:-1]):
+            if n and cumulated + n >= rank:
+                if i == len(self.buckets):  # beyond the last bucket
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i else 0.0
+                return lower + (self.buckets[i] - lower) * (rank - cumulated) / n
+            cumulated += n
+        return self.buckets[-1]
+
+    def samples(self) -> Iterable[Sample]:
+        with self._lock:
+            snapshot = {
+                labelvalues: list(series)
+                for labelvalues, series in self._series.items()
+            }
+        for labelvalues, series in snapshot.items():
+            labels = tuple(zip(self.labelnames, labelvalues))
+            cumulated = 0
+            for bound, n in zip((*self.buckets, float("inf")), series[:-1]):
+                cumulated += n
+                yield "_bucket", labels + (("le", _value(bound)),), cumulated
+            yield "_sum", labels, series[-1]
+            yield "_count", labels, cumulated
+
+
+def render(metrics: Iterable[Metric]) -> str:
+    """render metrics in the Prometheus text format"""
+    return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+class AgentMetrics:
+    """Histograms fed by the agents run by a daemon.
+
+    To keep the overhead low, only one row out of sample is observed in the stage histograms.
+    """
+
+    def __init__(self, sample: int = 16):
+        self.sample = sample
+        self.countdown = (
+            1  # rows left before the next observed one, shared by the successive runs
+        )
+        self.stage_duration = Histogram(
+            "pyngsild_stage_duration_seconds",
+            "Time spent per row in each stage of the pipeline",
+            ["stage"],
+            buckets=STAGE_BUCKETS,
+        )
+        self.batch_rows = Histogram(
+            "pyngsild_batch_rows", "Number of rows per agent run", buckets=SIZE_BUCKETS
+        )
+
+    def collect(self) -> List[Metric]:
+        return [self.stage_duration, self.batch_rows]
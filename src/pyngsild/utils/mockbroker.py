@@ -0,0 +1,370 @@
+#!/usr/bin/env python3
+
+# Software Name: pyngsild
+# SPDX-FileCopyrightText: Copyright (c) 2021 Orange
+# SPDX-License-Identifier: Apache 2.0
+#
+# This software is distributed under the Apache 2.0;
+# see the NOTICE file for more details.
+#
+# Author: Fabien BATTELLO <fabien.battello@orange.com> et al.
+
+"""
+A local NGSI-LD Context Broker stand-in, to benchmark and soak-test sinks without a real broker.
+
+It implements the subset of the NGSI-LD API used by the sinks : entity creation, retrieval and deletion,
+and batch upsert, with the NGSI-LD error codes (ProblemDetails).
+Entities are kept in memory.
+Latency and errors can be injected, and the throughput is accounted.
+
+Usage :
+    python -m pyngsild.utils.mockbroker --port 1026 --latency 0.005 --error-rate 0.01
+"""
+
+import asyncio
+import json
+import random
+import socket
+import logging
+import argparse
+import threading
+import time
+
+from dataclasses import dataclass, field, asdict
+from typing import Dict, List
+
+import uvicorn
+
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse
+
+logger = logging.getLogger(__name__)
+
+NGSILD_PATH = "/ngsi-ld/v1"
+ERRORS = "https://uri.etsi.org/ngsi-ld/errors"
+
+
+def problem_details(type: str, title: str) -> dict:
+    return {"type": f"{ERRORS}/{type}", "title": title}
+
+
+def problem(status: int, type: str, title: str, detail: str = None) -> JSONResponse:
+    """return a ProblemDetails response (RFC 7807) as defined by NGSI-LD"""
+    body = problem_details(type, title)
+    if detail:
+        body["detail"] = detail
+    return JSONResponse(body, status_code=status, media_type="application/json")
+
+
+@dataclass
+class BrokerStats:
+    """Throughput accounting of the mock broker"""
+
+    requests: int = 0
+    entities: int = 0  # entities successfully upserted, by single or batch operations
+    created: int = 0
+    updated: int = 0
+    deleted: int = 0
+    batches: int = 0
+    errors: int = 0  # error responses, and entities failed in a batch
+    injected: int = 0  # errors injected
+    routes: Dict[str, int] = field(default_factory=dict)  # number of requests per route
+    started: float = None  # time of the first request
+    last: float = None  # time of the last request
+
+    @property
+    def elapsed(self) -> float:
+        return self.last - self.started if self.started is not None else 0.0
+
+    @property
+    def rate(self) -> float:
+        """entities per second, from the first to the last request"""
+        return self.entities / self.elapsed if self.elapsed else 0.0
+
+    def to_dict(self) -> dict:
+        return {**asdict(self), "elapsed": self.elapsed, "rate": self.rate}
+
+
+class MockBroker:
+    """An in-memory NGSI-LD broker, as a FastAPI application.
+
+    Each request is delayed by latency seconds, plus a random jitter up to jitter seconds.
+    A ratio error_rate of the requests are answered with a error_status InternalError, without being handled.
+    In a batch upsert, a ratio entity_error_rate of the entities are rejected, resulting in a 207 Multi-Status.
+    seed makes the injected errors reproducible.
+
+    The statistics are available in stats, or at the /mock/stats endpoint (DELETE to reset them).
+    The broker can be served in a background thread (see serve()), or used directly through its app.
+    """
+
+    def __init__(
+        self,
+        *,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        error_status: int = 500,
+        entity_error_rate: float = 0.0,
+        seed: int = None,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.entity_error_rate = entity_error_rate
+        self.entities: Dict[str, dict] = {}
+        self.stats = BrokerStats()
+        self._random = random.Random(seed)
+        self._server: uvicorn.Server = None
+        self._thread: threading.Thread = None
+        self.app = FastAPI()
+        self._routes()
+
+    async def _enter(self, route: str) -> Response:
+        """account for the request, apply latency, and return an error response if one is injected"""
+        stats = self.stats
+        stats.requests += 1
+        stats.routes[route] = stats.routes.get(route, 0) + 1
+        if stats.started is None:
+            stats.started = time.perf_counter()
+        delay = self.latency + (
+            self._random.uniform(0, self.jitter) if self.jitter else 0.0
+        )
+        if delay:
+            await asyncio.sleep(delay)
+        stats.last = time.perf_counter()
+        if self.error_rate and self._random.random() < self.error_rate:
+            stats.injected += 1
+            stats.errors += 1
+            return problem(self.error_status, "InternalError", "Injected error")
+        return None
+
+    def _error(
+        self, status: int, type: str, title: str, detail: str = None
+    ) -> JSONResponse:
+        self.stats.errors += 1
+        return problem(status, type, title, detail)
+
+    def _routes(self):
+        app = self.app
+
+        @app.get(f"{NGSILD_PATH}/entities")
+        @app.get(f"{NGSILD_PATH}/entities/")
+        async def query(
+            type: str = None, limit: int = 20, offset: int = 0, count: bool = False
+        ):
+            if error := await self._enter("query"):
+                return error
+            types = type.split(",") if type else None
+            found = [
+                e
+                for e in self.entities.values()
+                if types is None or e.get("type") in types
+            ]
+            headers = {"NGSILD-Results-Count": str(len(found))} if count else {}
+            return JSONResponse(
+                found[offset : offset + limit],
+                headers=headers,
+                media_type="application/ld+json",
+            )
+
+        @app.post(f"{NGSILD_PATH}/entities")
+        @app.post(f"{NGSILD_PATH}/entities/")
+        async def create(request: Request):
+            if error := await self._enter("create"):
+                return error
+            try:
+                entity = json.loads(await request.body())
+            except ValueError as e:
+                return self._error(400, "InvalidRequest", "Invalid JSON", str(e))
+            if (
+                not isinstance(entity, dict)
+                or "id" not in entity
+                or "type" not in entity
+            ):
+                return self._error(
+                    400,
+                    "BadRequestData",
+                    "Bad request data",
+                    "An entity must have an id and a type",
+                )
+            if entity["id"] in self.entities:
+                return self._error(
+                    409, "AlreadyExists", "Entity already exists", entity["id"]
+                )
+            self.entities[entity["id"]] = entity
+            self.stats.created += 1
+            self.stats.entities += 1
+            return Response(
+                status_code=201,
+                headers={"Location": f"{NGSILD_PATH}/entities/{entity['id']}"},
+            )
+
+        @app.get(NGSILD_PATH + "/entities/{eid}")
+        async def retrieve(eid: str):
+            if error := await self._enter("retrieve"):
+                return error
+            if eid not in self.entities:
+                return self._error(404, "ResourceNotFound", "Entity not found", eid)
+            return JSONResponse(self.entities[eid], media_type="application/ld+json")
+
+        @app.delete(NGSILD_PATH + "/entities/{eid}")
+        async def delete(eid: str):
+            if error := await self._enter("delete"):
+                return error
+            if self.entities.pop(eid, None) is None:
+                return self._error(404, "ResourceNotFound", "Entity not found", eid)
+            self.stats.deleted += 1
+            return Response(status_code=204)
+
+        @app.post(f"{NGSILD_PATH}/entityOperations/upsert")
+        @app.post(f"{NGSILD_PATH}/entityOperations/upsert/")
+        async def batch_upsert(request: Request):
+            if error := await self._enter("batch_upsert"):
+                return error
+            try:
+                entities = json.loads(await request.body())
+            except ValueError as e:
+                return self._error(400, "InvalidRequest", "Invalid JSON", str(e))
+            if not isinstance(entities, list):
+                return self._error(
+                    400,
+                    "BadRequestData",
+                    "Bad request data",
+                    "Expected an array of entities",
+                )
+            self.stats.batches += 1
+            return self._upsert(entities)
+
+        @app.get("/mock/stats")
+        async def get_stats():
+            return self.stats.to_dict()
+
+        @app.delete("/mock/stats", status_code=204)
+        async def reset_stats():
+            self.stats = BrokerStats()
+
+    def _upsert(self, entities: List[dict]) -> Response:
+        created: List[str] = []
+        updated: List[str] = []
+        errors: List[dict] = []
+        for entity in entities:
+            eid = entity.get("id") if isinstance(entity, dict) else None
+            if eid is None or "type" not in entity:
+                errors.append(
+                    {
+                        "entityId": eid,
+                        "error": problem_details("BadRequestData", "Bad request data"),
+                    }
+                )
+                continue
+            if (
+                self.entity_error_rate
+                and self._random.random() < self.entity_error_rate
+            ):
+                self.stats.injected += 1
+                errors.append(
+                    {
+                        "entityId": eid,
+                        "error": problem_details("InternalError", "Injected error"),
+                    }
+                )
+                continue
+            (updated if eid in self.entities else created).append(eid)
+            self.entities[eid] = entity
+        self.stats.created += len(created)
+        self.stats.updated += len(updated)
+        self.stats.entities += len(created) + len(updated)
+        self.stats.errors += len(errors)
+        if errors:
+            return JSONResponse(
+                {"success": created + updated, "errors": errors}, status_code=207
+            )
+        if created:
+            return JSONResponse(created, status_code=201)
+        return Response(status_code=204)
+
+    def serve(self, host: str = "127.0.0.1", port: int = 0) -> "MockBroker":
+        """serve the broker in a background thread, port 0 picks a free port (see the port attribute)"""
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        # inherited by the accepted connections : responses are written in two parts (headers then body),
+        # which would otherwise be delayed by the Nagle algorithm
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.bind((host, port))
+        self.host, self.port = sock.getsockname()[:2]
+        config = uvicorn.Config(
+            app=self.app, log_level="warning", loop="asyncio", lifespan="off"
+        )
+        self._server = uvicorn.Server(config)
+        self._thread = threading.Thread(
+            target=self._server.run, kwargs={"sockets": [sock]}, daemon=True
+        )
+        self._thread.start()
+        while not self._server.started:
+            if not self._thread.is_alive():
+                raise RuntimeError(f"Cannot serve the mock broker on {host}:{port}")
+            time.sleep(0.01)
+        logger.info(f"mock broker listening on {self.host}:{self.port}")
+        return self
+
+    def close(self):
+        if self._server is not None:
+            self._server.should_exit = True
+            self._thread.join()
+            self._server = None
+
+    def __enter__(self):
+        if self._server is None:
+            self.serve()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="A local NGSI-LD Context Broker stand-in"
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1026)
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="delay of each request, in seconds"
+    )
+    parser.add_argument(
+        "--jitter",
+        type=float,
+        default=0.0,
+        help="maximum random delay added, in seconds",
+    )
+    parser.add_argument(
+        "--error-rate", type=float, default=0.0, help="ratio of requests failing"
+    )
+    parser.add_argument(
+        "--error-status",
+        type=int,
+        default=500,
+        help="status code of the failing requests",
+    )
+    parser.add_argument(
+        "--entity-error-rate",
+        type=float,
+        default=0.0,
+        help="ratio of entities failing in a batch",
+    )
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    broker = MockBroker(
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        entity_error_rate=args.entity_error_rate,
+        seed=args.seed,
+    )
+    uvicorn.run(broker.app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -13,9 +13,15 @@ import time
 import logging
 
 from paho.mqtt import client as pahoclient
-from paho.mqtt.client import MQTTMessage, MQTTMessageInfo, MQTT_ERR_SUCCESS
+from paho.mqtt.client import (
+    MQTTMessage,
+    MQTTMessageInfo,
+    MQTT_ERR_SUCCESS,
+    MQTTv311,
+    MQTTv5,
+)
 from shortuuid import uuid
-from typing import Any, Callable, Literal
+from typing import Any, Callable, Literal, Sequence
 
 from pyngsild.__init__ import __version__
 
@@ -33,6 +39,13 @@ MQTT_CONNECT_RC = [
 ]
 
 
+def shared_topic(topic: str | Sequence[str], group: str) -> str | list[str]:
+    """return the shared subscription topic(s) : messages are load-balanced among the subscribers of the group"""
+    if isinstance(topic, str):
+        return f"$share/{group}/{topic}"
+    return [f"$share/{group}/{t}" for t in topic]
+
+
 class MqttError(Exception):
     pass
 
@@ -54,6 +67,7 @@ class MqttClient:
         passwd: str = None,
         qos: Literal[0, 1, 2] = 0,
         callback: Callable[[MQTTMessage], None] = None,
+        protocol: int = MQTTv311,
     ):
         self.host = host
         self.port = port
@@ -61,13 +75,14 @@ class MqttClient:
         self.passwd = passwd
         self.qos = qos
         self.callback = callback
+        self.protocol = protocol
         self.id = f"pyngsild-{__version__}-mqtt-client-{uuid()}"
         self._connect()
         self.start()
         logger.info(f"Created MqttClient instance {self.id}")
 
     def _connect(self):
-        self._client = pahoclient.Client(self.id)
+        self._client = pahoclient.Client(self.id, protocol=self.protocol)
         # plug callbacks
         self._client.on_connect = self._on_connect
         self._client.on_message = self._on_message
@@ -88,14 +103,18 @@ class MqttClient:
             raise MqttNotConnectedError()
         self._client.disconnect()
 
-    def subscribe(self, topic: str):
+    def subscribe(self, topic: str | Sequence[str]):
         if self._client is None:
             raise MqttNotConnectedError()
-        rc, mid = self._client.subscribe(topic, qos=self.qos)
-        if rc == MQTT_ERR_SUCCESS:
-            logger.info(f"[{self.id}][#{mid}] Subscribed to topic {topic}")
-        else:
-            logger.error(f"[{self.id}][#{mid}] Failed to subscribe to topic {topic}")
+        topics = [topic] if isinstance(topic, str) else topic
+        for topic in topics:
+            rc, mid = self._client.subscribe(topic, qos=self.qos)
+            if rc == MQTT_ERR_SUCCESS:
+                logger.info(f"[{self.id}][#{mid}] Subscribed to topic {topic}")
+            else:
+                logger.error(
+                    f"[{self.id}][#{mid}] Failed to subscribe to topic {topic}"
+                )
 
     def unsubscribe(self, topic: str):
         if self._client is None:
@@ -123,19 +142,23 @@ class MqttClient:
             )
             return False
 
-    def _on_connect(self, client: pahoclient, userdata: Any, flags: dict, rc: int):
+    def _on_connect(
+        self, client: pahoclient, userdata: Any, flags: dict, rc: int, properties=None
+    ):
+        rc = getattr(rc, "value", rc)  # MQTT5 reason code
         if rc == 0:
             logger.info(f"[{self.id}]Connected to MQTT broker !")
         elif rc < 6:
-            raise MqttConnectionError(MQTT_CONNECT_RC)
+            raise MqttConnectionError(MQTT_CONNECT_RC[rc])
         else:
             raise MqttConnectionError(6)
 
     def _on_message(self, client: pahoclient, userdata: Any, msg: MQTTMessage):
-        payload = str(msg.payload.decode("utf-8"))
-        logger.debug(
-            f"[{self.id}][#{msg.mid}] Received message {payload} from {msg.topic}"
-        )
+        # runs on the network thread : keep it as cheap as possible, the payload is left undecoded
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                f"[{self.id}][#{msg.mid}] Received message {msg.payload!r} from {msg.topic}"
+            )
         if self.callback:
             self.callback(msg)
 
@@ -145,18 +168,25 @@ class MqttClient:
     def _on_log(self, client: pahoclient, userdata: Any, level, buf):
         logger.trace(f"[{self.id}] {buf}")
 
-    def _on_disconnect(self, client: pahoclient, userdata: Any, rc: int):
+    def _on_disconnect(
+        self, client: pahoclient, userdata: Any, rc: int, properties=None
+    ):
         if rc == MQTT_ERR_SUCCESS:
             logger.info(f"[{self.id}] Disconnected from MQTT broker")
         else:
             logger.warning(f"[{self.id}] Failed to disconnect from MQTT broker : {rc=}")
 
     def _on_subscribe(
-        self, client: pahoclient, userdata: Any, mid: int, granted_qos: int
+        self,
+        client: pahoclient,
+        userdata: Any,
+        mid: int,
+        granted_qos: int,
+        properties=None,
     ):
         logger.info(f"[{self.id}][#{mid}] Brocker acked subscription")
 
-    def _on_unsubscribe(self, client: pahoclient, userdata: Any, mid: int):
+    def _on_unsubscribe(self, client: pahoclient, userdata: Any, mid: int, *args):
         logger.info(f"[{self.id}][#{mid}] Brocker acked unsubscription")
 
     def start(self):
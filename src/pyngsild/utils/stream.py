@@ -10,11 +10,14 @@
 # Author: Fabien BATTELLO <fabien.battello@orange.com> et al.
 
 import gzip
+import io
+import os
+import struct
 import logging
 import urllib.request
 
 from typing import Any
-from zipfile import ZipFile
+from zipfile import ZipFile, BadZipFile
 from io import StringIO, TextIOWrapper
 from pathlib import Path
 from tempfile import SpooledTemporaryFile
@@ -70,3 +73,46 @@ def stream_from(
                     return TextIOWrapper(fp, encoding="utf-8"), suffixes
     except Exception as e:
         logger.error(f"Cannot open file {filename} : {e}")
+
+
+def filesize(filename: str, fp: SpooledTemporaryFile = None) -> int:
+    """return the size of the data of a local file, or of a seekable file object, once uncompressed, 0 if unknown
+
+    The size of a gzip file is read from its trailer, the size of a zip archive from its directory.
+    """
+    if fp is None and isurl(filename):
+        return 0
+    if isinstance(fp, SpooledTemporaryFile):
+        fp = fp._file
+    ext = Path(filename).suffix
+    try:
+        if ext == ".zip":
+            with ZipFile(
+                filename if fp is None else fp
+            ) as zf:  # a file object given is left open
+                return zf.infolist()[0].file_size
+        if fp is None and ext != ".gz":
+            return os.path.getsize(filename)
+        f = open(filename, "rb") if fp is None else fp
+        try:
+            position = f.tell()
+            size = f.seek(0, os.SEEK_END)
+            if (
+                ext == ".gz"
+            ):  # the trailer holds the size modulo 4 GiB, hence never less than the compressed size
+                f.seek(-4, os.SEEK_END)
+                size = max(size, struct.unpack("<I", f.read(4))[0])
+            f.seek(position)
+        finally:
+            if fp is None:
+                f.close()
+        return size
+    except (
+        OSError,
+        ValueError,
+        IndexError,
+        BadZipFile,
+        io.UnsupportedOperation,
+        struct.error,
+    ):
+        return 0
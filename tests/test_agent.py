@@ -9,11 +9,13 @@
 #
 # Author: Fabien BATTELLO <fabien.battello@orange.com> et al.
 
+import pytest
+
 from typing import List
 
 from ngsildclient import Entity
 
-from pyngsild.source import Row
+from pyngsild.source import Row, Source
 from pyngsild.source.moresources import SourceSample
 from pyngsild.sink import Sink, SinkNull
 from pyngsild.agent import Agent
@@ -75,3 +77,145 @@ def test_agent_with_side_effect(mocker):
     agent.close()
     assert sink.write.call_count == 10
     assert agent.stats == Stats(5, 5, 5, 0, 0, 5)
+
+
+def test_agent_empty_list(mocker):
+    def build_entities(row: Row) -> List[Entity]:
+        room, *_ = row.record.split(";")
+        return [] if room in ("Room2", "Room4") else [build_sample_entity(row), None]
+
+    src = SourceSample(count=5, delay=0)
+    sink = SinkNull()
+    mocker.spy(sink, "write")
+    agent = Agent(src, sink, build_entities)
+    agent.run()
+    agent.close()
+    assert sink.write.call_count == 3
+    assert agent.stats == Stats(
+        5, 3, 3, 5, 0
+    )  # 2 empty lists and 3 None items filtered
+
+
+def build_odd_entity(row: Row) -> Entity:
+    room, *_ = row.record.split(";")
+    if room in ("Room2", "Room4"):
+        return None  # filtered
+    if room == "Room3":
+        raise ValueError("bad room")
+    return build_sample_entity(row)
+
+
+def test_agent_parallel_threads(mocker):
+    src = SourceSample(count=5, delay=0)
+    sink = SinkNull()
+    mocker.spy(sink, "write")
+    agent = Agent(src, sink, build_sample_entity, workers=4, chunksize=2)
+    agent.run()
+    agent.close()
+    assert sink.write.call_count == 5
+    assert agent.stats == Stats(5, 5, 5, 0, 0)
+
+
+def test_agent_parallel_ordered():
+    src = Source([Row(f"Room{i};20;700") for i in range(100)])
+    sink = SinkNull()
+    written = []
+    sink.write = written.append
+    agent = Agent(src, sink, build_sample_entity, workers=4, chunksize=3)
+    agent.run()
+    assert [Entity.from_json(x).id for x in written] == [
+        f"urn:ngsi-ld:RoomTemperatureObserved:Room{i}" for i in range(100)
+    ]
+    assert agent.stats == Stats(100, 100, 100, 0, 0)
+
+
+def test_agent_parallel_unordered():
+    src = Source([Row(f"Room{i};20;700") for i in range(100)])
+    sink = SinkNull()
+    written = []
+    sink.write = written.append
+    agent = Agent(src, sink, build_sample_entity, workers=4, chunksize=3, ordered=False)
+    agent.run()
+    assert len(written) == 100
+    assert agent.stats == Stats(100, 100, 100, 0, 0)
+
+
+def test_agent_parallel_processes():
+    src = Source([Row(f"Room{i};20;700") for i in range(1, 6)])
+    sink = SinkNull()
+    written = []
+    sink.write = written.append
+    agent = Agent(
+        src, sink, build_odd_entity, workers=2, executor="process", chunksize=2
+    )
+    agent.run()
+    assert len(written) == 2
+    assert agent.stats == Stats(5, 2, 2, 2, 1)
+
+
+def test_agent_hooks():
+    src = Source([Row(f"Room{i};20;700") for i in range(1, 6)])
+    calls = {"row": [], "entity": [], "error": [], "batch": []}
+    agent = Agent(
+        src,
+        SinkNull(),
+        build_odd_entity,
+        on_row=lambda row: calls["row"].append(row.record),
+        on_entity=lambda row, e: calls["entity"].append(row.record),
+        on_error=lambda row, e: calls["error"].append((row.record, str(e))),
+        on_batch=lambda stats, timings: calls["batch"].append(stats),
+    )
+    agent.run()
+    assert len(calls["row"]) == 5
+    assert calls["entity"] == ["Room1;20;700", "Room5;20;700"]
+    assert calls["error"] == [("Room3;20;700", "bad room")]
+    assert calls["batch"] == [Stats(5, 2, 2, 2, 1)]
+
+
+def test_agent_parallel_hooks():
+    src = Source([Row(f"Room{i};20;700") for i in range(1, 6)])
+    errors = []
+    agent = Agent(
+        src,
+        SinkNull(),
+        build_odd_entity,
+        workers=2,
+        chunksize=2,
+        on_error=lambda row, e: errors.append(row),
+    )
+    agent.run()
+    assert errors == [Row("Room3;20;700")]
+    assert agent.timings.process > 0
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_agent_on_row_error(workers):
+    def on_row(row: Row):
+        if row.record.startswith("Room2"):
+            raise ValueError("bad hook")
+
+    src = Source([Row(f"Room{i};20;700") for i in range(1, 6)])
+    errors = []
+    agent = Agent(
+        src,
+        SinkNull(),
+        build_sample_entity,
+        workers=workers,
+        chunksize=2,
+        on_row=on_row,
+        on_error=lambda row, e: errors.append((row.record, str(e))),
+    )
+    agent.run()  # the failing row is skipped
+    assert errors == [("Room2;20;700", "bad hook")]
+    assert agent.stats == Stats(5, 4, 4, 0, 1)
+
+
+def test_agent_profile():
+    src = SourceSample(count=32, delay=0)
+    agent = Agent(src, SinkNull(), build_sample_entity)
+    agent.run()
+    profile = agent.profile()
+    for stage in ("source", "process", "sink"):
+        assert profile[stage]["count"] == 2  # one row out of 16
+        assert profile[stage]["total"] > 0
+        assert 0 < profile[stage]["p50"] <= profile[stage]["p99"]
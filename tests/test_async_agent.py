@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+
+# Software Name: pyngsild
+# SPDX-FileCopyrightText: Copyright (c) 2021 Orange
+# SPDX-License-Identifier: Apache 2.0
+#
+# This software is distributed under the Apache 2.0;
+# see the NOTICE file for more details.
+#
+# Author: Fabien BATTELLO <fabien.battello@orange.com> et al.
+
+import anyio
+import pytest
+
+from typing import List
+
+from pyngsild.source import Row, AsyncSource
+from pyngsild.source.moresources import SourceSample
+from pyngsild.sink import AsyncSink, SinkNull
+from pyngsild.sink.ngsi import AsyncSinkNgsi
+from pyngsild.agent import AsyncAgent
+from pyngsild.agent.stats import Stats
+from pyngsild.agent.processor import build_sample_entity
+
+
+class AsyncSinkList(AsyncSink):
+    def __init__(self):
+        self.msgs = []
+        self.batches = 0
+
+    async def write(self, msg):
+        await anyio.sleep(0)
+        self.msgs.append(msg)
+
+    async def write_many(self, msgs: List):
+        self.batches += 1
+        await super().write_many(msgs)
+
+
+@pytest.fixture
+def mock_async_client(mocker):
+    client = mocker.patch("pyngsild.sink.ngsi.AsyncClient").return_value
+    client.upsert = mocker.AsyncMock(return_value=(True, {}))
+    client.close = mocker.AsyncMock()
+    return client
+
+
+async def arows(n: int):
+    for i in range(n):
+        yield Row(f"Room{i};20;700", "async")
+
+
+def test_async_source():
+    async def collect():
+        return [row async for row in AsyncSource(arows(3))]
+
+    rows = anyio.run(collect)
+    assert rows == [Row(f"Room{i};20;700", "async") for i in range(3)]
+
+
+def test_async_agent():
+    sink = AsyncSinkList()
+    agent = AsyncAgent(AsyncSource(arows(10)), sink, build_sample_entity, concurrency=4)
+    anyio.run(agent.run)
+    assert len(sink.msgs) == 10
+    assert agent.stats == Stats(10, 10, 10, 0, 0)
+
+
+def test_async_agent_batch():
+    sink = AsyncSinkList()
+    agent = AsyncAgent(
+        SourceSample(count=5, delay=0), sink, build_sample_entity, batch_size=2
+    )
+    anyio.run(agent.run)
+    assert len(sink.msgs) == 5
+    assert sink.batches == 2  # the last entity is written alone
+    assert agent.stats == Stats(5, 5, 5, 0, 0)
+
+
+def test_async_agent_empty_list():
+    sink = AsyncSinkList()
+    agent = AsyncAgent(
+        AsyncSource(arows(4)),
+        sink,
+        lambda row: [] if row.record.startswith("Room0") else [row.record],
+    )
+    anyio.run(agent.run)
+    assert len(sink.msgs) == 3
+    assert agent.stats == Stats(4, 3, 3, 1, 0)
+
+
+def test_async_agent_hooks(mocker):
+    sink = AsyncSinkList()
+    sink.write = mocker.AsyncMock(side_effect=[None, IOError("write failed")])
+    entities, errors = [], []
+    agent = AsyncAgent(
+        AsyncSource(arows(3)),
+        sink,
+        lambda row: None
+        if row.record.startswith("Room2")
+        else build_sample_entity(row),
+        on_entity=lambda row, e: entities.append(row.record),
+        on_error=lambda row, e: errors.append((row.record, str(e))),
+    )
+    anyio.run(agent.run)
+    assert entities == ["Room0;20;700"]
+    assert errors == [("Room1;20;700", "write failed")]
+
+
+def test_async_agent_side_effect_error():
+    def side_effect(row: Row, sink: AsyncSink, entity) -> int:
+        if row.record.startswith("Room1"):
+            raise ValueError("bad side effect")
+        return 1
+
+    errors = []
+    agent = AsyncAgent(
+        AsyncSource(arows(3)),
+        AsyncSinkList(),
+        build_sample_entity,
+        side_effect,
+        on_error=lambda row, e: errors.append((row.record, str(e))),
+    )
+    anyio.run(agent.run)
+    assert errors == [("Room1;20;700", "bad side effect")]
+    assert agent.stats == Stats(3, 3, 3, 0, 1, 2)
+
+
+def test_async_agent_sync_sink(mocker):
+    sink = SinkNull()
+    mocker.spy(sink, "write")
+    agent = AsyncAgent(SourceSample(count=5, delay=0), sink, build_sample_entity)
+    anyio.run(agent.run)
+    assert sink.write.call_count == 5
+    assert agent.stats == Stats(5, 5, 5, 0, 0)
+
+
+def test_async_sink_ngsi(mock_async_client):
+    sink = AsyncSinkNgsi()
+    agent = AsyncAgent(SourceSample(count=5, delay=0), sink, build_sample_entity)
+    anyio.run(agent.run)
+    anyio.run(sink.close)
+    assert mock_async_client.upsert.await_count == 5
+    assert agent.stats == Stats(5, 5, 5, 0, 0)
+
+
+def test_async_sink_ngsi_batch_errors(mock_async_client):
+    mock_async_client.upsert.return_value = (
+        False,
+        {
+            "success": [],
+            "errors": [
+                {"entityId": "urn:ngsi-ld:RoomTemperatureObserved:Room1", "error": {}}
+            ],
+        },
+    )
+    sink = AsyncSinkNgsi()
+    agent = AsyncAgent(
+        SourceSample(count=2, delay=0), sink, build_sample_entity, batch_size=2
+    )
+    anyio.run(agent.run)
+    assert mock_async_client.upsert.await_count == 1
+    assert agent.stats == Stats(2, 2, 1, 0, 1)
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+
+# Software Name: pyngsild
+# SPDX-FileCopyrightText: Copyright (c) 2021 Orange
+# SPDX-License-Identifier: Apache 2.0
+#
+# This software is distributed under the Apache 2.0;
+# see the NOTICE file for more details.
+#
+# Author: Fabien BATTELLO <fabien.battello@orange.com> et al.
+
+import asyncio
+import time
+
+from pyngsild.agent.bg import ManagedDaemon
+from pyngsild.agent.stats import Stats
+from pyngsild.source import Source, Row
+from pyngsild.sink import AsyncSink, SinkNull
+
+
+class AsyncSinkList(AsyncSink):
+    def __init__(self):
+        self.msgs = []
+
+    async def write(self, msg):
+        self.msgs.append(msg)
+
+
+def test_trigger_offloaded():
+    running = []
+
+    def slow(row: Row):
+        running.append(daemon.status.running)
+        time.sleep(0.1)
+        return row.record
+
+    daemon = ManagedDaemon(SinkNull(), slow, workers=2)
+
+    async def main() -> int:
+        ticks = 0
+
+        async def heartbeat():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        task = asyncio.create_task(heartbeat())
+        await asyncio.gather(*(daemon.trigger(Source([Row(f"{i}")])) for i in range(4)))
+        task.cancel()
+        return ticks
+
+    ticks = asyncio.run(main())
+    assert ticks >= 10  # the event loop has kept running
+    assert max(running) == 2  # 4 runs for 2 workers
+    assert daemon.stats == Stats(4, 4, 4, 0, 0)
+    assert (daemon.status.success, daemon.status.pending, daemon.status.running) == (
+        4,
+        0,
+        0,
+    )
+
+
+def test_trigger_async_sink():
+    sink = AsyncSinkList()
+    daemon = ManagedDaemon(sink)
+    asyncio.run(daemon.trigger(Source([Row("a"), Row("b")])))
+    assert sink.msgs == ["a", "b"]
+    assert daemon.stats == Stats(2, 2, 2, 0, 0)
+
+
+def test_trigger_after_shutdown():
+    daemon = ManagedDaemon(SinkNull())
+    daemon._shutdown_executor()
+    assert asyncio.run(daemon.trigger(Source([Row("a")]))) is None
+    assert (daemon.status.errors, daemon.status.pending) == (1, 0)
@@ -9,11 +9,13 @@
 #
 # Author: Fabien BATTELLO <fabien.battello@orange.com> et al.
 
+import ftplib
+import socket
 import pytest
 import logging
 
 from os.path import basename
-from pyngsild.ftpclient import FtpClient
+from pyngsild.ftpclient import FtpClient, FtpClientException
 
 logger = logging.getLogger(__name__)
 
@@ -64,3 +66,71 @@ def test_download(mock_ftp):
         read_data = f.read()
     assert read_data == "1;23.0;720"
     ftp.clean()
+
+
+def test_open(mock_ftp, mocker):
+    left, right = socket.socketpair()
+    right.sendall(b"1;23.0;720\n2;21.0;711\n")
+    right.close()
+    mocker.patch("ftplib.FTP.voidcmd")
+    mocker.patch("ftplib.FTP.transfercmd", return_value=left)
+    mocker.patch("ftplib.FTP.voidresp")
+    ftp = FtpClient("ftp.ncdc.noaa.gov")
+    with ftp.open("/pub/data/noaa/2018/166220-99999-2018") as f:
+        read_data = f.read()
+    assert read_data == b"1;23.0;720\n2;21.0;711\n"
+    assert ftplib.FTP.voidresp.call_count == 1
+    ftp.close()
+    ftp.clean()
+
+
+def test_stat(mock_ftp, mocker):
+    mocker.patch(
+        "ftplib.FTP.sendcmd",
+        return_value="250-Listing\n modify=20190101120000;size=1234;type=file; /pub/data/noaa/2019/166220-99999-2019.gz\n250 End",
+    )
+    ftp = FtpClient("ftp.ncdc.noaa.gov")
+    assert ftp.stat("/pub/data/noaa/2019/166220-99999-2019.gz") == (
+        1234,
+        "20190101120000",
+    )
+    ftp.close()
+    ftp.clean()
+
+
+def test_stat_dir(mock_ftp, mocker):
+    mocker.patch(
+        "ftplib.FTP.mlsd",
+        return_value=[
+            ("2019", {"type": "dir", "modify": "20190101120000"}),
+            (
+                "166220-99999-2019.gz",
+                {"type": "file", "size": "1234", "modify": "20190101120000.123"},
+            ),
+        ],
+    )
+    ftp = FtpClient("ftp.ncdc.noaa.gov")
+    assert ftp.stat_dir("/pub/data/noaa/2019") == {
+        "166220-99999-2019.gz": (1234, "20190101120000")
+    }
+    ftplib.FTP.mlsd.side_effect = ftplib.error_perm("500 Unknown command")
+    with pytest.raises(FtpClientException):
+        ftp.stat_dir("/pub/data/noaa/2019")
+    ftp.close()
+    ftp.clean()
+
+
+def test_download_resume(mock_ftp, mocker, tmp_path):
+    def retrbinary(cmd, callback, rest=None):
+        callback(b"1;23.0;720"[rest or 0 :])
+
+    mocker.patch("ftplib.FTP.retrbinary", side_effect=retrbinary)
+    (tmp_path / "166220-99999-2018").write_bytes(b"1;23.")
+    ftp = FtpClient("ftp.ncdc.noaa.gov", tmpdir=str(tmp_path))
+    localfile = ftp.download("/pub/data/noaa/2018/166220-99999-2018", resume=True)
+    ftp.close()
+    with open(localfile) as f:
+        assert f.read() == "1;23.0;720"
+    assert ftplib.FTP.retrbinary.call_args.kwargs["rest"] == 5
+    ftp.clean()
+    assert tmp_path.exists()  # not owned by the client
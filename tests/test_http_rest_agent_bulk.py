@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+
+# Software Name: pyngsild
+# SPDX-FileCopyrightText: Copyright (c) 2021 Orange
+# SPDX-License-Identifier: Apache 2.0
+#
+# This software is distributed under the Apache 2.0;
+# see the NOTICE file for more details.
+#
+# Author: Fabien BATTELLO <fabien.battello@orange.com> et al.
+
+import json
+import time
+
+from typing import List
+
+from fastapi.testclient import TestClient
+
+from pyngsild.agent.bg.http_rest import HttpRestAgent, RoomObserved
+from pyngsild.agent.stats import Stats
+from pyngsild.sink import Sink, SinkNull
+from pyngsild import Row
+from ngsildclient import Entity
+
+
+def process(row: Row) -> Entity:
+    room: RoomObserved = row.record
+    if room.room == 0:
+        return None
+    if room.room < 0:
+        raise ValueError("negative room number")
+    e = Entity("RoomTemperatureObserved", f"Room{room.room}")
+    e.prop("temperature", room.temperature)
+    return e
+
+
+def rooms(n: int) -> list:
+    return [
+        {"room": i + 1, "temperature": 20 + i % 5, "pressure": 710.0} for i in range(n)
+    ]
+
+
+def test_bulk_json_array():
+    agent = HttpRestAgent(SinkNull(), process=process, batch_size=4)
+    client = TestClient(agent.app)
+    items = rooms(10) + [
+        {"room": 0, "temperature": 20, "pressure": 710.0},
+        {"room": "x"},
+        {"room": -1, "temperature": 20, "pressure": 710.0},
+    ]
+    response = client.post("/rooms/bulk", json=items)
+    assert response.status_code == 200
+    job = response.json()
+    assert job["state"] == "done"
+    assert (job["total"], job["ok"], job["filtered"], job["invalid"], job["error"]) == (
+        13,
+        10,
+        1,
+        1,
+        1,
+    )
+    assert [r["status"] for r in job["results"][-3:]] == [
+        "filtered",
+        "invalid",
+        "error",
+    ]
+    assert agent.stats == Stats(12, 10, 10, 1, 1)
+    assert agent.status.calls == 1
+    assert agent.status.success == 3  # 12 valid resources, by batches of 4
+
+
+def test_bulk_empty_list():
+    def process_many(row: Row) -> List[Entity]:
+        entity = process(row)
+        return [] if entity is None else [entity]
+
+    agent = HttpRestAgent(SinkNull(), process=process_many)
+    client = TestClient(agent.app)
+    response = client.post(
+        "/rooms/bulk",
+        json=rooms(2) + [{"room": 0, "temperature": 20, "pressure": 710.0}],
+    )
+    assert response.status_code == 200
+    job = response.json()
+    assert (job["ok"], job["filtered"], job["error"]) == (2, 1, 0)
+    assert job["results"][-1]["status"] == "filtered"
+
+
+def test_bulk_ndjson():
+    agent = HttpRestAgent(SinkNull(), process=process)
+    client = TestClient(agent.app)
+    body = "\n".join(json.dumps(item) for item in rooms(100)) + "\n"
+    response = client.post(
+        "/rooms/bulk", data=body, headers={"Content-Type": "application/x-ndjson"}
+    )
+    assert response.status_code == 200
+    assert response.json()["ok"] == 100
+    assert agent.stats.output == 100
+
+
+def test_bulk_async_job():
+    agent = HttpRestAgent(SinkNull(), process=process)
+    client = TestClient(agent.app)
+    response = client.post("/rooms/bulk?wait=false", json=rooms(5))
+    assert response.status_code == 202
+    location = response.json()["location"]
+    for _ in range(50):
+        job = client.get(location).json()
+        if job["state"] == "done":
+            break
+        time.sleep(0.01)
+    assert job["ok"] == 5
+    assert client.get("/jobs/unknown").status_code == 404
+
+
+def test_bulk_bad_request():
+    agent = HttpRestAgent(SinkNull(), process=process)
+    client = TestClient(agent.app)
+    response = client.post(
+        "/rooms/bulk", data="not json", headers={"Content-Type": "application/json"}
+    )
+    assert response.status_code == 400
+    assert agent.jobs == {}
+
+
+class SinkFailing(Sink):
+    """fail to write the odd rooms"""
+
+    def write(self, msg):
+        if json.loads(msg)["id"][-1] in "13579":
+            raise IOError("write failed")
+
+
+def test_bulk_sink_error():
+    agent = HttpRestAgent(SinkFailing(), process=process)
+    client = TestClient(agent.app)
+    response = client.post("/rooms/bulk", json=rooms(4))
+    job = response.json()
+    assert (job["ok"], job["error"]) == (2, 2)
+    assert [r["status"] for r in job["results"]] == ["error", "ok", "error", "ok"]
+    assert job["results"][0]["detail"] == "write failed"
+
+
+def test_bulk_async_bad_request():
+    agent = HttpRestAgent(SinkNull(), process=process)
+    client = TestClient(agent.app)
+    response = client.post(
+        "/rooms/bulk?wait=false",
+        data="not json",
+        headers={"Content-Type": "application/json"},
+    )
+    assert response.status_code == 400
+    assert agent.jobs == {}
@@ -41,3 +41,59 @@ def test_upload_multipart():
     assert agent.stats == Stats(2, 2, 2, 0, 0)
     assert agent.status.calls == 1
     assert agent.status.success == 1
+
+
+def test_upload_stream_gzip():
+    agent = HttpUploadAgent(process=lambda row: row.record)
+    client = TestClient(agent.app)
+    file = pkg_resources.resource_stream(__name__, "data/room.txt.gz")
+    response = client.post(
+        "/uploadfile/", data={"comment": "gz"}, files={"file": ("room.txt.gz", file)}
+    )
+    assert response.status_code == 201
+    assert response.json() == {"filename": "room.txt.gz"}
+    assert agent.stats.input == 2
+    assert agent.status.success == 1
+
+
+def test_upload_stream_large():
+    lines = [f"Room{i};23.0;720" for i in range(100_000)]
+    agent = HttpUploadAgent(process=lambda row: row.record)
+    client = TestClient(agent.app)
+    response = client.post(
+        "/uploadfile/", files={"file": ("rooms.txt", "\n".join(lines).encode())}
+    )
+    assert response.status_code == 201
+    assert agent.stats.input == 100_000
+
+
+def test_upload_failed():
+    agent = HttpUploadAgent(process=lambda row: row.record)
+    client = TestClient(agent.app)
+    response = client.post(
+        "/uploadfile/", files={"file": ("room.txt.gz", b"not gzipped")}
+    )
+    assert response.status_code == 500
+    assert response.json() == {"detail": "Cannot process room.txt.gz"}
+    assert agent.status.errors == 1
+
+
+def test_upload_max_size():
+    agent = HttpUploadAgent(process=lambda row: row.record, max_size=100)
+    client = TestClient(agent.app)
+    response = client.post(
+        "/uploadfile/", files={"file": ("room.txt", b"Room1;23.0;720\n" * 100)}
+    )
+    assert response.status_code == 413
+    assert agent.status.success == 0
+
+
+def test_upload_no_file():
+    agent = HttpUploadAgent()
+    client = TestClient(agent.app)
+    response = client.post(
+        "/uploadfile/", data={"comment": "no file"}, files={"dummy": ("", b"")}
+    )
+    assert response.status_code == 422
+    response = client.post("/uploadfile/", data={"comment": "not multipart"})
+    assert response.status_code == 415
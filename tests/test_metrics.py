@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+
+# Software Name: pyngsild
+# SPDX-FileCopyrightText: Copyright (c) 2021 Orange
+# SPDX-License-Identifier: Apache 2.0
+#
+# This software is distributed under the Apache 2.0;
+# see the NOTICE file for more details.
+#
+# Author: Fabien BATTELLO <fabien.battello@orange.com> et al.
+
+from fastapi.testclient import TestClient
+
+from pyngsild.agent import Agent
+from pyngsild.agent.bg.http_rest import HttpRestAgent
+from pyngsild.agent.processor import build_sample_entity
+from pyngsild.source.moresources import SourceSample
+from pyngsild.sink import SinkNull
+from pyngsild.utils.metrics import AgentMetrics, Counter, Histogram, render
+
+
+def test_histogram_render():
+    h = Histogram("latency_seconds", "A latency", ["stage"], buckets=(0.1, 1))
+    h.observe(0.05, "source")
+    h.observe(0.5, "source")
+    h.observe(5, "source")
+    assert h.count("source") == 3
+    assert render([h]) == (
+        "# HELP latency_seconds A latency\n"
+        "# TYPE latency_seconds histogram\n"
+        'latency_seconds_bucket{stage="source",le="0.1"} 1\n'
+        'latency_seconds_bucket{stage="source",le="1"} 2\n'
+        'latency_seconds_bucket{stage="source",le="+Inf"} 3\n'
+        'latency_seconds_sum{stage="source"} 5.55\n'
+        'latency_seconds_count{stage="source"} 3\n'
+    )
+
+
+def test_counter_render():
+    c = Counter("rows", "Rows", {(("outcome", 'a"b'),): 2})
+    assert render([c]).splitlines()[-1] == 'rows_total{outcome="a\\"b"} 2'
+
+
+def test_agent_metrics():
+    metrics = AgentMetrics(sample=1)
+    agent = Agent(
+        SourceSample(count=5, delay=0), SinkNull(), build_sample_entity, metrics=metrics
+    )
+    agent.run()
+    for stage in ("source", "process", "sink"):
+        assert metrics.stage_duration.count(stage) == 5
+    assert metrics.batch_rows.count() == 1
+
+
+def test_daemon_metrics_endpoint():
+    agent = HttpRestAgent(SinkNull())
+    client = TestClient(agent.app)
+    client.post("/rooms/", json={"room": 1, "temperature": 23, "pressure": 710.0})
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    body = response.text
+    assert 'pyngsild_rows_total{outcome="input"} 1' in body
+    assert 'pyngsild_runs_total{result="success"} 1' in body
+    assert "pyngsild_queue_depth 0" in body
+    assert 'pyngsild_stage_duration_seconds_count{stage="process"} 1' in body
+
+
+def test_histogram_quantile():
+    h = Histogram("latency_seconds", "A latency", buckets=(1, 2, 4))
+    for value in (0.5, 1.5, 1.5, 3):
+        h.observe(value)
+    assert h.quantile(0.25) == 1.0
+    assert h.quantile(0.5) == 1.5
+    assert h.quantile(1) == 4.0
+    assert h.sum() == 6.5
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+
+# Software Name: pyngsild
+# SPDX-FileCopyrightText: Copyright (c) 2021 Orange
+# SPDX-License-Identifier: Apache 2.0
+#
+# This software is distributed under the Apache 2.0;
+# see the NOTICE file for more details.
+#
+# Author: Fabien BATTELLO <fabien.battello@orange.com> et al.
+
+from fastapi.testclient import TestClient
+
+from pyngsild.agent import Agent
+from pyngsild.agent.stats import Stats
+from pyngsild.agent.processor import build_sample_entity
+from pyngsild.source.moresources import SourceSample
+from pyngsild.sink.ngsi import SinkNgsi
+from pyngsild.utils.mockbroker import MockBroker
+
+ENTITY = {
+    "id": "urn:ngsi-ld:Room:1",
+    "type": "Room",
+    "temperature": {"type": "Property", "value": 23},
+}
+
+
+def test_mock_broker_entities():
+    broker = MockBroker()
+    client = TestClient(broker.app)
+    r = client.post("/ngsi-ld/v1/entities/", json=ENTITY)
+    assert r.status_code == 201
+    assert r.headers["Location"] == "/ngsi-ld/v1/entities/urn:ngsi-ld:Room:1"
+    r = client.post("/ngsi-ld/v1/entities/", json=ENTITY)
+    assert r.status_code == 409
+    assert r.json()["type"] == "https://uri.etsi.org/ngsi-ld/errors/AlreadyExists"
+    assert (
+        client.post("/ngsi-ld/v1/entities/", json={"type": "Room"}).status_code == 400
+    )
+    assert client.get("/ngsi-ld/v1/entities/urn:ngsi-ld:Room:1").json() == ENTITY
+    r = client.get("/ngsi-ld/v1/entities", params={"type": "Room", "count": "true"})
+    assert r.headers["NGSILD-Results-Count"] == "1"
+    assert client.delete("/ngsi-ld/v1/entities/urn:ngsi-ld:Room:1").status_code == 204
+    assert client.get("/ngsi-ld/v1/entities/urn:ngsi-ld:Room:1").status_code == 404
+    assert broker.stats.created == 1
+    assert broker.stats.errors == 3
+
+
+def test_mock_broker_batch_upsert():
+    broker = MockBroker()
+    client = TestClient(broker.app)
+    r = client.post("/ngsi-ld/v1/entityOperations/upsert/", json=[ENTITY])
+    assert r.status_code == 201
+    assert r.json() == ["urn:ngsi-ld:Room:1"]
+    assert (
+        client.post("/ngsi-ld/v1/entityOperations/upsert", json=[ENTITY]).status_code
+        == 204
+    )
+    r = client.post(
+        "/ngsi-ld/v1/entityOperations/upsert",
+        json=[ENTITY, {"id": "urn:ngsi-ld:Room:2"}],
+    )
+    assert r.status_code == 207
+    assert r.json()["errors"][0]["entityId"] == "urn:ngsi-ld:Room:2"
+    assert (
+        client.post("/ngsi-ld/v1/entityOperations/upsert", data="{").status_code == 400
+    )
+    assert client.get("/mock/stats").json()["entities"] == 3
+
+
+def test_mock_broker_error_injection():
+    broker = MockBroker(error_rate=1, error_status=503)
+    client = TestClient(broker.app)
+    r = client.post("/ngsi-ld/v1/entityOperations/upsert", json=[ENTITY])
+    assert r.status_code == 503
+    assert broker.stats.injected == 1
+    assert broker.entities == {}
+
+
+def test_mock_broker_sink_ngsi():
+    with MockBroker(entity_error_rate=0.5, seed=0) as broker:
+        sink = SinkNgsi(broker.host, broker.port, batch_size=10)
+        agent = Agent(SourceSample(count=20, delay=0), sink, build_sample_entity)
+        agent.run()
+        sink.close()
+    assert broker.stats.batches == 2
+    assert agent.stats.output == broker.stats.entities
+    assert agent.stats == Stats(
+        20, 20, 20 - broker.stats.injected, 0, broker.stats.injected
+    )
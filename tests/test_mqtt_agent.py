@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+
+# Software Name: pyngsild
+# SPDX-FileCopyrightText: Copyright (c) 2021 Orange
+# SPDX-License-Identifier: Apache 2.0
+#
+# This software is distributed under the Apache 2.0;
+# see the NOTICE file for more details.
+#
+# Author: Fabien BATTELLO <fabien.battello@orange.com> et al.
+
+import anyio
+import pytest
+
+from paho.mqtt.client import MQTTMessage, MQTTv5
+
+from pyngsild.agent.bg.mqtt import MqttAgent
+from pyngsild.agent.stats import Stats
+from pyngsild.source import ROW_NOT_SET as QUEUE_EOT
+from pyngsild.sink import SinkNull
+
+
+@pytest.fixture
+def mock_mqttclient(mocker):
+    mocker.patch("pyngsild.agent.bg.mqtt.MqttClient")
+
+
+def message(payload: bytes, topic: bytes = b"sensor/temperature") -> MQTTMessage:
+    msg = MQTTMessage()
+    msg.topic = topic
+    msg.payload = payload
+    return msg
+
+
+def test_mqtt_agent_batch(mock_mqttclient, mocker):
+    records = []
+    agent = MqttAgent(
+        SinkNull(),
+        process=lambda row: records.append((row.record, row.provider)),
+        batch_size=4,
+    )
+    trigger = mocker.spy(agent, "trigger")
+    for i in range(10):
+        agent._callback(message(f"{i}".encode()))
+    agent._queue.put(QUEUE_EOT)
+    anyio.run(agent._aloop)
+    assert trigger.call_count == 3  # 4 + 4 + 2 messages
+    assert records[0] == ("0", "sensor/temperature")
+    assert agent.stats == Stats(10, 0, 0, 10, 0)
+    assert agent.status.calls == 10
+
+
+def test_mqtt_agent_invalid_utf8(mock_mqttclient):
+    records = []
+    agent = MqttAgent(
+        SinkNull(), process=lambda row: records.append(row.record), batch_size=10
+    )
+    for payload in (b"1", b"\xff\xfe", b"2"):
+        agent._callback(message(payload))
+    agent._queue.put(QUEUE_EOT)
+    anyio.run(agent._aloop)
+    assert records == ["1", "2"]
+    assert agent.status.dropped == 1
+    assert agent.stats == Stats(2, 0, 0, 2, 0)
+
+
+def test_mqtt_agent_drop_new(mock_mqttclient):
+    agent = MqttAgent(SinkNull(), maxsize=2, overflow="drop_new")
+    for i in range(5):
+        agent._callback(message(f"{i}".encode()))
+    assert [agent._queue.get_nowait().record for _ in range(2)] == [b"0", b"1"]
+    assert agent.status.dropped == 3
+
+
+def test_mqtt_agent_drop_oldest(mock_mqttclient):
+    agent = MqttAgent(SinkNull(), maxsize=2, overflow="drop_oldest")
+    for i in range(5):
+        agent._callback(message(f"{i}".encode()))
+    assert [agent._queue.get_nowait().record for _ in range(2)] == [b"3", b"4"]
+    assert agent.status.dropped == 3
+
+
+def test_mqtt_agent_drop_oldest_keeps_eot(mock_mqttclient, mocker):
+    mocker.patch("pyngsild.agent.bg.ManagedDaemon.close")
+    records = []
+    agent = MqttAgent(
+        SinkNull(),
+        process=lambda row: records.append(row.record),
+        maxsize=2,
+        overflow="drop_oldest",
+    )
+    agent._callback(message(b"0"))
+    agent._callback(message(b"1"))
+    agent.close()  # evicts the oldest message to make room for the EOT
+    for i in range(2, 5):
+        agent._callback(message(f"{i}".encode()))  # cannot evict the EOT
+    anyio.run(agent._aloop)  # terminates
+    assert records == ["1"]
+    assert agent.status.dropped == 4
+
+
+def test_mqtt_agent_close_drains_queue(mock_mqttclient):
+    records = []
+    agent = MqttAgent(
+        SinkNull(),
+        process=lambda row: records.append(row.record),
+        batch_size=1000,
+        linger=30,
+    )
+    agent.run()
+    for i in range(3):
+        agent._callback(message(f"{i}".encode()))
+    agent.close()  # the batch is still waiting for the linger delay
+    assert records == ["0", "1", "2"]
+    assert agent.status.errors == 0
+
+
+def test_mqtt_agent_raw(mock_mqttclient):
+    records = []
+    agent = MqttAgent(
+        SinkNull(), process=lambda row: records.append(row.record), raw=True
+    )
+    agent._callback(message(b"\x01\x02"))
+    agent._queue.put(QUEUE_EOT)
+    anyio.run(agent._aloop)
+    assert records == [b"\x01\x02"]
+
+
+def test_mqtt_agent_shared_subscription(mocker):
+    MqttClient = mocker.patch("pyngsild.agent.bg.mqtt.MqttClient")
+    agent = MqttAgent(SinkNull(), topic="sensor/#", clients=3)
+    assert agent.topic == "$share/pyngsild/sensor/#"
+    assert len(agent._clients) == 3
+    assert MqttClient.call_count == 3
+    assert MqttClient.call_args.kwargs["protocol"] == MQTTv5
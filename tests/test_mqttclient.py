@@ -12,9 +12,9 @@
 import pytest
 import logging
 
-from paho.mqtt.client import MQTTMessage, MQTTMessageInfo, MQTT_ERR_SUCCESS
+from paho.mqtt.client import MQTTMessage, MQTTMessageInfo, MQTT_ERR_SUCCESS, MQTTv5
 
-from pyngsild.utils.mqttclient import MqttClient
+from pyngsild.utils.mqttclient import MqttClient, shared_topic
 
 logger = logging.getLogger(__name__)
 
@@ -76,3 +76,15 @@ def test_subscribe(mock_broker, mocker):
     mqttc.stop()
 
     assert mqttc.callback.call_count == 2
+
+
+def test_shared_topic():
+    assert shared_topic("sensor/#", "agents") == "$share/agents/sensor/#"
+    assert shared_topic(["a", "b"], "agents") == ["$share/agents/a", "$share/agents/b"]
+
+
+def test_subscribe_many(mock_broker):
+    mqttc = MqttClient(port=1883, callback=callback, protocol=MQTTv5)
+    mqttc.subscribe(["sensor/temperature", "sensor/pressure"])
+    mqttc.stop()
+    assert mqttc._client.subscribe.call_count == 2
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+
+# Software Name: pyngsild
+# SPDX-FileCopyrightText: Copyright (c) 2021 Orange
+# SPDX-License-Identifier: Apache 2.0
+#
+# This software is distributed under the Apache 2.0;
+# see the NOTICE file for more details.
+#
+# Author: Fabien BATTELLO <fabien.battello@orange.com> et al.
+
+import json
+import time
+import threading
+import pytest
+
+from datetime import timedelta
+
+from pyngsild.source.moresources import SourceSample
+from pyngsild.sink import SinkException, settle
+from pyngsild.sink.ngsi import SinkNgsi, SinkNgsiAsync
+from pyngsild.agent import Agent
+from pyngsild.agent.stats import Stats
+from pyngsild.agent.processor import build_sample_entity
+
+
+@pytest.fixture
+def mock_client(mocker):
+    client = mocker.patch("pyngsild.sink.ngsi.Client").return_value
+    client.batch.url = "http://localhost:1026/ngsi-ld/v1/entityOperations"
+    client.session.post.return_value.status_code = 201
+    return client
+
+
+def posted_batches(client) -> list:
+    return [json.loads(c.kwargs["data"]) for c in client.session.post.call_args_list]
+
+
+def test_sink_no_batch(mock_client):
+    sink = SinkNgsi()
+    agent = Agent(SourceSample(count=5, delay=0), sink, build_sample_entity)
+    agent.run()
+    assert mock_client.upsert.call_count == 5
+    assert mock_client.session.post.call_count == 0
+    assert agent.stats == Stats(5, 5, 5, 0, 0)
+
+
+def test_sink_batch_size(mock_client):
+    sink = SinkNgsi(batch_size=2)
+    agent = Agent(SourceSample(count=5, delay=0), sink, build_sample_entity)
+    agent.run()
+    assert mock_client.upsert.call_count == 0
+    assert [len(batch) for batch in posted_batches(mock_client)] == [2, 2, 1]
+    assert agent.stats == Stats(5, 5, 5, 0, 0)
+
+
+def test_sink_batch_bytes(mock_client):
+    sink = SinkNgsi(batch_size=100, batch_bytes=600)
+    agent = Agent(SourceSample(count=5, delay=0), sink, build_sample_entity)
+    agent.run()
+    bodies = [c.kwargs["data"] for c in mock_client.session.post.call_args_list]
+    assert len(bodies) > 1
+    assert all(len(body) <= 600 for body in bodies)
+    assert sum(len(batch) for batch in posted_batches(mock_client)) == 5
+
+
+def test_sink_batch_linger(mock_client):
+    sink = SinkNgsi(batch_size=100, linger=0.05)
+    sink.write(build_sample_entity(SourceSample(count=1, delay=0).first()))
+    assert mock_client.session.post.call_count == 0
+    time.sleep(0.2)
+    assert mock_client.session.post.call_count == 1
+
+
+def test_sink_batch_partial_errors(mock_client):
+    response = mock_client.session.post.return_value
+    response.status_code = 207
+    response.json.return_value = {
+        "success": ["urn:ngsi-ld:RoomTemperatureObserved:Room1"],
+        "errors": [
+            {
+                "entityId": "urn:ngsi-ld:RoomTemperatureObserved:Room2",
+                "error": {"type": "https://uri.etsi.org/ngsi-ld/errors/BadRequestData"},
+            }
+        ],
+    }
+    sink = SinkNgsi(batch_size=10)
+    agent = Agent(SourceSample(count=2, delay=0), sink, build_sample_entity)
+    agent.run()
+    assert agent.stats == Stats(2, 2, 1, 0, 1)
+
+
+def test_sink_batch_failed(mock_client):
+    mock_client.session.post.return_value.status_code = 500
+    sink = SinkNgsi(batch_size=10)
+    agent = Agent(SourceSample(count=3, delay=0), sink, build_sample_entity)
+    agent.run()
+    assert agent.stats == Stats(3, 3, 0, 0, 3)
+
+
+def test_sink_batch_errors_charged_to_writer(mock_client):
+    response = mock_client.session.post.return_value
+    response.status_code = 207
+    response.json.return_value = {
+        "success": ["urn:ngsi-ld:RoomTemperatureObserved:Room2"],
+        "errors": [
+            {"entityId": "urn:ngsi-ld:RoomTemperatureObserved:Room1", "error": {}}
+        ],
+    }
+    sink = SinkNgsi(batch_size=10, linger=0.05)
+    src = SourceSample(count=2, delay=0)
+    first, second = [build_sample_entity(row) for row in src]
+    stats1, stats2 = Stats(1, 1, 1), Stats(1, 1, 1)
+
+    def write(stats, entity):  # agents sharing the sink run in their own thread
+        sink.bind(stats)
+        sink.write(entity)
+
+    for stats, entity in ((stats1, first), (stats2, second)):
+        thread = threading.Thread(target=write, args=(stats, entity))
+        thread.start()
+        thread.join()
+    time.sleep(0.2)  # the batch is sent by the linger timer
+    assert mock_client.session.post.call_count == 1
+    settle(stats1)
+    settle(stats2)
+    assert stats1 == Stats(1, 1, 0, 0, 1)
+    assert stats2 == Stats(1, 1, 1, 0, 0)
+
+
+def test_sink_async(mock_client):
+    sink = SinkNgsiAsync(workers=2)
+    agent = Agent(SourceSample(count=5, delay=0), sink, build_sample_entity)
+    agent.run()
+    assert mock_client.upsert.call_count == 5
+    assert sink.pending == 0
+    assert sink.completed == 5
+    assert agent.stats == Stats(5, 5, 5, 0, 0)
+    sink.close()
+
+
+def test_sink_async_errors(mock_client):
+    mock_client.upsert.side_effect = Exception("broker error")
+    sink = SinkNgsiAsync(workers=2)
+    agent = Agent(SourceSample(count=5, delay=0), sink, build_sample_entity)
+    agent.run()
+    assert sink.failed == 5
+    assert agent.stats == Stats(5, 5, 0, 0, 5)
+    sink.close()
+
+
+def test_sink_async_shed(mock_client):
+    release = threading.Event()
+    mock_client.upsert.side_effect = lambda _: release.wait()
+    sink = SinkNgsiAsync(workers=2, max_pending=2, block=False)
+    entity = build_sample_entity(SourceSample(count=1, delay=0).first())
+    sink.write(entity)
+    sink.write(entity)
+    with pytest.raises(SinkException):
+        sink.write(entity)
+    assert sink.pending == 2
+    release.set()
+    sink.flush()
+    assert sink.pending == 0
+    assert sink.status == {
+        "state": "up",
+        "pending": 0,
+        "completed": 2,
+        "failed": 0,
+        "shed": 1,
+    }
+    sink.close()
+
+
+def test_sink_broker_metrics(mock_client, mocker):
+    sink = SinkNgsi(batch_size=10)
+    observe = mock_client.session.hooks["response"].append.call_args.args[0]
+    response = mocker.Mock(status_code=207, elapsed=timedelta(milliseconds=12))
+    response.request.method = "POST"
+    observe(response)
+    assert sink.requests.count("POST", "207") == 1
+    agent = Agent(SourceSample(count=3, delay=0), sink, build_sample_entity)
+    agent.run()
+    assert sink.batches.count() == 1
@@ -10,12 +10,15 @@
 # Author: Fabien BATTELLO <fabien.battello@orange.com> et al.
 
 from fastapi import requests
+import io
+import gzip
 import pkg_resources
 
 from typing import List
 
-from pyngsild.source import Row, Source
-from pyngsild.source.moresources import SourceJson
+from pyngsild.constants import RowFormat
+from pyngsild.source import Row, Source, SourceStream
+from pyngsild.source.moresources import SourceJson, SourceJsonStream, SourceNdjson
 
 
 def test_source_json():
@@ -75,3 +78,89 @@ def test_source_json_from_file_compressed():
     assert rows[0].record["firstName"] == "Krish"
     assert rows[4].provider == "users_sample.json.gz"
     assert rows[4].record["firstName"] == "jone"
+
+
+def test_source_json_stream():
+    content = r"""{"meta": {"title": "fruits [\"]{", "tags": [{"a": [1, 2]}, "}"]}, "count": 123,
+    "dataset": {"data": [ {"fruit": "Apple", "size": "Large", "weight": 1.5e2},
+    {"fruit": "Lime", "size": "Medium", "weight": 75} ] } }"""
+    src = SourceJsonStream(io.StringIO(content), path="dataset.data", chunksize=7)
+    rows: List[Row] = [x for x in src]
+    assert len(rows) == 2
+    assert rows[0].provider == "user"
+    assert rows[0].record == {"fruit": "Apple", "size": "Large", "weight": 150.0}
+    assert rows[1].record == {"fruit": "Lime", "size": "Medium", "weight": 75}
+
+
+def test_source_json_stream_single():
+    content = r"""{"fruit": "Apple", "size": "Large", "color": "Red"}"""
+    src = SourceJsonStream(io.StringIO(content), chunksize=4)
+    rows: List[Row] = [x for x in src]
+    assert len(rows) == 1
+    assert rows[0].record["fruit"] == "Apple"
+
+
+def test_source_json_stream_array():
+    content = "[1, 22, 333, 4444]"
+    src = SourceJsonStream(io.StringIO(content), chunksize=3)
+    assert [x.record for x in src] == [1, 22, 333, 4444]
+
+
+def test_source_json_stream_from_file(mocker):
+    mocker.patch.object(Source, "stream_threshold", 0)
+    for sample in ("users_sample.json", "users_sample.json.gz"):
+        filename = pkg_resources.resource_filename(__name__, f"data/{sample}")
+        src = Source.from_file(filename, path="users")
+        assert isinstance(src, SourceJsonStream)
+        rows: List[Row] = [x for x in src]
+        assert len(rows) == 5
+        assert rows[0].provider == sample
+        assert rows[0].record["firstName"] == "Krish"
+        assert rows[4].record["firstName"] == "jone"
+
+
+def test_source_json_stream_threshold_uncompressed(mocker):
+    filename = pkg_resources.resource_filename(__name__, "data/users_sample.json.gz")
+    size = len(gzip.open(filename).read())
+    mocker.patch.object(
+        Source, "stream_threshold", size - 1
+    )  # above the compressed size
+    assert isinstance(Source.from_file(filename, path="users"), SourceJsonStream)
+    with open(filename, "rb") as fp:
+        assert isinstance(
+            Source.from_file(filename, fp=fp, path="users"), SourceJsonStream
+        )
+    mocker.patch.object(Source, "stream_threshold", size)
+    with open(filename, "rb") as fp:
+        src = Source.from_file(filename, fp=fp, path="users")
+        assert isinstance(src, SourceJson)
+        assert len(list(src)) == 5  # the position of fp has been restored
+
+
+def test_source_ndjson():
+    content = '{"fruit": "Apple"}\n\n  \n{"fruit": "Lime"\n{"fruit": "Lemon"}\n'
+    src = SourceNdjson(io.StringIO(content), chunksize=8)
+    rows: List[Row] = [x for x in src]
+    assert [x.record["fruit"] for x in rows] == ["Apple", "Lemon"]
+    assert src.blank == 2
+    assert src.invalid == 1
+
+
+def test_source_ndjson_from_stream():
+    src = SourceStream(
+        ['{"fruit": "Apple"}', '{"fruit": "Lime"}'], fmt=RowFormat.NDJSON
+    )
+    rows: List[Row] = [x for x in src]
+    assert rows == [Row({"fruit": "Apple"}, "user"), Row({"fruit": "Lime"}, "user")]
+
+
+def test_source_ndjson_from_file():
+    filename = pkg_resources.resource_filename(__name__, "data/room.jsonl")
+    src = Source.from_file(filename)
+    assert isinstance(src, SourceNdjson)
+    rows: List[Row] = [x for x in src]
+    assert len(rows) == 3
+    assert rows[0].provider == "room.jsonl"
+    assert [x.record["room"] for x in rows] == ["Room1", "Room2", "Room4"]
+    assert src.blank == 1
+    assert src.invalid == 1
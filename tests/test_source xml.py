@@ -9,12 +9,13 @@
 #
 # Author: Fabien BATTELLO <fabien.battello@orange.com> et al.
 
+import io
 import pkg_resources
 
 from typing import List
 
 from pyngsild.source import Row, Source
-from pyngsild.source.moresources import SourceXml
+from pyngsild.source.moresources import SourceXml, SourceXmlStream
 
 
 def test_source_xml():
@@ -48,3 +49,39 @@ def test_source_xml_from_file_compressed():
     assert rows[0].record["Genre"] == "Computer"
     assert rows[1].provider == "books.xml.gz"
     assert rows[1].record["Genre"] == "Fantasy"
+
+
+def test_source_xml_stream():
+    filename = pkg_resources.resource_filename(__name__, "data/books.xml")
+    with open(filename) as f:
+        expected = [x.record for x in SourceXml(f.read(), path="Catalog.Book")]
+    with open(filename, "rb") as f:
+        rows: List[Row] = [x for x in SourceXmlStream(f, path="Catalog.Book")]
+    assert len(rows) == 2
+    assert [x.record for x in rows] == expected
+    assert rows[0].record["@id"] == "bk101"
+
+
+def test_source_xml_stream_same_as_xmltodict():
+    content = (
+        '<r xmlns:g="http://x"><skip><a>no</a></skip>'
+        '<a id="1">t1<b>x</b>tail <b>y</b><c/></a><a>plain</a><a id="2"/>'
+        '<g:z g:k="v">q</g:z></r>'
+    )
+    for path in (None, "r.a", "r.g:z", "r.skip.a"):
+        expected = [x.record for x in SourceXml(content, path=path)]
+        assert [
+            x.record for x in SourceXmlStream(io.StringIO(content), path=path)
+        ] == expected
+
+
+def test_source_xml_stream_from_file_compressed(mocker):
+    mocker.patch.object(Source, "stream_threshold", 0)
+    filename = pkg_resources.resource_filename(__name__, "data/books.xml.gz")
+    src = Source.from_file(filename, path="Catalog.Book")
+    assert isinstance(src, SourceXmlStream)
+    rows: List[Row] = [x for x in src]
+    assert len(rows) == 2
+    assert rows[0].provider == "books.xml.gz"
+    assert rows[0].record["Genre"] == "Computer"
+    assert rows[1].record["Genre"] == "Fantasy"
@@ -130,3 +130,42 @@ def test_source_file_zip():
     src = Source.from_file(zipname)
     rows: List[Row] = [x for x in src]
     assert rows == [Row("input5", "test.txt.zip"), Row("input6", "test.txt.zip")]
+
+
+def write_files(tmp_path, count: int) -> str:
+    for i in range(count):
+        (tmp_path / f"day{i:02}.txt").write_text(f"day{i:02};line1\nday{i:02};line2\n")
+    return str(tmp_path / "*.txt")
+
+
+def test_source_glob_lazy(tmp_path, mocker):
+    pattern = write_files(tmp_path, 3)
+    from_file = mocker.spy(Source, "from_file")
+    src = Source.from_glob(pattern)
+    assert from_file.call_count == 0  # nothing opened yet
+    it = iter(src)
+    assert next(it) == Row("day00;line1", "day00.txt")
+    assert from_file.call_count == 1
+    rows = [next(it)] + [*it]
+    assert len(rows) == 5
+    assert rows[-1] == Row("day02;line2", "day02.txt")
+
+
+def test_source_glob_parallel(tmp_path):
+    pattern = write_files(tmp_path, 20)
+    rows = [*Source.from_glob(pattern, workers=4)]
+    assert rows == [*Source.from_glob(pattern)]  # ordered by default
+    assert Row("day13;line2", "day13.txt") in rows
+
+
+def test_source_glob_parallel_unordered(tmp_path):
+    pattern = write_files(tmp_path, 20)
+    rows = [*Source.from_glob(pattern, workers=4, ordered=False)]
+    assert len(rows) == 40
+    assert sorted(rows, key=lambda row: row.record) == [*Source.from_glob(pattern)]
+
+
+def test_source_glob_parallel_process(tmp_path):
+    pattern = write_files(tmp_path, 4)
+    rows = [*Source.from_glob(pattern, workers=2, executor="process")]
+    assert rows == [*Source.from_glob(pattern)]
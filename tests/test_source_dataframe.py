@@ -9,9 +9,18 @@
 #
 # Author: Fabien BATTELLO <fabien.battello@orange.com> et al.
 
+import numpy as np
 import pandas as pd
+import pkg_resources
 
+from typing import List
+from ngsildclient import Entity
+
+from pyngsild.source import Row
 from pyngsild.source.moresources import SourceDataFrame
+from pyngsild.sink import SinkNull
+from pyngsild.agent import Agent
+from pyngsild.agent.stats import Stats
 
 
 def test_source():
@@ -33,3 +42,70 @@ def test_source():
     assert rows[2].record.Index == 2
     assert rows[2].record.calories == 390
     assert rows[2].record.duration == 45
+
+
+def test_source_chunks():
+    data = {"calories": [420, 380, 390], "duration": [50, 40, 45]}
+    df = pd.DataFrame(data)
+    src = SourceDataFrame(df, chunksize=2)
+    rows = [row for row in src]
+    assert len(rows) == 2
+    assert rows[0].provider == "DataFrame"
+    assert isinstance(rows[0].record, pd.DataFrame)
+    assert rows[0].record["calories"].tolist() == [420, 380]
+    assert rows[1].record["calories"].tolist() == [390]
+
+
+def test_source_chunks_columnar():
+    data = {"calories": [420, 380, 390], "duration": [50, 40, 45]}
+    df = pd.DataFrame(data)
+    src = SourceDataFrame(df, chunksize=2, columnar=True)
+    rows = [row for row in src]
+    assert len(rows) == 2
+    assert isinstance(rows[0].record["calories"], np.ndarray)
+    assert rows[0].record["Index"].tolist() == [0, 1]
+    assert rows[0].record["duration"].tolist() == [50, 40]
+    assert rows[1].record["Index"].tolist() == [2]
+
+
+def test_source_from_csv():
+    filename = pkg_resources.resource_filename(__name__, "data/room.csv")
+    src = SourceDataFrame.from_csv(
+        filename,
+        chunksize=1,
+        sep=";",
+        header=None,
+        names=["room", "temperature", "pressure"],
+    )
+    rows = [row for row in src]
+    assert len(rows) == 2
+    assert rows[0].provider == "room.csv"
+    assert rows[0].record["room"].tolist() == ["Room1"]
+    assert rows[1].record["room"].tolist() == ["Room2"]
+
+
+def test_agent_vectorised():
+    def build_entities(row: Row) -> List[Entity]:
+        chunk = row.record
+        temperatures = chunk["temperature"] * 1.8 + 32  # vectorised computation
+        entities = []
+        for room, temperature in zip(chunk["room"], temperatures):
+            e = Entity("RoomTemperatureObserved", room)
+            e.prop("temperature", float(temperature), unitcode="FAH")
+            entities.append(e)
+        return entities
+
+    df = pd.DataFrame(
+        {
+            "room": [f"Room{i}" for i in range(5)],
+            "temperature": [20.0, 21.0, 22.0, 23.0, 24.0],
+        }
+    )
+    src = SourceDataFrame(df, chunksize=2, columnar=True)
+    sink = SinkNull()
+    written = []
+    sink.write = written.append
+    agent = Agent(src, sink, build_entities)
+    agent.run()
+    assert len(written) == 5
+    assert agent.stats == Stats(3, 5, 5, 0, 0)
@@ -9,14 +9,21 @@
 #
 # Author: Fabien BATTELLO <fabien.battello@orange.com> et al.
 
+import io
+import json
+import ftplib
+import gzip
 import pytest
 import re
 import logging
+import zipfile
 
 
 from os.path import basename, join
 
-from pyngsild.source.sourceftp import SourceFtp
+from pyngsild.ftpclient import FtpClient, FtpClientException
+from pyngsild.source import Row, Source
+from pyngsild.source.sourceftp import SourceFtp, FtpManifest
 
 logger = logging.getLogger(__name__)
 
@@ -77,7 +84,7 @@ def test_retrieve_all_files(mock_ftp, mock_tempfile, mock_ftpclient):
 
 
 def test_retrieve_some_files(mock_ftp, mock_tempfile, mock_ftpclient):
-    pattern = fr".*/{166220}-\d{{5}}-\d{{4}}.gz$"
+    pattern = rf".*/{166220}-\d{{5}}-\d{{4}}.gz$"
     prog = re.compile(pattern)
     src = SourceFtp(
         "ftp.ncdc.noaa.gov", paths=["/pub/data/noaa"], f_match=lambda x: prog.match(x)
@@ -91,3 +98,194 @@ def test_retrieve_some_files(mock_ftp, mock_tempfile, mock_ftpclient):
         "/tmp/166220-99999-2019.gz",
         "/pub/data/noaa/2019/166220-99999-2019.gz",
     ) in src.downloaded_files
+
+
+def test_pipelined_downloads(mock_ftp, mocker, tmp_path):
+    def download(remote):
+        local = tmp_path / basename(remote)
+        local.write_text(f"{basename(remote)};line1\n{basename(remote)};line2\n")
+        return str(local)
+
+    mocker.patch(
+        "pyngsild.ftpclient.FtpClient.retrieve_filelist",
+        side_effect=mocked_retrieve_filelist,
+    )
+    mocker.patch("pyngsild.ftpclient.FtpClient.download", side_effect=download)
+    src = SourceFtp(
+        "ftp.ncdc.noaa.gov",
+        paths=["/pub/data/noaa"],
+        f_match=lambda x: x.endswith("2019.gz"),
+        source_factory=lambda filename, provider: Source.from_stream(
+            open(filename), provider
+        ),
+        workers=2,
+    )
+    assert src.downloaded_files == []  # nothing downloaded at init time
+    rows = [row for row in src]
+    assert len(rows) == 6
+    assert Row("166240-99999-2019.gz;line2", "user") in rows
+    assert len(src.downloaded_files) == 3
+    assert list(tmp_path.iterdir()) == []  # files are deleted once consumed
+
+
+def test_streamed_files(mock_ftp, mock_tempfile, mocker):
+    mocker.patch(
+        "pyngsild.ftpclient.FtpClient.retrieve_filelist",
+        side_effect=mocked_retrieve_filelist,
+    )
+    mocker.patch("pyngsild.ftpclient.FtpClient.download")
+    mocker.patch(
+        "pyngsild.ftpclient.FtpClient.open",
+        side_effect=lambda remote: io.BytesIO(
+            gzip.compress(f"{basename(remote)}\n".encode())
+        ),
+    )
+    src = SourceFtp(
+        "ftp.ncdc.noaa.gov",
+        paths=["/pub/data/noaa"],
+        f_match=lambda x: "166220" in x,
+        stream=True,
+    )
+    rows = [row for row in src]
+    assert rows == [
+        Row("166220-99999-2018.gz", "166220-99999-2018.gz"),
+        Row("166220-99999-2019.gz", "166220-99999-2019.gz"),
+    ]
+    assert FtpClient.download.call_count == 0
+
+
+def test_streamed_zip_downloaded(mock_ftp, mocker, tmp_path):
+    def download(remote):
+        local = tmp_path / basename(remote)
+        with zipfile.ZipFile(local, "w") as z:
+            z.writestr("data.csv", f"{basename(remote)}\n")
+        return str(local)
+
+    mocker.patch(
+        "pyngsild.ftpclient.FtpClient.retrieve_filelist",
+        side_effect=lambda _: [
+            "/pub/data/noaa/2019/166220-99999-2019.gz",
+            "/pub/data/noaa/2019/166240-99999-2019.zip",
+        ],
+    )
+    mocker.patch("pyngsild.ftpclient.FtpClient.download", side_effect=download)
+    mocker.patch(
+        "pyngsild.ftpclient.FtpClient.open",
+        side_effect=lambda remote: io.BytesIO(
+            gzip.compress(f"{basename(remote)}\n".encode())
+        ),
+    )
+    src = SourceFtp(
+        "ftp.ncdc.noaa.gov",
+        paths=["/pub/data/noaa"],
+        f_match=lambda x: True,
+        stream=True,
+    )
+    assert [row.record for row in src] == [
+        "166220-99999-2019.gz",
+        "166240-99999-2019.zip",
+    ]
+    assert FtpClient.open.call_count == 1
+    assert list(tmp_path.iterdir()) == []  # the archive is deleted once consumed
+
+
+def test_manifest_only_new_files(mock_ftp, mocker, tmp_path):
+    def download(remote):
+        local = tmp_path / basename(remote)
+        local.write_text(f"{basename(remote)};line1\n")
+        return str(local)
+
+    filelist = ["/pub/data/noaa/2019/166220-99999-2019.gz"]
+    stats = {"/pub/data/noaa/2019/166220-99999-2019.gz": (100, "20190101000000")}
+    mocker.patch(
+        "pyngsild.ftpclient.FtpClient.retrieve_filelist", side_effect=lambda _: filelist
+    )
+    mocker.patch(
+        "pyngsild.ftpclient.FtpClient.stat_dir",
+        side_effect=FtpClientException("MLSD not supported"),
+    )
+    mocker.patch(
+        "pyngsild.ftpclient.FtpClient.stat", side_effect=lambda remote: stats[remote]
+    )
+    mocked = mocker.patch("pyngsild.ftpclient.FtpClient.download", side_effect=download)
+    manifest = str(tmp_path / "manifest.json")
+
+    def poll():
+        src = SourceFtp(
+            "ftp.ncdc.noaa.gov",
+            paths=["/pub/data/noaa"],
+            f_match=lambda x: True,
+            source_factory=lambda filename, provider: Source.from_stream(
+                open(filename), provider
+            ),
+            manifest=manifest,
+            workdir=str(tmp_path / "work"),
+        )
+        return [row.record for row in src]
+
+    assert poll() == ["166220-99999-2019.gz;line1"]
+    assert poll() == []  # already processed
+    assert mocked.call_count == 1
+
+    filelist.append("/pub/data/noaa/2019/166240-99999-2019.gz")
+    stats["/pub/data/noaa/2019/166240-99999-2019.gz"] = (200, "20190101000000")
+    assert poll() == ["166240-99999-2019.gz;line1"]  # only the new file
+    assert mocked.call_count == 2
+
+    stats["/pub/data/noaa/2019/166220-99999-2019.gz"] = (100, "20200101000000")
+    assert poll() == []  # touched but same content
+    assert mocked.call_count == 3
+    with open(manifest) as f:
+        entries = json.load(f)
+    assert entries["/pub/data/noaa/2019/166220-99999-2019.gz"]["complete"]
+    assert (
+        entries["/pub/data/noaa/2019/166220-99999-2019.gz"]["mtime"] == "20200101000000"
+    )
+
+
+def test_manifest_mlsd(mock_ftp, mocker, tmp_path):
+    def download(remote):
+        local = tmp_path / basename(remote)
+        local.write_text(f"{basename(remote)};line1\n")
+        return str(local)
+
+    def mlsd(path, facts):
+        facts = {"type": "file", "size": "100", "modify": "20190101000000"}
+        return [
+            (f"{usaf}-99999-{basename(path)}.gz", facts)
+            for usaf in ("166220", "166240", "166270")
+        ]
+
+    mocker.patch(
+        "pyngsild.ftpclient.FtpClient.retrieve_filelist",
+        side_effect=mocked_retrieve_filelist,
+    )
+    mocker.patch("ftplib.FTP.mlsd", side_effect=mlsd)
+    mocker.patch("pyngsild.ftpclient.FtpClient.stat")
+    mocker.patch("pyngsild.ftpclient.FtpClient.download", side_effect=download)
+    save = mocker.spy(FtpManifest, "_save")
+    src = SourceFtp(
+        "ftp.ncdc.noaa.gov",
+        paths=["/pub/data/noaa"],
+        f_match=lambda x: True,
+        source_factory=lambda filename, provider: Source.from_stream(
+            open(filename), provider
+        ),
+        manifest=str(tmp_path / "manifest.json"),
+        workdir=str(tmp_path / "work"),
+    )
+    assert len(list(src)) == 6
+    assert ftplib.FTP.mlsd.call_count == 2  # one listing per folder
+    assert FtpClient.stat.call_count == 0
+    assert save.call_count == 2  # once downloaded, then once processed
+    assert src.filestats["/pub/data/noaa/2018/166240-99999-2018.gz"] == (
+        100,
+        "20190101000000",
+    )
+
+
+def test_resume_requires_workdir(mock_ftp, mock_tempfile, tmp_path):
+    with pytest.raises(ValueError):
+        SourceFtp(
+            "ftp.ncdc.noaa.gov", manifest=str(tmp_path / "manifest.json"), resume=True
+        )
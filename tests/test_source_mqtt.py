@@ -13,7 +13,7 @@ import pytest
 import threading
 
 from pyngsild.source.sourcemqtt import SourceMqtt
-from pyngsild.source import Row
+from pyngsild.source import Row, ROW_NOT_SET as QUEUE_EOT
 
 
 @pytest.fixture
@@ -23,12 +23,13 @@ def mock_mqttclient(mocker):
 
 def publisher(src: SourceMqtt):
     for temp in range(5):
-        src._queue.put(Row("sensor/temperature", temp))
+        src._queue.put(Row(f"{temp}".encode(), "sensor/temperature"))
         # time.sleep(1)
 
 
 def subscriber(src: SourceMqtt):
     for x in src:
+        assert x.provider == "sensor/temperature"
         src.counter += 1
         print(x)
 
@@ -47,3 +48,12 @@ def test_receive(mock_mqttclient):
     sub.join()
 
     assert src.counter == 5
+
+
+def test_receive_invalid_utf8(mock_mqttclient):
+    src = SourceMqtt(topic="sensor/temperature")
+    for payload in (b"1", b"\xff\xfe", b"2"):
+        src._queue.put(Row(payload, "sensor/temperature"))
+    src._queue.put(QUEUE_EOT)
+    assert [row.record for row in src] == ["1", "2"]
+    assert src.dropped == 1
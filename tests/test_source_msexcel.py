@@ -9,6 +9,7 @@
 #
 # Author: Fabien BATTELLO <fabien.battello@orange.com> et al.
 
+import gzip
 import pkg_resources
 
 from pyngsild.source.moresources import SourceMicrosoftExcel
@@ -59,3 +60,29 @@ def test_source_with_sheetid():
     assert rows[1].record == "SH2HDR2;;;"
     assert rows[2].record == "data1;21;22;23"
     assert rows[3].record == "data2;24;25;26"
+
+
+def test_source_as_tuples():
+    filename = pkg_resources.resource_filename(__name__, "data/test.xlsx")
+    src = SourceMicrosoftExcel(filename, ignore=1, fmt="tuple")
+    rows = [row for row in src]
+    assert len(rows) == 3
+    assert rows[0].record == ("SH1HDR2", None, None, None)
+    assert rows[1].record == ("data1", 11, 12, 13)
+
+
+def test_source_as_dicts():
+    filename = pkg_resources.resource_filename(__name__, "data/test.xlsx")
+    src = SourceMicrosoftExcel(filename, ignore=1, fmt="dict")
+    rows = [row for row in src]
+    assert len(rows) == 2
+    assert rows[0].record == {"SH1HDR2": "data1", "B": 11, "C": 12, "D": 13}
+    assert rows[1].record == {"SH1HDR2": "data2", "B": 14, "C": 15, "D": 16}
+
+
+def test_source_compressed_stream():
+    with gzip.open(pkg_resources.resource_filename(__name__, "data/test.xlsx.gz")) as f:
+        src = SourceMicrosoftExcel(f, sheetid=1, fmt="tuple")
+        rows = [row for row in src]
+    assert len(rows) == 4
+    assert rows[3].record == ("data2", 24, 25, 26)
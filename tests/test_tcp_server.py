@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+
+# Software Name: pyngsild
+# SPDX-FileCopyrightText: Copyright (c) 2021 Orange
+# SPDX-License-Identifier: Apache 2.0
+#
+# This software is distributed under the Apache 2.0;
+# see the NOTICE file for more details.
+#
+# Author: Fabien BATTELLO <fabien.battello@orange.com> et al.
+
+import socket
+import threading
+import time
+
+import pytest
+
+from pyngsild.agent.bg.tcp import TcpServer
+from pyngsild.agent.stats import Stats
+from pyngsild.sink import SinkNull
+
+
+@pytest.fixture
+def server():
+    records = []
+    server = TcpServer(
+        port=0,
+        sink=SinkNull(),
+        process=lambda row: records.append(row),
+        batch_size=100,
+        linger=0.05,
+        max_line=64,
+    )
+    server.records = records
+    server._thread = threading.Thread(target=server.loop)
+    server._thread.start()
+    server._ready.wait()
+    yield server
+    server._stop()
+
+
+def test_tcp_lines(server, mocker):
+    trigger = mocker.spy(server, "trigger")
+    with socket.create_connection((server.host, server.port)) as sock:
+        sock.sendall(b"$GPGGA,1\r\n$GPGGA,2\n\n$GPGGA,3\n")
+        time.sleep(0.3)
+        assert server.status.connections == 1
+    time.sleep(0.1)
+    assert [row.record for row in server.records] == [
+        "$GPGGA,1",
+        "$GPGGA,2",
+        "$GPGGA,3",
+    ]
+    assert server.records[0].provider.startswith("tcp://127.0.0.1:")
+    assert trigger.call_count == 1
+    assert server.stats == Stats(3, 0, 0, 3, 0)
+    assert server.status.connections == 0
+    assert server.status.total_connections == 1
+
+
+def test_tcp_dropped(server):
+    with socket.create_connection((server.host, server.port)) as sock:
+        sock.sendall(b"x" * 100 + b"\n\xff\xfe\nlast")
+    time.sleep(0.3)
+    assert [row.record for row in server.records] == ["last"]
+    assert server.status.dropped == 2
+
+
+def test_tcp_long_line_across_reads(server):
+    with socket.create_connection((server.host, server.port)) as sock:
+        sock.sendall(b"first\n" + b"x" * 100)
+        time.sleep(0.1)  # the line too long is split over several reads
+        sock.sendall(b"y" * 100)
+        time.sleep(0.1)
+        sock.sendall(b"z" * 10 + b"\nlast\n")
+    time.sleep(0.3)
+    assert [row.record for row in server.records] == ["first", "last"]
+    assert server.status.dropped == 1
+
+
+def test_tcp_close_flushes_pending_lines():
+    records = []
+    server = TcpServer(
+        port=0,
+        sink=SinkNull(),
+        process=lambda row: records.append(row.record),
+        batch_size=1000,
+        linger=30,
+    )
+    server.run()
+    with socket.create_connection((server.host, server.port)) as sock:
+        sock.sendall(b"$GPGGA,1\n$GPGGA,2\n")
+        time.sleep(0.2)
+        server.close()  # the partial batch is still waiting for the linger delay
+    assert records == ["$GPGGA,1", "$GPGGA,2"]
+    assert (server.status.errors, server.status.pending) == (0, 0)
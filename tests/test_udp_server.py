@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+
+# Software Name: pyngsild
+# SPDX-FileCopyrightText: Copyright (c) 2021 Orange
+# SPDX-License-Identifier: Apache 2.0
+#
+# This software is distributed under the Apache 2.0;
+# see the NOTICE file for more details.
+#
+# Author: Fabien BATTELLO <fabien.battello@orange.com> et al.
+
+import socket
+import threading
+import time
+
+import pytest
+
+from pyngsild.agent.bg.udp import UdpServer, EOT
+from pyngsild.agent.stats import Stats
+from pyngsild.sink import SinkNull
+
+
+def send(port: int, *packets: bytes):
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        for packet in packets:
+            sock.sendto(packet, ("127.0.0.1", port))
+
+
+def test_udp_batch(mocker):
+    records = []
+    server = UdpServer(
+        port=0,
+        sink=SinkNull(),
+        process=lambda row: records.append(row.record),
+        batch_size=100,
+    )
+    trigger = mocker.spy(server, "trigger")
+    sock = server._bind()
+    port = sock.getsockname()[1]
+    send(port, *[f"!AIVDM,{i}".encode() for i in range(10)], EOT)
+    thread = threading.Thread(target=server.loop, args=[sock])
+    thread.start()
+    thread.join(5)
+    assert trigger.call_count == 1  # all pending datagrams read at once
+    assert records == [f"!AIVDM,{i}" for i in range(10)]
+    assert server.stats == Stats(10, 0, 0, 10, 0)
+    assert server.status.calls == 10
+
+
+@pytest.mark.skipif(
+    not hasattr(socket, "SO_REUSEPORT"), reason="SO_REUSEPORT not available"
+)
+def test_udp_bind_free_port():
+    server = UdpServer(port=0, sink=SinkNull(), sockets=3)
+    socks = server._bind_all()
+    assert server.port != 0
+    assert {sock.getsockname()[1] for sock in socks} == {server.port}
+    for sock in socks:
+        sock.close()
+
+
+def test_udp_dropped():
+    server = UdpServer(port=0, sink=SinkNull(), batch_size=10, max_packet=8)
+    sock = server._bind()
+    send(sock.getsockname()[1], b"$GPGGA", b"$GPGGA,123519", b"\xff\xfe")
+    packets = server._recv_batch(sock)
+    sock.close()
+    rows = server._rows(packets)
+    assert [row.record for row in rows] == ["$GPGGA"]
+    assert server.status.dropped == 2
+
+
+def test_udp_close_processes_last_batch():
+    records = []
+    server = UdpServer(
+        port=0,
+        sink=SinkNull(),
+        process=lambda row: records.append(row.record),
+        batch_size=100,
+        linger=1,
+    )
+    server.run()
+    send(server.port, b"!AIVDM,1", b"!AIVDM,2")
+    time.sleep(0.1)
+    server.close()  # the batch is still waiting for the linger delay
+    assert records == ["!AIVDM,1", "!AIVDM,2"]
+    assert server.status.errors == 0
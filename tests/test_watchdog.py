@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+
+# Software Name: pyngsild
+# SPDX-FileCopyrightText: Copyright (c) 2021 Orange
+# SPDX-License-Identifier: Apache 2.0
+#
+# This software is distributed under the Apache 2.0;
+# see the NOTICE file for more details.
+#
+# Author: Fabien BATTELLO <fabien.battello@orange.com> et al.
+
+import asyncio
+import sys
+import time
+
+import pytest
+
+from watchgod.watcher import Change
+
+from pyngsild.agent.bg.watchdog import WatchDog
+from pyngsild.sink import SinkNull
+
+
+async def watch(watchdog: WatchDog, action, delay: float = 0.5):
+    task = asyncio.create_task(watchdog._aloop())
+    await asyncio.sleep(0.1)
+    action()
+    await asyncio.sleep(delay)
+    watchdog.stop_event.set()
+    await task
+
+
+def new_watchdog(tmp_path, records: list, **kwargs) -> WatchDog:
+    return WatchDog(
+        str(tmp_path / "in"),
+        sink=SinkNull(),
+        process=lambda row: records.append(row.record),
+        **kwargs,
+    )
+
+
+@pytest.mark.skipif(sys.platform != "linux", reason="inotify is Linux only")
+def test_watchdog_inotify_record(tmp_path):
+    (tmp_path / "in").mkdir()
+    journal = str(tmp_path / "processed.txt")
+    records = []
+
+    def drop_files():
+        for i in range(5):
+            (tmp_path / "in" / f"file{i}.txt").write_text(f"file{i};line1\n")
+
+    watchdog = new_watchdog(
+        tmp_path, records, watcher="inotify", workers=2, record=journal
+    )
+    asyncio.run(watch(watchdog, drop_files))
+    assert sorted(records) == [f"file{i};line1" for i in range(5)]
+    assert watchdog.status.success == 5
+
+    # restart : only the file dropped while the watchdog was down is processed
+    (tmp_path / "in" / "late.txt").write_text("late;line1\n")
+    records.clear()
+    watchdog = new_watchdog(tmp_path, records, watcher="inotify", record=journal)
+    asyncio.run(watch(watchdog, lambda: None))
+    assert records == ["late;line1"]
+
+
+@pytest.mark.skipif(sys.platform != "linux", reason="inotify is Linux only")
+def test_watchdog_inotify_new_subdirectory(tmp_path):
+    (tmp_path / "in").mkdir()
+    records = []
+
+    def drop_files():
+        subdir = tmp_path / "in" / "2024" / "01"
+        subdir.mkdir(parents=True)
+        (subdir / "early.txt").write_text(
+            "early;line1\n"
+        )  # may be written before the watch is added
+
+    async def main():
+        task = asyncio.create_task(watchdog._aloop())
+        await asyncio.sleep(0.1)
+        drop_files()
+        await asyncio.sleep(0.3)
+        (tmp_path / "in" / "2024" / "01" / "late.txt").write_text("late;line1\n")
+        await asyncio.sleep(0.3)
+        watchdog.stop_event.set()
+        await task
+
+    watchdog = new_watchdog(tmp_path, records, watcher="inotify")
+    asyncio.run(main())
+    assert sorted(records) == ["early;line1", "late;line1"]
+
+
+def test_watchdog_poll_added_only(tmp_path, mocker):
+    (tmp_path / "in").mkdir()
+
+    async def awatch(path, stop_event):
+        yield {
+            (Change.added, "new.txt"),
+            (Change.modified, "old.txt"),
+            (Change.deleted, "gone.txt"),
+        }
+
+    mocker.patch("pyngsild.agent.bg.watchdog.awatch", awatch)
+    watchdog = new_watchdog(tmp_path, [])
+    spawn = mocker.patch.object(watchdog, "_spawn")
+    asyncio.run(watchdog._aloop())
+    spawn.assert_called_once_with("new.txt")
+
+
+def test_watchdog_close_not_started(tmp_path, mocker):
+    mocker.patch("pyngsild.agent.bg.ManagedDaemon.close")
+    watchdog = new_watchdog(tmp_path, [])
+    watchdog.close()
+    asyncio.run(watchdog._aloop())  # stops at once
+
+
+def test_watchdog_close_processes_settling_files(tmp_path, mocker):
+    (tmp_path / "in").mkdir()
+    filename = tmp_path / "in" / "new.txt"
+    filename.write_text("new;line1\n")
+
+    async def awatch(path, stop_event):
+        yield {(Change.added, str(filename))}
+        await stop_event.wait()
+
+    mocker.patch("pyngsild.agent.bg.watchdog.awatch", awatch)
+    records = []
+    watchdog = new_watchdog(tmp_path, records, settle=0.5)
+    watchdog.run()
+    time.sleep(0.2)
+    watchdog.close()  # the file has not settled yet
+    assert records == ["new;line1"]
+    assert watchdog.status.errors == 0
+
+
+def test_watchdog_settled(tmp_path):
+    (tmp_path / "in").mkdir()
+    filename = tmp_path / "in" / "growing.txt"
+    filename.write_text("line1\n")
+    watchdog = new_watchdog(tmp_path, [], settle=0.1)
+
+    async def main():
+        settled = asyncio.create_task(watchdog._settled(str(filename)))
+        await asyncio.sleep(0.05)
+        with open(filename, "a") as f:
+            f.write("line2\n")
+        await asyncio.sleep(0.05)
+        assert not settled.done()
+        return await settled
+
+    assert asyncio.run(main())
+    assert not asyncio.run(watchdog._settled(str(tmp_path / "in" / "missing.txt")))